@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+Address-to-Source Index and Listing
+A compact, address-sorted table of every assembled record (start address,
+size, source line, mnemonic, enclosing label) written as a binary sidecar
+next to the memory image (`<output>.idx`), so tools can map a PC back to the
+.asm source with one binary search instead of re-assembling. The same data
+produces a side-by-side listing (`<output>.lst`).
+
+Sidecar layout (little-endian): header '<4sHHII' (magic, version, reserved,
+record count, start address), the source path, then the columns as packed
+arrays (address u32, size u8, line u32, mnemonic u8, label u32), the
+mnemonic and label string tables and the label addresses (u32).
+"""
+
+import os
+import re
+import sys
+import struct
+from array import array
+from bisect import bisect_right
+from typing import Iterator, List, Optional, Sequence
+from isa_constants import ISA
+
+
+INDEX_MAGIC = b'AIDX'
+INDEX_VERSION = 1
+_HEADER = struct.Struct('<4sHHII')
+_LENGTH = struct.Struct('<I')
+NO_LABEL = 0xFFFFFFFF
+
+U32_TYPECODE = 'I' if array('I').itemsize == 4 else 'L'
+
+# What the log post-processor annotates: `PC=0001A`, `PC: 0x1a`, `pc 1A`
+DEFAULT_LOG_PATTERN = r'\bPC\s*[=:]?\s*(?:0x)?([0-9A-Fa-f]{1,8})\b'
+
+
+class SourceLocation:
+    """What an address belongs to"""
+    __slots__ = ('address', 'start', 'size', 'line', 'mnemonic', 'label', 'offset', 'source')
+
+    def __init__(self, address: int, start: int, size: int, line: int, mnemonic: str,
+                 label: Optional[str], offset: int, source: str):
+        self.address = address
+        self.start = start
+        self.size = size
+        self.line = line
+        self.mnemonic = mnemonic
+        self.label = label
+        self.offset = offset
+        self.source = source
+
+    def __str__(self):
+        where = f"{self.label}+{self.offset}" if self.label and self.offset else (self.label or "")
+        text = f"{self.source}:{self.line} {self.mnemonic}"
+        if self.address != self.start:
+            text += f" (word {self.address - self.start} of {self.start:05X})"
+        return f"{text} [{where}]" if where else text
+
+
+def _pack_strings(strings: Sequence[str]) -> bytes:
+    data = '\0'.join(strings).encode('utf-8')
+    return _LENGTH.pack(len(data)) + data
+
+
+def _unpack_strings(data: bytes, pos: int):
+    (length,), pos = _LENGTH.unpack_from(data, pos), pos + _LENGTH.size
+    text = data[pos:pos + length].decode('utf-8')
+    return (text.split('\0') if text else []), pos + length
+
+
+class AddressIndex:
+    """Sorted columns of one assembled program; lookup(pc) is O(log n)"""
+
+    def __init__(self, source: str = '', start_address: int = 0):
+        self.source = source
+        self.start_address = start_address
+        self.addresses = array(U32_TYPECODE)
+        self.sizes = bytearray()
+        self.lines = array(U32_TYPECODE)
+        self.mnemonic_ids = bytearray()
+        self.label_ids = array(U32_TYPECODE)
+        self.mnemonics: List[str] = []
+        self.labels: List[str] = []
+        self.label_addresses = array(U32_TYPECODE)
+
+    def __len__(self) -> int:
+        return len(self.addresses)
+
+    @classmethod
+    def from_assembler(cls, assembler, source: str = '', start_address: int = 0) -> 'AddressIndex':
+        """Index of Assembler.instructions (after optimizer passes, if any)"""
+        index = cls(source, start_address)
+        records = sorted(assembler.instructions, key=lambda instr: instr.address)
+        labels = sorted((addr, name) for name, addr in assembler.symbol_table.items()
+                        if name not in getattr(assembler, 'imports', ()))
+        index.labels = [name for _, name in labels]
+        index.label_addresses = array(U32_TYPECODE, (addr for addr, _ in labels))
+        label_addresses = index.label_addresses
+        mnemonic_ids = {}
+
+        for instr in records:
+            mnemonic = instr.mnemonic
+            if mnemonic not in mnemonic_ids:
+                mnemonic_ids[mnemonic] = len(index.mnemonics)
+                index.mnemonics.append(mnemonic)
+            label = bisect_right(label_addresses, instr.address) - 1
+            index.addresses.append(instr.address)
+            index.sizes.append(1 if mnemonic == '.DW' else ISA.INSTRUCTION_SIZES.get(mnemonic, 1))
+            index.lines.append(instr.line_num)
+            index.mnemonic_ids.append(mnemonic_ids[mnemonic])
+            index.label_ids.append(label if label >= 0 else NO_LABEL)
+        return index
+
+    # ================= LOOKUP =================
+
+    def position(self, pc: int) -> Optional[int]:
+        """Row of the record covering `pc` (a memory address), or None"""
+        address = pc - self.start_address
+        row = bisect_right(self.addresses, address) - 1
+        if row < 0 or address >= self.addresses[row] + self.sizes[row]:
+            return None
+        return row
+
+    def location(self, row: int, pc: Optional[int] = None) -> SourceLocation:
+        start = self.addresses[row]
+        label_id = self.label_ids[row]
+        if label_id == NO_LABEL:
+            label, offset = None, 0
+        else:
+            label, offset = self.labels[label_id], start - self.label_addresses[label_id]
+        return SourceLocation(start + self.start_address if pc is None else pc,
+                              start + self.start_address, self.sizes[row], self.lines[row],
+                              self.mnemonics[self.mnemonic_ids[row]], label, offset, self.source)
+
+    def lookup(self, pc: int) -> Optional[SourceLocation]:
+        row = self.position(pc)
+        return None if row is None else self.location(row, pc)
+
+    def __iter__(self) -> Iterator[SourceLocation]:
+        for row in range(len(self)):
+            yield self.location(row)
+
+    # ================= FILES =================
+
+    def save(self, path: str):
+        columns = [array(U32_TYPECODE, self.addresses), array(U32_TYPECODE, self.lines),
+                   array(U32_TYPECODE, self.label_ids), array(U32_TYPECODE, self.label_addresses)]
+        if sys.byteorder == 'big':
+            for column in columns:
+                column.byteswap()
+        addresses, lines, label_ids, label_addresses = columns
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, 0, len(self), self.start_address))
+            f.write(_pack_strings([self.source]))
+            f.write(addresses.tobytes())
+            f.write(bytes(self.sizes))
+            f.write(lines.tobytes())
+            f.write(bytes(self.mnemonic_ids))
+            f.write(label_ids.tobytes())
+            f.write(_pack_strings(self.mnemonics))
+            f.write(_pack_strings(self.labels))
+            f.write(label_addresses.tobytes())
+
+    @classmethod
+    def load(cls, path: str) -> 'AddressIndex':
+        """Read a sidecar written by save() (ValueError if it is not one)"""
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < _HEADER.size:
+            raise ValueError(f"'{path}' is not an address index")
+        magic, version, _, count, start_address = _HEADER.unpack_from(data, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"'{path}' is not an address index")
+        if version != INDEX_VERSION:
+            raise ValueError(f"'{path}' has index version {version}, expected {INDEX_VERSION}")
+
+        sources, pos = _unpack_strings(data, _HEADER.size)
+        index = cls(sources[0] if sources else '', start_address)
+
+        def column(width: int, rows: int = count):
+            nonlocal pos
+            chunk = data[pos:pos + width * rows]
+            pos += width * rows
+            if width == 1:
+                return bytearray(chunk)
+            words = array(U32_TYPECODE, chunk)
+            if sys.byteorder == 'big':
+                words.byteswap()
+            return words
+
+        index.addresses = column(4)
+        index.sizes = column(1)
+        index.lines = column(4)
+        index.mnemonic_ids = column(1)
+        index.label_ids = column(4)
+        index.mnemonics, pos = _unpack_strings(data, pos)
+        index.labels, pos = _unpack_strings(data, pos)
+        index.label_addresses = column(4, len(index.labels))
+        return index
+
+
+def index_path(output_file: str) -> str:
+    """Sidecar path for a memory image: program.mem -> program.idx"""
+    return os.path.splitext(output_file)[0] + '.idx'
+
+
+def listing(index: AddressIndex, image, source_lines: Sequence[str]) -> str:
+    """
+    Side-by-side listing: address and machine words next to every source
+    line, in source order. Lines assembling to several records (.DW lists)
+    continue on extra rows.
+    """
+    by_line = {}
+    for row in range(len(index)):
+        by_line.setdefault(index.lines[row], []).append(row)
+    out = [f"; Listing of {index.source}", f"{'Addr':>5s}  {'Code':17s} {'Line':>5s} | Source"]
+    blank = " " * 24
+    for line_num, text in enumerate(source_lines, 1):
+        text = text.rstrip('\n')
+        rows = by_line.get(line_num)
+        if not rows:
+            out.append(f"{blank} {line_num:5d} | {text}")
+            continue
+        for n, row in enumerate(sorted(rows, key=lambda r: index.addresses[r])):
+            addr = index.addresses[row]
+            words = " ".join(f"{image[a]:08X}" for a in range(addr, addr + index.sizes[row]))
+            shown = text if n == 0 else ""
+            out.append(f"{addr + index.start_address:05X}  {words:17s} {line_num:5d} | {shown}".rstrip())
+    return "\n".join(out) + "\n"
+
+
+def annotate_log(index: AddressIndex, lines, pattern: str = DEFAULT_LOG_PATTERN) -> Iterator[str]:
+    """Append the source location of the first PC mentioned on each line"""
+    regex = re.compile(pattern, re.IGNORECASE)
+    for line in lines:
+        line = line.rstrip('\n')
+        match = regex.search(line)
+        location = index.lookup(int(match.group(1), 16)) if match else None
+        yield f"{line}    ; {location}" if location is not None else line
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="address_index",
+        description="Look up PCs in an address index (assembler.py --index) or annotate a log with them"
+    )
+    parser.add_argument('index_file', type=str, help='Address index sidecar (.idx)')
+    parser.add_argument('pcs', nargs='*', type=lambda x: int(x, 16),
+                        help='Addresses to look up (hex)')
+    parser.add_argument('--log', type=str, metavar='FILE',
+                        help="Annotate every line of FILE ('-' for stdin) that mentions a PC")
+    parser.add_argument('--pattern', type=str, default=DEFAULT_LOG_PATTERN,
+                        help='Regex with the hex PC as group 1 (default matches PC=0001A)')
+
+    args = parser.parse_args()
+    try:
+        index = AddressIndex.load(args.index_file)
+    except (OSError, ValueError) as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+
+    for pc in args.pcs:
+        location = index.lookup(pc)
+        print(f"{pc:05X}: {location if location is not None else '(not in program)'}")
+    if args.log:
+        stream = sys.stdin if args.log == '-' else open(args.log, 'r')
+        try:
+            for line in annotate_log(index, stream, args.pattern):
+                print(line)
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Static Pipeline Analyzer
+Works on an assembled program (Assembler.instructions and symbol table)
+without simulating it: splits the code into basic blocks, flags load-use
+pairs that forwarding cannot hide, memory accesses that block fetch through
+the single memory port and conditional branches that pay a flush when taken,
+and estimates cycles per block and the overall CPI.
+
+The per-instruction costs were measured on pipeline.PipelineModel; use that
+model for exact, data-dependent numbers.
+"""
+
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+from isa_constants import ISA
+
+
+# Extra cycles per instruction by stall cause (see pipeline.STALL_CAUSES),
+# on top of the one cycle each instruction takes to retire
+STALL_COSTS: Dict[str, Dict[str, int]] = {
+    'IADD': {'immediate': 1},
+    'LDM':  {'immediate': 1},
+    'LDD':  {'immediate': 1, 'memory': 1},
+    'STD':  {'immediate': 1, 'memory': 1},
+    'PUSH': {'memory': 1},
+    'POP':  {'memory': 1},
+    'JZ':   {'immediate': 1},
+    'JN':   {'immediate': 1},
+    'JC':   {'immediate': 1},
+    'JMP':  {'immediate': 1},
+    'CALL': {'immediate': 1, 'memory': 1},
+    'RET':  {'return': 3},
+    'RTI':  {'return': 3, 'memory': 2},
+    'INT':  {'interrupt': 3, 'memory': 1},
+    'SWAP': {'swap': 1},
+}
+# A taken conditional branch resolves in execute: its immediate slot plus
+# the flushed decode slot
+TAKEN_BRANCH_COSTS = {'branch': 2}
+# A consumer right after POP reads a stale register (there is no interlock);
+# fixing it costs one spacer instruction
+LOAD_USE_COST = 1
+
+CONDITIONAL_BRANCHES = frozenset({'JZ', 'JN', 'JC'})
+# Instructions that access memory in the MEM stage (memory_hazard_unit drops PassPC)
+FETCH_BLOCKING = frozenset({'LDD', 'STD', 'PUSH', 'POP', 'CALL', 'RET', 'RTI', 'INT'})
+# Last instruction of a basic block
+BLOCK_ENDS = frozenset(ISA.BRANCH_INSTRUCTIONS | {'RET', 'RTI', 'INT', 'HLT'})
+
+# Report columns, in order
+COST_CAUSES = ('memory', 'immediate', 'branch', 'return', 'interrupt', 'swap', 'load_use')
+
+
+class Effects:
+    """Registers and machine state an instruction reads and writes"""
+    __slots__ = ('reads', 'writes', 'flags_read', 'flags_written',
+                 'mem_read', 'mem_write', 'stack', 'io', 'barrier')
+
+    def __init__(self, reads: FrozenSet[int] = frozenset(), writes: FrozenSet[int] = frozenset(),
+                 flags_read: bool = False, flags_written: bool = False,
+                 mem_read: bool = False, mem_write: bool = False,
+                 stack: bool = False, io: bool = False, barrier: bool = False):
+        self.reads = reads
+        self.writes = writes
+        self.flags_read = flags_read
+        self.flags_written = flags_written
+        self.mem_read = mem_read
+        self.mem_write = mem_write
+        self.stack = stack          # Uses or moves SP
+        self.io = io                # IN/OUT: kept in order with each other
+        self.barrier = barrier      # Control flow: never reordered across
+
+
+# Flag behaviour per mnemonic (ccr_we in the decoder). JZ/JN/JC clear the
+# flag they test and SETC only sets C, so both also read the CCR.
+FLAG_WRITERS = frozenset({'SETC', 'NOT', 'INC', 'ADD', 'SUB', 'AND', 'IADD', 'RTI'}) | CONDITIONAL_BRANCHES
+FLAG_READERS = CONDITIONAL_BRANCHES | {'SETC', 'INT'}
+BARRIERS = frozenset(ISA.BRANCH_INSTRUCTIONS | {'RET', 'RTI', 'INT', 'HLT', '.DW'})
+
+
+# Effects by (hex mode, mnemonic, operands): an offset such as 'A(R1)' parses
+# in hex mode only, so the same text may have a base register or none
+_effects_cache: Dict[tuple, Effects] = {}
+
+
+def instruction_effects(assembler, instr) -> Effects:
+    """Effects of one record, with registers parsed by the assembler that produced it"""
+    key = (assembler.hex_mode, instr.mnemonic, instr.operands)
+    effects = _effects_cache.get(key)
+    if effects is None:
+        effects = _effects_cache[key] = _compute_effects(assembler, instr.mnemonic, instr.operands)
+    return effects
+
+
+def _compute_effects(assembler, mnemonic: str, ops: tuple) -> Effects:
+    reg = assembler.parse_register
+    regs = lambda *items: frozenset(r for r in items if r is not None)
+    reads = writes = frozenset()
+
+    if mnemonic in ('NOT', 'INC'):
+        reads = writes = regs(reg(ops[0])) if ops else reads
+    elif mnemonic in ('OUT', 'PUSH'):
+        reads = regs(reg(ops[0])) if ops else reads
+    elif mnemonic in ('IN', 'POP', 'LDM'):
+        writes = regs(reg(ops[0])) if ops else writes
+    elif mnemonic == 'MOV' and len(ops) >= 2:
+        reads, writes = regs(reg(ops[0])), regs(reg(ops[1]))
+    elif mnemonic == 'SWAP' and len(ops) >= 2:
+        reads = writes = regs(reg(ops[0]), reg(ops[1]))
+    elif mnemonic in ISA.THREE_OPERAND_INSTRUCTIONS and len(ops) >= 3:
+        reads, writes = regs(reg(ops[1]), reg(ops[2])), regs(reg(ops[0]))
+    elif mnemonic == 'IADD' and len(ops) >= 2:
+        reads, writes = regs(reg(ops[1])), regs(reg(ops[0]))
+    elif mnemonic in ISA.MEMORY_OFFSET_INSTRUCTIONS and len(ops) >= 2:
+        offset = assembler.parse_offset_operand(ops[1])
+        base = offset[1] if offset else None
+        if mnemonic == 'LDD':
+            reads, writes = regs(base), regs(reg(ops[0]))
+        else:
+            reads = regs(reg(ops[0]), base)
+
+    return Effects(
+        reads=reads, writes=writes,
+        flags_read=mnemonic in FLAG_READERS,
+        flags_written=mnemonic in FLAG_WRITERS,
+        mem_read=mnemonic in ('LDD', 'POP', 'RET', 'RTI', 'INT'),
+        mem_write=mnemonic in ('STD', 'PUSH', 'CALL', 'INT'),
+        stack=mnemonic in ('PUSH', 'POP', 'CALL', 'RET', 'RTI', 'INT'),
+        io=mnemonic in ('IN', 'OUT'),
+        barrier=mnemonic in BARRIERS,
+    )
+
+
+class BasicBlock:
+    """Straight-line run of code records with its cost estimate"""
+
+    def __init__(self, start: int, label: Optional[str]):
+        self.start = start
+        self.label = label
+        self.instructions = []
+        self.costs = {cause: 0 for cause in COST_CAUSES}
+
+    @property
+    def end(self) -> int:
+        last = self.instructions[-1]
+        return last.address + ISA.INSTRUCTION_SIZES.get(last.mnemonic, 1) - 1
+
+    @property
+    def cycles(self) -> int:
+        return len(self.instructions) + sum(self.costs.values())
+
+
+class ProgramAnalysis:
+    """Findings of analyze_program"""
+
+    def __init__(self):
+        self.blocks: List[BasicBlock] = []
+        # (producer, consumer, register)
+        self.load_use: List[Tuple[object, object, int]] = []
+        self.fetch_blocking: List[object] = []
+        # (branch, target address or None, assumed taken)
+        self.branches: List[Tuple[object, Optional[int], bool]] = []
+
+    @property
+    def instructions(self) -> int:
+        return sum(len(block.instructions) for block in self.blocks)
+
+    @property
+    def cycles(self) -> int:
+        return sum(block.cycles for block in self.blocks)
+
+    @property
+    def cpi(self) -> float:
+        return self.cycles / self.instructions if self.instructions else 0.0
+
+
+def block_runs(assembler) -> List[List]:
+    """
+    All records in source order, cut into runs: basic blocks of code and one
+    run per .DW word. A block starts at a label, after a control transfer or
+    where addresses jump (.ORG).
+    """
+    labels = set(assembler.symbol_table.values())
+    runs: List[List] = []
+    block = None
+    next_address = None
+    for instr in assembler.instructions:
+        if instr.mnemonic == '.DW':
+            runs.append([instr])
+            block = None
+            continue
+        if block is None or instr.address != next_address or instr.address in labels:
+            block = []
+            runs.append(block)
+        block.append(instr)
+        next_address = instr.address + ISA.INSTRUCTION_SIZES.get(instr.mnemonic, 1)
+        if instr.mnemonic in BLOCK_ENDS:
+            block = None
+    return runs
+
+
+def numeric_addresses(assembler) -> Set[int]:
+    """
+    Addresses written as numbers where a label could stand: branch and CALL
+    targets, LDM values (the JMP Rx macro) and .DW words. A pass that moves
+    code cannot tell which of them point at code, so it must not move what
+    they point into.
+    """
+    symbols = assembler.symbol_table
+    addresses = set()
+    for instr in assembler.instructions:
+        mnemonic = instr.mnemonic
+        ops = instr.operands
+        if (mnemonic in ISA.BRANCH_INSTRUCTIONS or mnemonic == '.DW') and ops:
+            operand = ops[0]
+        elif mnemonic == 'LDM' and len(ops) >= 2:
+            operand = ops[1]
+        else:
+            continue
+        if operand in symbols or assembler.parse_register(operand) is not None:
+            continue
+        value = assembler.parse_number(operand)
+        if value is not None and 0 <= value < ISA.MEMORY_WORDS:
+            addresses.add(value)
+    return addresses
+
+
+def pinned_runs(runs: List[List], addresses: Set[int], with_preceding: bool = False) -> Set[int]:
+    """
+    Indexes of the runs (see block_runs) that one of `addresses` points
+    into. with_preceding also pins the earlier runs laid out contiguously
+    with such a run, since shrinking any of them would move it.
+    """
+    pinned: Set[int] = set()
+    segment = 0
+    end = None
+    for index, run in enumerate(runs):
+        start = run[0].address
+        if start != end:
+            segment = index
+        last = run[-1]
+        end = last.address + (1 if last.mnemonic == '.DW' else ISA.INSTRUCTION_SIZES.get(last.mnemonic, 1))
+        if any(start <= address < end for address in addresses):
+            pinned.update(range(segment, index + 1) if with_preceding else (index,))
+    return pinned
+
+
+def split_blocks(assembler) -> List[BasicBlock]:
+    """Basic blocks of the code records (.DW data is not code)"""
+    labels: Dict[int, str] = {}
+    for name, addr in sorted(assembler.symbol_table.items(), key=lambda x: x[0]):
+        labels.setdefault(addr, name)
+
+    blocks: List[BasicBlock] = []
+    for run in block_runs(assembler):
+        if run[0].mnemonic == '.DW':
+            continue
+        block = BasicBlock(run[0].address, labels.get(run[0].address))
+        block.instructions = run
+        blocks.append(block)
+    return blocks
+
+
+def analyze_program(assembler) -> ProgramAnalysis:
+    """
+    Static hazard and cost report for an assembled program. Each block is
+    costed once; a conditional branch is assumed taken when it jumps
+    backward (a loop) and not taken otherwise.
+    """
+    analysis = ProgramAnalysis()
+    analysis.blocks = split_blocks(assembler)
+    symbols = assembler.symbol_table
+
+    for block in analysis.blocks:
+        costs = block.costs
+        previous = None
+        previous_effects = None
+        for instr in block.instructions:
+            mnemonic = instr.mnemonic
+            effects = instruction_effects(assembler, instr)
+
+            # LDD's consumer is always separated by its immediate slot
+            if previous is not None and previous.mnemonic == 'POP':
+                stale = previous_effects.writes & effects.reads
+                for register in sorted(stale):
+                    analysis.load_use.append((previous, instr, register))
+                if stale:
+                    costs['load_use'] += LOAD_USE_COST
+
+            if mnemonic in FETCH_BLOCKING:
+                analysis.fetch_blocking.append(instr)
+
+            stall = STALL_COSTS.get(mnemonic, {})
+            if mnemonic in CONDITIONAL_BRANCHES:
+                target = symbols.get(instr.operands[0]) if instr.operands else None
+                if target is None and instr.operands:
+                    target = assembler.parse_number(instr.operands[0])
+                taken = target is not None and target <= instr.address
+                analysis.branches.append((instr, target, taken))
+                if taken:
+                    stall = TAKEN_BRANCH_COSTS
+            for cause, cycles in stall.items():
+                costs[cause] += cycles
+
+            previous, previous_effects = instr, effects
+
+    return analysis
+
+
+def describe(instr) -> str:
+    return f"line {instr.line_num:4d}  {instr.address:05X}: {instr.mnemonic} {', '.join(instr.operands)}".rstrip()
+
+
+def format_analysis(analysis: ProgramAnalysis) -> str:
+    """Text report: hazards, fetch-blocking accesses, branches, per-block table"""
+    lines = ["", "=== Static Pipeline Analysis ==="]
+
+    lines.append(f"\nLoad-use hazards: {len(analysis.load_use)} "
+                 "(no interlock: the consumer reads a stale register; separate them by one instruction)")
+    for producer, consumer, register in analysis.load_use:
+        lines.append(f"  {describe(producer)}  ->  {describe(consumer)}  (R{register})")
+
+    lines.append(f"\nFetch-blocking memory accesses (PassPC = 0): {len(analysis.fetch_blocking)}")
+    for instr in analysis.fetch_blocking:
+        lines.append(f"  {describe(instr)}")
+
+    taken = sum(1 for _, _, is_taken in analysis.branches if is_taken)
+    lines.append(f"\nConditional branches: {len(analysis.branches)} "
+                 f"({TAKEN_BRANCH_COSTS['branch']}-cycle flush when taken; {taken} backward, assumed taken)")
+    for instr, target, is_taken in analysis.branches:
+        where = f"{target:05X}" if target is not None else "?"
+        lines.append(f"  {describe(instr)}  -> {where} {'taken' if is_taken else 'not taken'}")
+
+    header = (f"{'Block':>5s} {'Start':>5s} {'End':>5s}  {'Label':16s} {'Instr':>6s} {'Cycles':>7s} {'CPI':>5s}"
+              + "".join(f" {cause:>9s}" for cause in COST_CAUSES))
+    lines += ["", "Basic blocks (estimated cycles, pipeline fill excluded):", header, "-" * len(header)]
+    for n, block in enumerate(analysis.blocks):
+        count = len(block.instructions)
+        lines.append(f"{n:5d} {block.start:05X} {block.end:05X}  {(block.label or '')[:16]:16s} "
+                     f"{count:6d} {block.cycles:7d} {block.cycles / count:5.2f}"
+                     + "".join(f" {block.costs[cause]:9d}" for cause in COST_CAUSES))
+
+    lines.append(f"\nTotal: {len(analysis.blocks)} blocks, {analysis.instructions} instructions, "
+                 f"{analysis.cycles} cycles, CPI {analysis.cpi:.2f} (each block once)")
+    return "\n".join(lines)
@@ -7,22 +7,136 @@ Constraint: Immediates are 16-bit sign-extended to 32-bit in the second word
 Constraint: Memory Address space is 18-bit (1MB Total)
 """
 
+import gc
+import os
 import sys
 import re
-from typing import Dict, List, Tuple, Optional
-from dataclasses import dataclass
+import json
+import pickle
+from array import array
+from typing import Callable, Dict, Iterable, List, Tuple, Optional
 from isa_constants import ISA
 
 
-@dataclass
+# ===== Lexer / encoder tables (built once at import) =====
+
+# Unsigned 32-bit array typecode for the memory image
+WORD_TYPECODE = 'I' if array('I').itemsize == 4 else 'L'
+
+# Earliest comment marker on a line (';', '#' or '//')
+COMMENT_PATTERN = re.compile(r'[;#]|//')
+# offset(Rn) memory operand
+OFFSET_PATTERN = re.compile(r'([^(]+)\s*\(\s*R(\d)\s*\)', re.IGNORECASE)
+# Register names -> number; both cases so stripped operands need no upper()
+REGISTERS = {f'{r}{i}': i for i in range(8) for r in 'Rr'}
+# First instruction word with only the opcode field set
+OPCODE_HEADERS = {m: op << ISA.SHIFT_OPCODE for m, op in ISA.OPCODES.items()}
+# Register number -> field bits, per field
+R1_FIELD = [r << ISA.SHIFT_R1 for r in range(8)]
+R2_FIELD = [r << ISA.SHIFT_R2 for r in range(8)]
+R3_FIELD = [r << ISA.SHIFT_R3 for r in range(8)]
+# Single-register instructions whose operand is not (only) in R1
+SINGLE_REGISTER_FIELDS = {
+    'OUT': R2_FIELD,
+    'PUSH': R3_FIELD,
+    'NOT': [r1 | r2 for r1, r2 in zip(R1_FIELD, R2_FIELD)],
+    'INC': [r1 | r2 for r1, r2 in zip(R1_FIELD, R2_FIELD)],
+}
+# Mnemonic -> name of the Assembler method that encodes it
+ENCODERS = {}
+for _names, _method in ((ISA.ONE_OPERAND_INSTRUCTIONS, 'encode_one_operand'),
+                        (ISA.TWO_OPERAND_INSTRUCTIONS, 'encode_two_operand'),
+                        (ISA.THREE_OPERAND_INSTRUCTIONS, 'encode_three_operand'),
+                        (ISA.IMMEDIATE_INSTRUCTIONS, 'encode_immediate_instruction'),
+                        (ISA.MEMORY_OFFSET_INSTRUCTIONS, 'encode_memory_offset'),
+                        (ISA.BRANCH_INSTRUCTIONS, 'encode_branch'),
+                        ({'INT'}, 'encode_interrupt')):
+    for _mnemonic in _names:
+        ENCODERS.setdefault(_mnemonic, _method)
+
+
+# ===== Output formatting tables =====
+
+# Occupancy byte -> one 0/1 flag byte per word it covers (bit 0 first)
+BYTE_FLAGS = [bytes((b >> i) & 1 for i in range(8)) for b in range(256)]
+# One unused word in .mem output
+ZERO_MEM_LINE = f"{0:08X}\n"
+
+# Bump when the incremental sidecar layout or the encodings change
+INCREMENTAL_CACHE_VERSION = 1
+
+# Relocatable object files (see generate_object / linker.py)
+OBJECT_FORMAT = 'asm-object'
+OBJECT_FORMAT_VERSION = 1
+
+
+def _big_endian_bytes(words: array) -> bytes:
+    """Words as 4 big-endian bytes each (most significant digit first)"""
+    if sys.byteorder == 'little':
+        words = array(WORD_TYPECODE, words)
+        words.byteswap()
+    return words.tobytes()
+
+
+def _hex_digits(words: array) -> bytes:
+    """8 upper-case hex digits per word, back to back"""
+    return _big_endian_bytes(words).hex().upper().encode('ascii')
+
+
+def _bin_digits(words: array) -> bytes:
+    """32 binary digits per word, back to back"""
+    # One big integer formats in base 2 in linear time
+    data = _big_endian_bytes(words)
+    return format(int.from_bytes(data, 'big'), f'0{len(data) * 8}b').encode('ascii')
+
+
+def _interleave(columns: List, count: int) -> bytearray:
+    """
+    Build `count` fixed-width text lines in one buffer. Each column is either a
+    literal separator (bytes) repeated on every line, or a tuple
+    (digits, stride, first, width): chars [first, first + width) of each
+    `stride`-sized record in `digits`. Filled one character position at a
+    time with extended-slice copies, so the cost is per column, not per line.
+    """
+    line_width = sum(len(c) if isinstance(c, bytes) else c[3] for c in columns)
+    out = bytearray(line_width * count)
+    pos = 0
+    for column in columns:
+        if isinstance(column, bytes):
+            for ch in range(len(column)):
+                out[pos + ch::line_width] = column[ch:ch + 1] * count
+            pos += len(column)
+        else:
+            digits, stride, first, width = column
+            for ch in range(width):
+                out[pos + ch::line_width] = digits[first + ch::stride]
+            pos += width
+    return out
+
+
 class Instruction:
     """Represents a parsed instruction"""
-    label: Optional[str]
-    mnemonic: str
-    operands: List[str]
-    line_num: int
-    address: int = 0
-    machine_code: List[int] = None  # List of 32-bit words
+    # One record per source line: no per-instance __dict__
+    __slots__ = ('label', 'mnemonic', 'operands', 'line_num', 'address', 'machine_code')
+
+    def __init__(self, label: Optional[str], mnemonic: str, operands: Tuple[str, ...],
+                 line_num: int, address: int = 0, machine_code: Tuple[int, ...] = None):
+        self.label = label
+        self.mnemonic = mnemonic
+        self.operands = operands            # Shared between identical source lines
+        self.line_num = line_num
+        self.address = address
+        self.machine_code = machine_code    # 32-bit words, shared like operands
+
+    def __repr__(self):
+        return (f"Instruction(label={self.label!r}, mnemonic={self.mnemonic!r}, "
+                f"operands={self.operands!r}, line_num={self.line_num!r}, "
+                f"address={self.address!r}, machine_code={self.machine_code!r})")
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
 
 
 class Assembler:
@@ -33,6 +147,26 @@ class Assembler:
         self.instructions: List[Instruction] = []
         self.current_address = 0
         self.errors = []
+        # Assembled words by address plus one occupancy bit per word (filled
+        # by second_pass); generate_output reads these instead of the records
+        self.memory_image = array(WORD_TYPECODE)
+        self.occupied = bytearray()
+        self.operand_tuples: Dict[str, Tuple[str, ...]] = {}
+        # Incremental mode: tokens by line text and error-free encodings,
+        # both persisted in the sidecar cache (see assemble_incremental)
+        self.line_tokens: Optional[Dict[str, tuple]] = None
+        self.encodings: Dict[tuple, Tuple[int, ...]] = {}
+        self.incremental_stats: Dict[str, int] = {}
+        # Relocatable objects: .GLOBAL/.EXTERN names (-> declaring line) and
+        # (address, kind, symbol) fix-ups, symbol None meaning module-relative
+        self.exports: Dict[str, int] = {}
+        self.imports: Dict[str, int] = {}
+        self.relocations: List[Tuple[int, str, Optional[str]]] = []
+        # Passes run on the records between the two passes (see run_optimizers)
+        self.optimizers: List[Callable[['Assembler'], Dict[str, int]]] = []
+        self.optimization_stats: Dict[str, Dict[str, int]] = {}
+        # Per-mnemonic dispatch, bound once instead of walking the ISA sets
+        self.encoders = {m: getattr(self, name) for m, name in ENCODERS.items()}
 
     def log(self, message: str):
         if self.verbose:
@@ -45,15 +179,10 @@ class Assembler:
             self.errors.append(message)
 
     def parse_register(self, reg_str: str) -> Optional[int]:
-        reg_str = reg_str.strip().upper()
-        if reg_str.startswith('R') and len(reg_str) == 2:
-            try:
-                reg_num = int(reg_str[1])
-                if 0 <= reg_num <= 7:
-                    return reg_num
-            except ValueError:
-                pass
-        return None
+        reg = REGISTERS.get(reg_str)
+        if reg is None:
+            reg = REGISTERS.get(reg_str.strip().upper())
+        return reg
 
     def parse_number(self, num_str: str) -> Optional[int]:
         """
@@ -94,8 +223,7 @@ class Assembler:
 
     def parse_offset_operand(self, operand: str) -> Optional[Tuple[int, int]]:
         """Parse offset(register) format -> (offset, register)"""
-        match = re.match(r'([^(]+)\s*\(\s*R(\d)\s*\)',
-                         operand.strip(), re.IGNORECASE)
+        match = OFFSET_PATTERN.match(operand.strip())
         if match:
             offset = self.parse_number(match.group(1))
             reg = int(match.group(2))
@@ -103,35 +231,39 @@ class Assembler:
                 return (offset, reg)
         return None
 
-    def tokenize_line(self, line: str) -> Tuple[Optional[str], str, List[str]]:
-        if ';' in line:
-            line = line[:line.index(';')]
-        if '#' in line:
-            line = line[:line.index('#')]
-        if '//' in line:
-            line = line[:line.index('//')]
-        line = line.strip()
-        if not line:
-            return None, '', []
+    def tokenize_line(self, line: str) -> Tuple[Optional[str], str, Tuple[str, ...]]:
+        comment = COMMENT_PATTERN.search(line)
+        if comment:
+            line = line[:comment.start()]
 
         label = None
-        if ':' in line:
-            parts = line.split(':', 1)
-            label = parts[0].strip()
-            line = parts[1].strip() if len(parts) > 1 else ''
-
-        if not line:
-            return label, '', []
+        head, colon, rest = line.partition(':')
+        if colon:
+            label = head.strip()
+            line = rest
 
         parts = line.split(None, 1)
-        mnemonic = parts[0].upper()
-        operands = []
-        if len(parts) > 1:
-            operands = [op.strip() for op in parts[1].split(',')]
-
-        return label, mnemonic, operands
-
-    def handle_directive(self, directive: str, operands: List[str], line_num: int) -> bool:
+        if not parts:
+            return label, '', ()
+        if len(parts) == 1:
+            return label, parts[0].upper(), ()
+        # One tuple per distinct operand text, shared by every line using it;
+        # its strings are interned so e.g. every 'R1' is the same object
+        operands = self.operand_tuples.get(parts[1])
+        if operands is None:
+            operands = tuple([sys.intern(op.strip()) for op in parts[1].split(',')])
+            self.operand_tuples[parts[1]] = operands
+        return label, parts[0].upper(), operands
+
+    def tokenize_cached(self, line: str) -> Tuple[Optional[str], str, Tuple[str, ...]]:
+        """tokenize_line through the per-line-text cache (incremental mode)"""
+        tokens = self.line_tokens.get(line)
+        if tokens is None:
+            tokens = self.line_tokens[line] = self.tokenize_line(line)
+            self.incremental_stats['tokenized'] = self.incremental_stats.get('tokenized', 0) + 1
+        return tokens
+
+    def handle_directive(self, directive: str, operands: Tuple[str, ...], line_num: int) -> bool:
         if directive == '.ORG':
             if len(operands) < 1:
                 self.error(".ORG requires an address operand", line_num)
@@ -175,26 +307,41 @@ class Assembler:
                 instr = Instruction(
                     label=None,
                     mnemonic='.DW',
-                    operands=[operand],
+                    operands=(operand,),
                     line_num=line_num,
                     address=self.current_address,
                     machine_code=None  # Will be filled in second pass
                 )
                 self.instructions.append(instr)
-                self.log(f".DW at {self.current_address:05X}: {operand} (deferred)")
+                if self.verbose:
+                    self.log(f".DW at {self.current_address:05X}: {operand} (deferred)")
                 self.current_address += 1
             return True
-            
+
+        elif directive in ('.GLOBAL', '.EXTERN'):
+            # Symbols exported from / imported into a relocatable module
+            if len(operands) < 1:
+                self.error(f"{directive} requires at least one symbol", line_num)
+                return True
+            table = self.exports if directive == '.GLOBAL' else self.imports
+            for name in operands:
+                table.setdefault(name, line_num)
+            return True
+
         return False
 
-    def first_pass(self, lines: List[str]):
+    def first_pass(self, lines: Iterable[str], first_line: int = 1, start_address: int = 0):
         """First pass: Symbol table and Address calculation"""
         self.log(
             f"Starting first pass (Memory Limit: {ISA.MEMORY_WORDS} Words)...")
-        self.current_address = 0
+        self.current_address = start_address
+        verbose = self.verbose
+        tokenize_line = self.tokenize_line if self.line_tokens is None else self.tokenize_cached
+        sizes = ISA.INSTRUCTION_SIZES
+        append = self.instructions.append
 
-        for line_num, line in enumerate(lines, 1):
-            label, mnemonic, operands = self.tokenize_line(line)
+        for line_num, line in enumerate(lines, first_line):
+            label, mnemonic, operands = tokenize_line(line)
 
             # Check address overflow
             if self.current_address >= ISA.MEMORY_WORDS:
@@ -207,10 +354,21 @@ class Assembler:
                     self.error(f"Duplicate label '{label}'", line_num)
                 else:
                     self.symbol_table[label] = self.current_address
-                    self.log(
-                        f"Label '{label}' -> Address {self.current_address:05X}")
+                    if verbose:
+                        self.log(
+                            f"Label '{label}' -> Address {self.current_address:05X}")
+
+            if not mnemonic:
+                continue
+
+            # Fast path: plain instruction (no directive, alias, constant or macro)
+            size = sizes.get(mnemonic)
+            if size is not None and mnemonic != 'JMP' and not verbose:
+                append(Instruction(label, mnemonic, operands, line_num, self.current_address))
+                self.current_address += size
+                continue
 
-            if mnemonic and mnemonic.startswith('.'):
+            if mnemonic.startswith('.'):
                 if self.handle_directive(mnemonic, operands, line_num):
                     continue
 
@@ -219,7 +377,7 @@ class Assembler:
                 if mnemonic.startswith('INT') and len(mnemonic) > 3 and mnemonic[3:].isdigit():
                     val = mnemonic[3:]
                     mnemonic = 'INT'
-                    operands = [val]
+                    operands = (val,)
 
                 # Handle numeric constants as .DW
                 if mnemonic not in ISA.OPCODES:
@@ -230,12 +388,13 @@ class Assembler:
                          instr = Instruction(
                             label=label,
                             mnemonic='.DW',
-                            operands=[mnemonic],
+                            operands=(mnemonic,),
                             line_num=line_num,
                             address=self.current_address
                          )
                          self.instructions.append(instr)
-                         self.log(f"Parsed {instr.address:05X}: .DW (implicit) {mnemonic}")
+                         if verbose:
+                             self.log(f"Parsed {instr.address:05X}: .DW (implicit) {mnemonic}")
                          self.current_address += 1
                          continue
                         
@@ -262,7 +421,7 @@ class Assembler:
                         instr2 = Instruction(
                             label=None,
                             mnemonic='RET',
-                            operands=[],
+                            operands=(),
                             line_num=line_num,
                             address=self.current_address
                         )
@@ -280,11 +439,14 @@ class Assembler:
                 )
                 self.instructions.append(instr)
 
-                ops_str = ", ".join(operands)
-                self.log(f"Parsed {instr.address:05X}: {mnemonic} {ops_str}")
+                if verbose:
+                    ops_str = ", ".join(operands)
+                    self.log(f"Parsed {instr.address:05X}: {mnemonic} {ops_str}")
 
-                size = ISA.get_size(mnemonic)
-                self.current_address += size
+                self.current_address += sizes.get(mnemonic, 1)
+
+        # Records keep the shared tuples; the raw-text keys are no longer needed
+        self.operand_tuples.clear()
 
     # ================= ENCODING HELPERS =================
 
@@ -300,10 +462,10 @@ class Assembler:
         return word
 
     def encode_one_operand(self, instr: Instruction) -> List[int]:
-        opcode = ISA.OPCODES[instr.mnemonic]
+        header = OPCODE_HEADERS[instr.mnemonic]
 
         if instr.mnemonic in ISA.NO_OPERAND_INSTRUCTIONS:
-            return [self.pack_header(opcode)]
+            return [header]
 
         if len(instr.operands) < 1:
             self.error(f"{instr.mnemonic} requires 1 operand", instr.line_num)
@@ -314,17 +476,9 @@ class Assembler:
             self.error(
                 f"Invalid register '{instr.operands[0]}'", instr.line_num)
             return [0]
-        
-        if instr.mnemonic == 'OUT':
-            return [self.pack_header(opcode, r2=rdst)]
-        elif instr.mnemonic == 'PUSH':
-            return [self.pack_header(opcode, r3=rdst)]
-        elif instr.mnemonic == 'NOT' or instr.mnemonic == 'INC':
-            return [self.pack_header(opcode, r1=rdst, r2=rdst)]
-        
-
 
-        return [self.pack_header(opcode, r1=rdst)] #it handles IN and POP
+        # Register field(s) for the single operand; IN and POP use R1
+        return [header | SINGLE_REGISTER_FIELDS.get(instr.mnemonic, R1_FIELD)[rdst]]
 
     def encode_two_operand(self, instr: Instruction) -> List[int]:
         if len(instr.operands) < 2:
@@ -338,13 +492,13 @@ class Assembler:
             self.error(f"Invalid registers", instr.line_num)
             return [0]
 
-        opcode = ISA.OPCODES[instr.mnemonic]
-        
+        header = OPCODE_HEADERS[instr.mnemonic]
+
         # Special encoding for SWAP: opcode Rdst Rsrc Rdst
         if instr.mnemonic == 'SWAP':
-            return [self.pack_header(opcode, r1=rdst, r2=rdst, r3=rsrc)]
-        
-        return [self.pack_header(opcode, r1=rdst, r2=rsrc)]
+            return [header | R1_FIELD[rdst] | R2_FIELD[rdst] | R3_FIELD[rsrc]]
+
+        return [header | R1_FIELD[rdst] | R2_FIELD[rsrc]]
 
     def encode_three_operand(self, instr: Instruction) -> List[int]:
         if len(instr.operands) < 3:
@@ -359,8 +513,7 @@ class Assembler:
             self.error(f"Invalid registers", instr.line_num)
             return [0]
 
-        opcode = ISA.OPCODES[instr.mnemonic]
-        return [self.pack_header(opcode, r1=rdst, r2=rsrc1, r3=rsrc2)]
+        return [OPCODE_HEADERS[instr.mnemonic] | R1_FIELD[rdst] | R2_FIELD[rsrc1] | R3_FIELD[rsrc2]]
 
     def _validate_and_mask_16bit(self, val: int, line_num: int) -> int:
         """
@@ -389,7 +542,7 @@ class Assembler:
         return val & 0xFFFFFFFF
 
     def encode_immediate_instruction(self, instr: Instruction) -> List[int]:
-        opcode = ISA.OPCODES[instr.mnemonic]
+        header = OPCODE_HEADERS[instr.mnemonic]
 
         if instr.mnemonic == 'IADD':
             if len(instr.operands) < 3:
@@ -405,7 +558,7 @@ class Assembler:
 
             imm_masked = self._validate_and_mask_16bit(imm, instr.line_num)
 
-            w1 = self.pack_header(opcode, r1=rdst, r2=rsrc)
+            w1 = header | R1_FIELD[rdst] | R2_FIELD[rsrc]
             w2 = self.sign_extend_16bit(imm_masked) & 0xFFFFFFFF
             return [w1, w2]
 
@@ -416,24 +569,20 @@ class Assembler:
             rdst = self.parse_register(instr.operands[0])
             imm = self.parse_number(instr.operands[1])
 
-            if rdst is None or imm is None:
-                self.error("Invalid operands for LDM", instr.line_num)
-                return [0, 0]
-
             if rdst is None or imm is None:
                 self.error("Invalid operands for LDM", instr.line_num)
                 return [0, 0]
 
             imm_masked = self._validate_and_mask_32bit(imm, instr.line_num)
 
-            w1 = self.pack_header(opcode, r1=rdst)
+            w1 = header | R1_FIELD[rdst]
             w2 = imm_masked
             return [w1, w2]
 
         return [0, 0]
 
     def encode_memory_offset(self, instr: Instruction) -> List[int]:
-        opcode = ISA.OPCODES[instr.mnemonic]
+        header = OPCODE_HEADERS[instr.mnemonic]
 
         if len(instr.operands) < 2:
             self.error(f"{instr.mnemonic} requires 2 operands", instr.line_num)
@@ -450,7 +599,7 @@ class Assembler:
             offset_masked = self._validate_and_mask_16bit(
                 offset, instr.line_num)
 
-            w1 = self.pack_header(opcode, r1=rdst, r2=rsrc)
+            w1 = header | R1_FIELD[rdst] | R2_FIELD[rsrc]
             w2 = self.sign_extend_16bit(offset_masked) & 0xFFFFFFFF
             return [w1, w2]
 
@@ -465,7 +614,7 @@ class Assembler:
             offset_masked = self._validate_and_mask_16bit(
                 offset, instr.line_num)
 
-            w1 = self.pack_header(opcode, r2=rsrc2, r3=rsrc1)
+            w1 = header | R2_FIELD[rsrc2] | R3_FIELD[rsrc1]
             w2 = self.sign_extend_16bit(offset_masked) & 0xFFFFFFFF
             return [w1, w2]
 
@@ -490,8 +639,7 @@ class Assembler:
             self.error(
                 f"Branch target {imm:X} exceeds 18-bit memory space", instr.line_num)
 
-        opcode = ISA.OPCODES[instr.mnemonic]
-        w1 = self.pack_header(opcode)
+        w1 = OPCODE_HEADERS[instr.mnemonic]
         w2 = imm & 0xFFFFFFFF
         return [w1, w2]
 
@@ -501,36 +649,45 @@ class Assembler:
             return [0]
 
         index = self.parse_number(instr.operands[0])
-        opcode = ISA.OPCODES['INT']
+        if index is None:
+            self.error(f"Invalid interrupt index '{instr.operands[0]}'", instr.line_num)
+            return [0, 0]
 
-        w1 = self.pack_header(opcode)
+        w1 = OPCODE_HEADERS['INT']
         w2 = self.sign_extend_16bit(index) & 0xFFFFFFFF
         return [w1, w2]
 
     def encode_instruction(self, instr: Instruction) -> List[int]:
-        mnemonic = instr.mnemonic
-
-        if mnemonic in ISA.ONE_OPERAND_INSTRUCTIONS:
-            return self.encode_one_operand(instr)
-        elif mnemonic in ISA.TWO_OPERAND_INSTRUCTIONS:
-            return self.encode_two_operand(instr)
-        elif mnemonic in ISA.THREE_OPERAND_INSTRUCTIONS:
-            return self.encode_three_operand(instr)
-        elif mnemonic in ISA.IMMEDIATE_INSTRUCTIONS:
-            return self.encode_immediate_instruction(instr)
-        elif mnemonic in ISA.MEMORY_OFFSET_INSTRUCTIONS:
-            return self.encode_memory_offset(instr)
-        elif mnemonic in ISA.BRANCH_INSTRUCTIONS:
-            return self.encode_branch(instr)
-        elif mnemonic == 'INT':
-            return self.encode_interrupt(instr)
-        else:
-            self.error(f"Unknown encoding for {mnemonic}", instr.line_num)
+        encoder = self.encoders.get(instr.mnemonic)
+        if encoder is None:
+            self.error(f"Unknown encoding for {instr.mnemonic}", instr.line_num)
             return [0]
+        return encoder(instr)
 
-    def second_pass(self):
+    def second_pass(self, instructions: Optional[List[Instruction]] = None):
+        """
+        Encode every record into a fresh memory image, or with `instructions`
+        only those records, patched into the current image
+        """
         self.log("Starting second pass...")
-        for instr in self.instructions:
+        verbose = self.verbose
+        encoders = self.encoders
+        symbols = self.symbol_table
+        branches = ISA.BRANCH_INSTRUCTIONS
+        if instructions is None:
+            instructions = self.instructions
+            self.memory_image = array(WORD_TYPECODE, bytes(4 * ISA.MEMORY_WORDS))
+            self.occupied = bytearray(ISA.MEMORY_WORDS // 8)
+        image = self.memory_image
+        occupied = self.occupied
+        # Encodings of error-free (mnemonic, operands[, target address]) keys,
+        # so identical source lines share one machine_code tuple. A branch key
+        # includes its label's address: the entry stays valid across runs
+        # (incremental mode) and goes stale only when that label moves.
+        encoded = self.encodings
+        encoded_before = len(encoded)
+
+        for instr in instructions:
             # Handle .DW - resolve value now that symbol table is complete
             if instr.mnemonic == '.DW':
                 operand = instr.operands[0]
@@ -540,22 +697,216 @@ class Assembler:
                     value = self.parse_number(operand)
                     if value is None:
                         self.error(f"Invalid value for .DW: '{operand}'", instr.line_num)
-                        instr.machine_code = [0]
+                        instr.machine_code = (0,)
                         continue
-                instr.machine_code = [value & 0xFFFFFFFF]
-                self.log(f"Addr {instr.address:05X}: .DW   {operand:15s} -> {value:08X}")
+                machine_code = instr.machine_code = (value & 0xFFFFFFFF,)
+                if verbose:
+                    self.log(f"Addr {instr.address:05X}: .DW   {operand:15s} -> {value:08X}")
+            else:
+                key = (instr.mnemonic, instr.operands)
+                if instr.mnemonic in branches and instr.operands:
+                    key += (symbols.get(instr.operands[0]),)
+                machine_code = encoded.get(key)
+                if machine_code is None:
+                    error_count = len(self.errors)
+                    encoder = encoders.get(instr.mnemonic)
+                    if encoder is None:
+                        machine_code = tuple(self.encode_instruction(instr))
+                    else:
+                        machine_code = tuple(encoder(instr))
+                    if len(self.errors) == error_count:
+                        encoded[key] = machine_code
+                instr.machine_code = machine_code
+
+                if verbose:
+                    # Format output
+                    hex_codes = " ".join([f"{w:08X}" for w in machine_code])
+                    ops_str = ", ".join(instr.operands)
+                    self.log(
+                        f"Addr {instr.address:05X}: {instr.mnemonic:5s} {ops_str:15s} -> {hex_codes}")
+
+            addr = instr.address
+            if addr + len(machine_code) > ISA.MEMORY_WORDS:
+                self.error(f"Instruction at {addr:05X} runs past the end of memory", instr.line_num)
                 continue
-                
-            machine_code = self.encode_instruction(instr)
-            instr.machine_code = machine_code
+            for word in machine_code:
+                image[addr] = word
+                occupied[addr >> 3] |= 1 << (addr & 7)
+                addr += 1
 
-            # Format output
-            hex_codes = " ".join([f"{w:08X}" for w in machine_code])
-            ops_str = ", ".join(instr.operands)
-            self.log(
-                f"Addr {instr.address:05X}: {instr.mnemonic:5s} {ops_str:15s} -> {hex_codes}")
+        self.incremental_stats['encoded'] = len(encoded) - encoded_before
+
+    def occupied_runs(self):
+        """(start, end) ranges of consecutive addresses written by second_pass"""
+        flags = b''.join(map(BYTE_FLAGS.__getitem__, self.occupied))
+        start = flags.find(1)
+        while start != -1:
+            end = flags.find(0, start)
+            if end == -1:
+                end = len(flags)
+            yield start, end
+            start = flags.find(1, end)
+
+    def highest_address(self) -> Optional[int]:
+        """Highest address written by second_pass (None if nothing was)"""
+        used = len(self.occupied.rstrip(b'\0'))
+        if not used:
+            return None
+        return ((used - 1) << 3) + self.occupied[used - 1].bit_length() - 1
 
     def assemble(self, input_file: str) -> bool:
+        try:
+            source = open(input_file, 'r')
+        except FileNotFoundError:
+            self.error(f"Input file '{input_file}' not found")
+            return False
+
+        # Both passes allocate one record per source line and nothing cyclic;
+        # pausing the cyclic GC avoids repeated full-heap scans on big programs
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            # Stream the source: lines are not kept once tokenized
+            with source:
+                self.first_pass(source)
+            for name, line_num in self.imports.items():
+                self.error(f".EXTERN '{name}' needs relocatable output (-c) and the linker", line_num)
+            if self.errors:
+                return False
+            self.run_optimizers()
+            self.second_pass()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        return len(self.errors) == 0
+
+    # ================= OPTIMIZATION PASSES =================
+
+    def run_optimizers(self):
+        """
+        Run each pass in self.optimizers on the laid-out records; a pass
+        returns its statistics, kept in optimization_stats under its name
+        """
+        for optimize in self.optimizers:
+            name = getattr(optimize, '__name__', type(optimize).__name__)
+            self.optimization_stats[name] = optimize(self)
+            self.log(f"{name}: {self.optimization_stats[name]}")
+
+    def relayout(self, groups: List[Tuple[int, int, List[Instruction]]]):
+        """
+        Assign addresses again after a pass rewrote the records. `groups`
+        covers the old records in source order as (old start address, old
+        size in words, new records). Labels at a group's old start move with
+        the group; groups contiguous in the old layout stay contiguous, and
+        each .ORG segment keeps its start address.
+        """
+        sizes = ISA.INSTRUCTION_SIZES
+        moved: Dict[int, int] = {}
+        records: List[Instruction] = []
+        old_end = None
+        address = 0
+        for old_start, old_size, group in groups:
+            if old_start != old_end:
+                address = old_start
+            moved[old_start] = address
+            for instr in group:
+                instr.address = address
+                address += 1 if instr.mnemonic == '.DW' else sizes.get(instr.mnemonic, 1)
+                records.append(instr)
+            old_end = old_start + old_size
+            moved.setdefault(old_end, address)
+
+        for label, addr in self.symbol_table.items():
+            self.symbol_table[label] = moved.get(addr, addr)
+        self.instructions = records
+
+    # ================= INCREMENTAL ASSEMBLY =================
+
+    @staticmethod
+    def layout_key(tokens: tuple):
+        """
+        What a tokenized line contributes to the layout: plain instructions
+        only by label and size, everything else (directives, INTx aliases,
+        JMP Rx macro, constants) by its exact tokens.
+        """
+        label, mnemonic, operands = tokens
+        size = ISA.INSTRUCTION_SIZES.get(mnemonic)
+        if size is not None and mnemonic != 'JMP':
+            return label, size
+        return tokens
+
+    def load_incremental_cache(self, cache_file: str) -> Dict:
+        """Sidecar state of the previous run ({} if missing or unreadable)"""
+        try:
+            with open(cache_file, 'rb') as f:
+                cache = pickle.load(f)
+            if isinstance(cache, dict):
+                return cache
+        except (OSError, EOFError, pickle.PickleError, AttributeError, TypeError, ValueError):
+            pass
+        return {}
+
+    def save_incremental_cache(self, cache_file: str, lines: List[str]):
+        try:
+            with open(cache_file, 'wb') as f:
+                pickle.dump(self.incremental_state(lines), f, pickle.HIGHEST_PROTOCOL)
+        except OSError as exc:
+            self.log(f"Could not write cache '{cache_file}': {exc}")
+
+    def incremental_state(self, lines: List[str]) -> Dict:
+        """
+        State for the next incremental run: the tokens and encodings still in
+        use and, after a clean run, the records (as columns), symbol table and
+        image.
+        """
+        # Only the encodings the current instructions look up (same keys as
+        # second_pass), so entries for deleted lines or old label addresses
+        # do not pile up across runs
+        encodings = self.encodings
+        symbols = self.symbol_table
+        branches = ISA.BRANCH_INSTRUCTIONS
+        live = {}
+        for instr in self.instructions:
+            if instr.mnemonic == '.DW':
+                continue
+            key = (instr.mnemonic, instr.operands)
+            if instr.mnemonic in branches and instr.operands:
+                key += (symbols.get(instr.operands[0]),)
+            if key in encodings:
+                live[key] = encodings[key]
+        state = {
+            'version': INCREMENTAL_CACHE_VERSION,
+            'hex_mode': self.hex_mode,
+            'tokens': {line: self.line_tokens[line] for line in lines},
+            'encodings': live,
+        }
+        if not self.errors:
+            records = self.instructions
+            state.update({
+                'lines': lines,
+                'symbols': self.symbol_table,
+                'image': self.memory_image.tobytes(),
+                'occupied': bytes(self.occupied),
+                'labels': [instr.label for instr in records],
+                'mnemonics': [instr.mnemonic for instr in records],
+                'operands': [instr.operands for instr in records],
+                'line_nums': array(WORD_TYPECODE, [instr.line_num for instr in records]),
+                'addresses': array(WORD_TYPECODE, [instr.address for instr in records]),
+                'machine_code': [instr.machine_code for instr in records],
+            })
+        return state
+
+    def assemble_incremental(self, input_file: str, cache_file: Optional[str] = None) -> bool:
+        """
+        assemble() that reuses the previous run's work, kept in a sidecar
+        file (default: <input_file>.cache). Lines are tokenized once per
+        distinct text and encodings are reused while their operands (and a
+        branch's target address) are unchanged. When the edited lines keep
+        their layout_key, addresses, symbol table and image carry over and
+        only those lines are parsed and encoded again; otherwise the whole
+        file is laid out again from the cached tokens and encodings.
+        """
+        cache_file = cache_file or f"{input_file}.cache"
         try:
             with open(input_file, 'r') as f:
                 lines = f.readlines()
@@ -563,38 +914,246 @@ class Assembler:
             self.error(f"Input file '{input_file}' not found")
             return False
 
-        self.first_pass(lines)
-        if self.errors:
-            return False
-        self.second_pass()
-        return len(self.errors) == 0
+        ok = self.assemble_lines_incremental(lines, self.load_incremental_cache(cache_file))
+        if self.incremental_stats['lines_changed'] or self.incremental_stats['relayout']:
+            self.save_incremental_cache(cache_file, lines)
+        return ok
 
-    def generate_output(self, output_file: str, format_type: str = 'hex', start_address: int = 0):
-        self.log(
-            f"Generating output file: {output_file} (format: {format_type})")
+    def assemble_lines_incremental(self, lines: List[str], cache: Dict) -> bool:
+        """
+        Incremental assembly of `lines` against the incremental_state() of a
+        previous run (ignored if written by another version or hex mode)
+        """
+        if (cache.get('version') != INCREMENTAL_CACHE_VERSION
+                or cache.get('hex_mode') != self.hex_mode):
+            cache = {}
+        self.line_tokens = cache.get('tokens', {})
+        self.encodings = cache.get('encodings', {})
+        self.incremental_stats = {'tokenized': 0, 'encoded': 0, 'relayout': 0, 'lines_changed': 0}
+
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            old_lines = cache.get('lines')
+            changed = None
+            if old_lines is not None and len(old_lines) == len(lines):
+                changed = [num for num, (new, old) in enumerate(zip(lines, old_lines), 1)
+                           if new != old]
+                layout_key = self.layout_key
+                tokens = self.line_tokens
+                for num in changed:
+                    # Old tokens are still cached: the sidecar kept old_lines' tokens
+                    if layout_key(self.tokenize_cached(lines[num - 1])) != layout_key(tokens[old_lines[num - 1]]):
+                        changed = None
+                        break
+
+            if changed is None:
+                self.incremental_stats['relayout'] = 1
+                self.first_pass(lines)
+                if not self.errors:
+                    self.second_pass()
+            else:
+                self.incremental_stats['lines_changed'] = len(changed)
+                self.restore_layout(cache)
+                edited = self.reparse_lines(lines, changed)
+                if not self.errors and edited:
+                    self.second_pass(edited)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+        self.log(f"Incremental: {self.incremental_stats}")
+        return len(self.errors) == 0
 
-        memory = {}
+    def restore_layout(self, cache: Dict):
+        """Records, symbol table and image of the previous clean run"""
+        self.symbol_table = dict(cache['symbols'])
+        self.instructions = list(map(Instruction, cache['labels'], cache['mnemonics'],
+                                     cache['operands'], cache['line_nums'],
+                                     cache['addresses'], cache['machine_code']))
+        self.memory_image = array(WORD_TYPECODE)
+        self.memory_image.frombytes(cache['image'])
+        self.occupied = bytearray(cache['occupied'])
+
+    def reparse_lines(self, lines: List[str], changed: List[int]) -> List[Instruction]:
+        """
+        Re-run the first pass on the `changed` line numbers only and splice
+        their records into self.instructions. Their layout_key is unchanged,
+        so each line keeps the address its old records had. Returns the new
+        records (to be encoded).
+        """
+        starts: Dict[int, int] = {}
+        for line_num in changed:
+            starts[line_num] = None
         for instr in self.instructions:
-            addr = instr.address + start_address
-            for word in instr.machine_code:
-                memory[addr] = word
-                addr += 1
+            if starts.get(instr.line_num, 0) is None:
+                starts[instr.line_num] = instr.address
+
+        replaced: Dict[int, List[Instruction]] = {}
+        for line_num, address in starts.items():
+            if address is None:
+                continue  # No records before or after (comment or directive text)
+            sub = Assembler(verbose=self.verbose, hex_mode=self.hex_mode)
+            sub.line_tokens = self.line_tokens
+            sub.incremental_stats = self.incremental_stats
+            sub.first_pass([lines[line_num - 1]], line_num, address)
+            self.errors.extend(sub.errors)
+            replaced[line_num] = sub.instructions
+        edited = [instr for records in replaced.values() for instr in records]
+
+        merged = []
+        for instr in self.instructions:
+            if instr.line_num in starts:
+                # First old record of an edited line: splice in its new records
+                merged.extend(replaced.pop(instr.line_num, ()))
+            else:
+                merged.append(instr)
+        self.instructions = merged
+        return edited
+
+    # ================= RELOCATABLE OBJECTS =================
+
+    def assemble_object(self, input_file: str) -> bool:
+        """
+        assemble() as a relocatable module: addresses (and .ORG) are relative
+        to the module start, .EXTERN symbols encode as 0 and every reference
+        to a label or import becomes a relocation for the linker
+        """
+        try:
+            source = open(input_file, 'r')
+        except FileNotFoundError:
+            self.error(f"Input file '{input_file}' not found")
+            return False
 
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with source:
+                self.first_pass(source)
+            for name, line_num in self.exports.items():
+                if name not in self.symbol_table:
+                    self.error(f"Exported symbol '{name}' is not defined", line_num)
+            for name, line_num in self.imports.items():
+                if name in self.symbol_table:
+                    self.error(f"'{name}' is declared .EXTERN but defined in this module", line_num)
+            if self.errors:
+                return False
+
+            self.run_optimizers()
+            # Imports resolve to 0 (the addend) while encoding
+            self.symbol_table.update(dict.fromkeys(self.imports, 0))
+            self.second_pass()
+            self.collect_relocations()
+            for name in self.imports:
+                del self.symbol_table[name]
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        return len(self.errors) == 0
+
+    def collect_relocations(self):
+        """Fix-ups for branch targets and .DW values that name a label or import"""
+        symbols = self.symbol_table
+        imports = self.imports
+        branches = ISA.BRANCH_INSTRUCTIONS
+        relocations = []
+        for instr in self.instructions:
+            if not instr.operands:
+                continue
+            if instr.mnemonic == '.DW':
+                at, kind = instr.address, 'data'
+            elif instr.mnemonic in branches:
+                at, kind = instr.address + 1, 'branch'
+            else:
+                continue
+            target = instr.operands[0]
+            if target in imports:
+                relocations.append((at, kind, target))
+            elif target in symbols:
+                relocations.append((at, kind, None))
+        self.relocations = relocations
+
+    def generate_object(self, output_file: str, source: Optional[str] = None):
+        """
+        Write the module as JSON: its image as runs of big-endian hex words,
+        exported symbol offsets, imports and relocations
+        """
+        image = self.memory_image
+        max_addr = self.highest_address()
+        obj = {
+            'format': OBJECT_FORMAT,
+            'version': OBJECT_FORMAT_VERSION,
+            'source': source,
+            'hex_mode': self.hex_mode,
+            'size': 0 if max_addr is None else max_addr + 1,
+            'sections': [[start, _big_endian_bytes(image[start:end]).hex()]
+                         for start, end in self.occupied_runs()],
+            'exports': {name: self.symbol_table[name] for name in self.exports},
+            'imports': list(self.imports),
+            'relocations': [list(reloc) for reloc in self.relocations],
+        }
         with open(output_file, 'w') as f:
-            if format_type == 'hex':
-                for addr in sorted(memory.keys()):
-                    f.write(f"{addr:05X}: {memory[addr]:08X}\n")
+            json.dump(obj, f, separators=(',', ':'))
+        self.log(f"Object written to {output_file}: {obj['size']} words, "
+                 f"{len(self.relocations)} relocations")
 
-            elif format_type == 'bin':
-                for addr in sorted(memory.keys()):
-                    f.write(f"{addr:032b}: {memory[addr]:032b}\n")
+    def generate_output(self, output_file: str, format_type: str = 'hex', start_address: int = 0):
+        self.log(
+            f"Generating output file: {output_file} (format: {format_type})")
 
-            elif format_type == 'mem':
-                if memory:
-                    max_addr = max(memory.keys())
-                    for addr in range(max_addr + 1):
-                        val = memory.get(addr, 0)
-                        f.write(f"{val:08X}\n")
+        image = self.memory_image
+        text = ''  # bytes for the binary 'raw' format
+
+        # Every format is formatted in bulk from the image and written once
+        if format_type in ('hex', 'bin'):
+            addresses = array(WORD_TYPECODE)
+            words = array(WORD_TYPECODE)
+            for start, end in self.occupied_runs():
+                addresses.extend(range(start + start_address, end + start_address))
+                words.extend(image[start:end])
+
+            if words and format_type == 'hex':
+                # Addresses are at least 5 digits ({addr:05X})
+                width = max(5, len(f"{addresses[-1]:X}"))
+                text = _interleave([(_hex_digits(addresses), 8, 8 - width, width), b': ',
+                                    (_hex_digits(words), 8, 0, 8), b'\n'],
+                                   len(words)).decode('ascii')
+            elif words:
+                text = _interleave([(_bin_digits(addresses), 32, 0, 32), b': ',
+                                    (_bin_digits(words), 32, 0, 32), b'\n'],
+                                   len(words)).decode('ascii')
+
+        elif format_type == 'mem':
+            # Unused words up to the last one written are zero lines, added a
+            # whole run at a time
+            chunks = [ZERO_MEM_LINE * start_address] if self.highest_address() is not None else []
+            next_addr = 0
+            for start, end in self.occupied_runs():
+                chunks.append(ZERO_MEM_LINE * (start - next_addr))
+                chunks.append(_big_endian_bytes(image[start:end]).hex('\n', 4).upper() + '\n')
+                next_addr = end
+            text = ''.join(chunks)
+
+        elif format_type == 'smem':
+            # Sparse image: '@AAAAA NNNNN' then the NNNNN words of that run
+            chunks = []
+            for start, end in self.occupied_runs():
+                chunks.append(f"@{start + start_address:05X} {end - start:05X}\n")
+                chunks.append(_big_endian_bytes(image[start:end]).hex('\n', 4).upper() + '\n')
+            text = ''.join(chunks)
+
+        elif format_type == 'raw':
+            # Little-endian 32-bit words over the same span as .mem
+            max_addr = self.highest_address()
+            text = b''
+            if max_addr is not None:
+                words = image[:max_addr + 1]
+                if sys.byteorder == 'big':
+                    words.byteswap()
+                text = bytes(4 * start_address) + words.tobytes()
+
+        with open(output_file, 'wb' if isinstance(text, bytes) else 'w') as f:
+            f.write(text)
 
         self.log(f"Output written successfully")
 
@@ -622,24 +1181,86 @@ def main():
     parser.add_argument('-o', '--output', type=str,
                         default='output.mem', help='Output file')
     parser.add_argument('-f', '--format', type=str,
-                        choices=['hex', 'bin', 'mem'], default='mem', help='Output format')
+                        choices=['hex', 'bin', 'mem', 'smem', 'raw'], default='mem', help='Output format')
     parser.add_argument('-v', '--verbose',
                         action='store_true', help='Verbose output')
     parser.add_argument('--start-address', type=lambda x: int(x,
                         0), default=0, help='Starting address')
     parser.add_argument('--hex', action='store_true', help='Treat all numbers as Hex by default')
+    parser.add_argument('--analyze', action='store_true',
+                        help='Report pipeline hazards, basic blocks and estimated CPI')
+    parser.add_argument('--peephole', action='store_true',
+                        help='Rewrite redundant sequences (JMP Rx macro, MOV Rx, Rx, dead LDM, ...)')
+    parser.add_argument('--schedule', action='store_true',
+                        help='Reorder instructions within basic blocks to avoid POP load-use hazards')
+    parser.add_argument('-c', '--object', action='store_true',
+                        help='Emit a relocatable object for linker.py (default output: <input>.obj)')
+    parser.add_argument('-i', '--incremental', action='store_true',
+                        help='Reuse the previous run kept in a sidecar cache file')
+    parser.add_argument('--cache', type=str, default=None,
+                        help='Sidecar cache for --incremental (default: <input_file>.cache)')
+    parser.add_argument('--index', action='store_true',
+                        help='Write the address-to-source index next to the output (<output>.idx)')
+    parser.add_argument('-l', '--listing', action='store_true',
+                        help='Write a side-by-side listing next to the output (<output>.lst)')
 
     args = parser.parse_args()
     assembler = Assembler(verbose=args.verbose, hex_mode=args.hex)
+    if args.object and (args.index or args.listing):
+        parser.error("--index/--listing describe a memory image; link the objects first")
+    if args.object and args.incremental:
+        parser.error("-c and --incremental cannot be combined")
+    if (args.peephole or args.schedule) and args.incremental:
+        parser.error("--peephole/--schedule and --incremental cannot be combined")
+    if args.peephole:
+        from peephole import peephole
+        assembler.optimizers.append(peephole)
+    if args.schedule:
+        from scheduler import schedule
+        assembler.optimizers.append(schedule)
+
+    if args.object:
+        ok = assembler.assemble_object(args.input_file)
+        if parser.get_default('output') == args.output:
+            args.output = os.path.splitext(args.input_file)[0] + '.obj'
+    elif args.incremental:
+        ok = assembler.assemble_incremental(args.input_file, args.cache)
+    else:
+        ok = assembler.assemble(args.input_file)
 
-    if assembler.assemble(args.input_file):
-        assembler.generate_output(args.output, args.format, args.start_address)
+    if ok:
+        if args.object:
+            assembler.generate_object(args.output, args.input_file)
+        else:
+            assembler.generate_output(args.output, args.format, args.start_address)
+        if args.index or args.listing:
+            from address_index import AddressIndex, index_path, listing
+            index = AddressIndex.from_assembler(assembler, args.input_file, args.start_address)
+            if args.index:
+                index.save(index_path(args.output))
+            if args.listing:
+                with open(args.input_file, 'r') as f:
+                    source_lines = f.readlines()
+                with open(os.path.splitext(args.output)[0] + '.lst', 'w') as f:
+                    f.write(listing(index, assembler.memory_image, source_lines))
         if args.verbose:
             assembler.print_symbol_table()
+        if args.analyze:
+            from analyzer import analyze_program, format_analysis
+            print(format_analysis(analyze_program(assembler)))
         print(f"\n[SUCCESS] Assembly successful!")
         print(f"  Input:  {args.input_file}")
         print(f"  Output: {args.output}")
         print(f"  Instructions: {len(assembler.instructions)}")
+        if args.object:
+            print(f"  Exports: {len(assembler.exports)}, imports: {len(assembler.imports)}, "
+                  f"relocations: {len(assembler.relocations)}")
+        for name, stats in assembler.optimization_stats.items():
+            print(f"  {name.capitalize()}: " + ", ".join(f"{k.replace('_', ' ')} {v}" for k, v in stats.items()))
+        if args.incremental:
+            stats = assembler.incremental_stats
+            layout = "full relayout" if stats['relayout'] else f"{stats['lines_changed']} line(s) changed"
+            print(f"  Incremental: {layout}, {stats['tokenized']} tokenized, {stats['encoded']} encoded")
     else:
         assembler.print_errors()
         sys.exit(1)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Batch Assembler
+Assembles many sources (globs and/or manifest files) in parallel on a pool
+of worker processes, writes each output in the requested format and reports
+every file's errors together at the end instead of stopping at the first.
+"""
+
+import os
+import sys
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from assembler import Assembler
+from simulator import guess_hex_mode
+from io_paths import OUTPUT_EXTENSIONS, collision_errors, expand_patterns, output_path
+
+
+# Jobs per message sent to a worker: small programs assemble in about a
+# millisecond, so batching keeps the pool's IPC from dominating
+DEFAULT_CHUNK = 4
+
+
+def read_manifest(manifest: str) -> List[Tuple[str, Optional[str]]]:
+    """
+    One source per line, `input [output]`; inputs may be globs and are
+    relative to the manifest. Blank lines and lines starting with # are skipped.
+    """
+    base = os.path.dirname(manifest)
+    entries = []
+    with open(manifest, 'r') as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            source = os.path.join(base, fields[0])
+            output = os.path.join(base, fields[1]) if len(fields) > 1 else None
+            if output:
+                entries.append((source, output))
+            else:
+                entries.extend((path, None) for path in expand_patterns([source]))
+    return entries
+
+
+def assemble_job(job: Tuple[str, str, str, int, Optional[bool]]) -> Dict:
+    """Worker: assemble one file and write its output; never raises"""
+    path, output, fmt, start_address, hex_mode = job
+    start = time.perf_counter()
+    try:
+        if hex_mode is None:
+            hex_mode = guess_hex_mode(path)
+        assembler = Assembler(hex_mode=hex_mode)
+        ok = assembler.assemble(path)
+        if ok:
+            assembler.generate_output(output, fmt, start_address)
+        errors = list(assembler.errors)
+        instructions = len(assembler.instructions)
+    except Exception as exc:
+        # Anything, including an assembler bug on one input, is that file's
+        # error: the rest of the batch and the report still complete
+        ok, errors, instructions = False, [f"{type(exc).__name__}: {exc}"], 0
+    return {
+        'input': path,
+        'output': output if ok else None,
+        'ok': ok,
+        'errors': errors,
+        'instructions': instructions,
+        'ms': round((time.perf_counter() - start) * 1000, 2),
+    }
+
+
+def assemble_batch(sources: List[Tuple[str, Optional[str]]], fmt: str = 'mem',
+                   start_address: int = 0, hex_mode: Optional[bool] = None,
+                   out_dir: Optional[str] = None, jobs: Optional[int] = None,
+                   chunksize: int = DEFAULT_CHUNK) -> List[Dict]:
+    """
+    Assemble (input, output-or-None) pairs; results come back in input order.
+    hex_mode None detects it per file. jobs=1 runs in this process.
+    Inputs that would write the same output (e.g. a/test.asm and b/test.asm
+    under one out_dir) all fail without being assembled.
+    """
+    work = [(path, output_path(path, fmt, output, out_dir), fmt, start_address, hex_mode)
+            for path, output in sources]
+    refused = collision_errors([(path, output) for path, output, *_ in work])
+    todo = [job for job in work if job[0] not in refused]
+    jobs = min(jobs or os.cpu_count() or 1, max(len(todo), 1))
+    if jobs == 1:
+        done = [assemble_job(job) for job in todo]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            done = list(pool.map(assemble_job, todo, chunksize=max(1, chunksize)))
+    done = iter(done)
+    return [{'input': path, 'output': None, 'ok': False, 'errors': [refused[path]],
+             'instructions': 0, 'ms': 0.0} if path in refused else next(done)
+            for path, *_ in work]
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="batch_assembler",
+        description="Assemble many programs in parallel and report all errors at the end"
+    )
+    parser.add_argument('inputs', nargs='*',
+                        help='Assembly files or glob patterns (quote globs)')
+    parser.add_argument('-m', '--manifest', action='append', default=[],
+                        help='File listing `input [output]` per line (repeatable)')
+    parser.add_argument('--out-dir', type=str,
+                        help='Directory for outputs (default: next to each source)')
+    parser.add_argument('-f', '--format', type=str,
+                        choices=list(OUTPUT_EXTENSIONS), default='mem', help='Output format')
+    parser.add_argument('--start-address', type=lambda x: int(x, 0), default=0,
+                        help='Starting address')
+    parser.add_argument('--hex', action='store_true',
+                        help='Treat all numbers as Hex (default: detect from the header comment)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Worker processes (default: number of CPUs)')
+    parser.add_argument('--chunk', type=int, default=DEFAULT_CHUNK,
+                        help=f'Files handed to a worker at a time (default: {DEFAULT_CHUNK})')
+    parser.add_argument('--json', type=str,
+                        help='Write the per-file results to this JSON file')
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help='Only print failures and the summary')
+
+    args = parser.parse_args()
+    sources = [(path, None) for path in expand_patterns(args.inputs)]
+    for manifest in args.manifest:
+        try:
+            sources.extend(read_manifest(manifest))
+        except OSError as exc:
+            print(f"ERROR: cannot read manifest {manifest}: {exc}")
+            sys.exit(1)
+    if not sources:
+        parser.error("no input files")
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    results = assemble_batch(sources, args.format, args.start_address,
+                             True if args.hex else None, args.out_dir,
+                             args.jobs, args.chunk)
+    elapsed = time.perf_counter() - start
+
+    failed = [r for r in results if not r['ok']]
+    if not args.quiet:
+        for r in results:
+            if r['ok']:
+                print(f"[OK]    {r['input']} -> {r['output']} ({r['instructions']} instructions)")
+    for r in failed:
+        print(f"[ERROR] {r['input']}:")
+        for err in r['errors']:
+            print(f"  {err}")
+
+    print(f"\n{len(results) - len(failed)}/{len(results)} assembled, {len(failed)} failed "
+          f"in {elapsed:.2f} s")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'seconds': elapsed, 'results': results}, f, indent=2)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
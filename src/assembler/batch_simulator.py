@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+"""
+Batched ISA Simulator for 5-Stage Pipelined RISC Processor
+Target: 32-bit Word Addressable Memory (18-bit Address Space)
+Steps N independent machines in lockstep with NumPy: every architectural
+register is an (N, ...) array and each iteration executes one instruction on
+every running machine, grouping machines by opcode (masking handles divergent
+control flow). Semantics are those of simulator.Simulator.
+Requires NumPy (the rest of the toolchain is standard library only).
+"""
+
+import sys
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Union
+
+import numpy as np
+
+from isa_constants import ISA
+from simulator import (ADDRESS_MASK, WORD_MASK, RESET_VECTOR, HARDWARE_INT_VECTOR,
+                       SOFTWARE_INT_BASE, load_program, parse_value_list)
+
+
+# Memory is paged: machines share one page table, and a page gets storage
+# (for every machine) the first time any machine writes to it. Unwritten
+# pages read as zero through slot 0, which is never written. Storage is
+# address-major, so machines in lockstep touch one contiguous line per access.
+PAGE_BITS = 10
+PAGE_WORDS = 1 << PAGE_BITS
+PAGE_MASK = PAGE_WORDS - 1
+PAGE_COUNT = ISA.MEMORY_WORDS >> PAGE_BITS
+
+NO_INTERRUPT = np.iinfo(np.int64).max
+
+Image = Union[Sequence[int], Dict[int, int]]
+
+
+def _opcode_table():
+    """Opcode -> (mnemonic, size) from the ISA tables; unused opcodes act as NOP"""
+    names = ['NOP'] * 32
+    for name, code in ISA.OPCODES.items():
+        names[code] = name
+    sizes = np.array([ISA.get_size(name) for name in names], dtype=np.int64)
+    return names, sizes
+
+
+OPCODE_NAMES, OPCODE_SIZES = _opcode_table()
+
+
+def _ragged(rows: Sequence[Sequence[int]], n: int, fill: int):
+    """Pack per-machine sequences into an (n, K) array plus their lengths"""
+    lengths = np.array([len(r) for r in rows], dtype=np.int64)
+    width = max(1, int(lengths.max()) if n else 1)
+    out = np.full((n, width), fill, dtype=np.int64)
+    for i, r in enumerate(rows):
+        if len(r):
+            out[i, :len(r)] = r
+    return out, lengths
+
+
+class BatchSimulator:
+    """
+    N machines, one program image each (or one image shared by all).
+    State: regs (N, 8), z/n/c (N,), pc/sp (N,), paged memory (slots * 1024, N),
+    IN streams (N, K), OUT buffers (N, capacity), instruction counts (N,).
+    """
+
+    def __init__(self, count: int, images: Union[Image, Sequence[Image], None] = None,
+                 in_ports: Optional[Sequence[Iterable[int]]] = None,
+                 interrupts: Optional[Sequence[Iterable[int]]] = None,
+                 verbose: bool = False):
+        self.count = count
+        self.verbose = verbose
+        self.rows = np.arange(count)
+
+        self.page_table = np.zeros(PAGE_COUNT, dtype=np.int64)
+        self.slots_used = 1
+        self._set_memory(np.zeros((4 * PAGE_WORDS, count), dtype=np.uint32))
+        if images is not None:
+            self.load_images(images)
+
+        self.set_inputs(in_ports or [[] for _ in range(count)])
+        self.interrupt_at, _ = _ragged([sorted(i) for i in (interrupts or [[]] * count)],
+                                       count, NO_INTERRUPT)
+        self.out_buf = np.zeros((count, 16), dtype=np.int64)
+        self.out_len = np.zeros(count, dtype=np.int64)
+
+        self._handlers = [getattr(self, f"_op_{name.lower()}") for name in OPCODE_NAMES]
+        self.reset()
+
+    def log(self, message: str):
+        if self.verbose:
+            print(f"[BATCH] {message}")
+
+    # ================= MEMORY =================
+
+    def _set_memory(self, memory: np.ndarray):
+        self.memory = memory
+        self._flat = memory.reshape(-1)
+
+    def _allocate(self, pages: np.ndarray):
+        """Give storage to pages that are about to be written"""
+        pages = np.unique(pages[self.page_table[pages] == 0])
+        if not len(pages):
+            return
+        needed = self.slots_used + len(pages)
+        capacity = self.memory.shape[0] // PAGE_WORDS
+        if needed > capacity:
+            grown = np.zeros((max(needed, 2 * capacity) * PAGE_WORDS, self.count),
+                             dtype=np.uint32)
+            grown[:self.memory.shape[0]] = self.memory
+            self._set_memory(grown)
+            self.log(f"Memory grown to {grown.shape[0] // PAGE_WORDS} pages per machine")
+        self.page_table[pages] = np.arange(self.slots_used, needed)
+        self.slots_used = needed
+
+    def _line(self, addr: np.ndarray) -> np.ndarray:
+        """Word address -> row of self.memory"""
+        return (self.page_table[addr >> PAGE_BITS] << PAGE_BITS) | (addr & PAGE_MASK)
+
+    def read(self, rows: np.ndarray, addr: np.ndarray) -> np.ndarray:
+        return self._flat.take(self._line(addr) * self.count + rows).astype(np.int64)
+
+    def write(self, rows: np.ndarray, addr: np.ndarray, values: np.ndarray):
+        self._allocate(addr >> PAGE_BITS)
+        self._flat[self._line(addr) * self.count + rows] = values
+
+    def load_images(self, images: Union[Image, Sequence[Image]]):
+        """
+        Load one image for every machine, or a sequence of N images.
+        An image is a word list starting at address 0 or an {address: word} dict.
+        """
+        def unpack(image):
+            if isinstance(image, dict):
+                addr = np.fromiter(image.keys(), dtype=np.int64, count=len(image)) & ADDRESS_MASK
+                words = np.fromiter(image.values(), dtype=np.int64, count=len(image))
+                return addr, words & WORD_MASK
+            words = np.asarray(image, dtype=np.int64)[:ISA.MEMORY_WORDS]
+            addr = np.nonzero(words)[0]
+            return addr, words[addr] & WORD_MASK
+
+        if isinstance(images, dict) or (len(images) and isinstance(images[0], int)):
+            addr, words = unpack(images)
+            self._allocate(addr >> PAGE_BITS)
+            self.memory[self._line(addr)] = words[:, None]
+            return
+        if len(images) != self.count:
+            raise ValueError(f"Expected {self.count} images, got {len(images)}")
+        for i, image in enumerate(images):
+            addr, words = unpack(image)
+            if len(addr):
+                self.write(np.full(len(addr), i), addr, words)
+
+    def set_inputs(self, in_ports: Sequence[Iterable[int]]):
+        """Values returned by successive IN instructions, per machine (0 once exhausted)"""
+        rows = [[v & WORD_MASK for v in values] for values in in_ports]
+        if len(rows) != self.count:
+            raise ValueError(f"Expected {self.count} input streams, got {len(rows)}")
+        self.in_buf, self.in_len = _ragged(rows, self.count, 0)
+        self.in_pos = np.zeros(self.count, dtype=np.int64)
+
+    # ================= STATE =================
+
+    def reset(self):
+        n = self.count
+        self.regs = np.zeros((n, 8), dtype=np.int64)
+        self.z = np.zeros(n, dtype=np.int64)
+        self.n = np.zeros(n, dtype=np.int64)
+        self.c = np.zeros(n, dtype=np.int64)
+        self.sp = np.full(n, ISA.INITIAL_SP, dtype=np.int64)
+        self.pc = self.read(self.rows, np.full(n, RESET_VECTOR)) & ADDRESS_MASK
+        self.halted = np.zeros(n, dtype=bool)
+        self.instructions_executed = np.zeros(n, dtype=np.int64)
+        self.interrupt_pos = np.zeros(n, dtype=np.int64)
+        self.out_len[:] = 0
+        self.in_pos[:] = 0
+
+    def outputs(self, machine: int) -> List[int]:
+        return self.out_buf[machine, :self.out_len[machine]].tolist()
+
+    def registers(self, machine: int) -> List[int]:
+        return self.regs[machine].tolist()
+
+    def ccr(self) -> np.ndarray:
+        """Flags packed as in ccr.vhd: [2]=Z, [1]=N, [0]=C"""
+        return (self.z << 2) | (self.n << 1) | self.c
+
+    def _ix(self, rows: np.ndarray):
+        """Index for (N,) state arrays: a slice when every machine is selected"""
+        return slice(None) if rows is self.rows else rows
+
+    def _push(self, rows: np.ndarray, values: np.ndarray):
+        self.write(rows, self.sp[self._ix(rows)], values)
+        self.sp[self._ix(rows)] = (self.sp[self._ix(rows)] - 1) & ADDRESS_MASK
+
+    def _pop(self, rows: np.ndarray) -> np.ndarray:
+        sp = self.sp[self._ix(rows)]
+        sp = np.where(sp < ISA.INITIAL_SP, sp + 1, sp)
+        self.sp[self._ix(rows)] = sp
+        return self.read(rows, sp)
+
+    def _take_interrupts(self, running: np.ndarray) -> np.ndarray:
+        """Hardware interrupts due before this step; returns rows that took one"""
+        due = self.interrupt_at[self.rows, np.minimum(self.interrupt_pos,
+                                                     self.interrupt_at.shape[1] - 1)]
+        due = running & (due <= self.instructions_executed) & \
+            (self.interrupt_pos < self.interrupt_at.shape[1])
+        rows = np.nonzero(due)[0]
+        if len(rows):
+            self._push(rows, self.ccr()[self._ix(rows)])
+            self._push(rows, self.pc[self._ix(rows)])
+            self.pc[self._ix(rows)] = self.read(rows, np.full(len(rows), HARDWARE_INT_VECTOR)) & ADDRESS_MASK
+            self.interrupt_pos[rows] += 1
+        return due
+
+    # ================= EXECUTION =================
+
+    def run(self, max_instructions: int = 1_000_000) -> int:
+        """
+        Step every machine until it halts or has executed max_instructions.
+        Returns the number of lockstep iterations.
+        """
+        steps = 0
+        has_interrupts = bool((self.interrupt_at != NO_INTERRUPT).any())
+        while True:
+            running = ~self.halted & (self.instructions_executed < max_instructions)
+            if not running.any():
+                break
+            if has_interrupts:
+                # A machine taking an interrupt executes nothing this step
+                running &= ~self._take_interrupts(running)
+            rows = self.rows if running.all() else np.nonzero(running)[0]
+            if len(rows):
+                self.step(rows)
+                steps += 1
+        return steps
+
+    def step(self, rows: Optional[np.ndarray] = None):
+        """Execute one instruction on each machine in `rows` (default: all running)"""
+        if rows is None:
+            rows = np.nonzero(~self.halted)[0]
+        # Plain slices are much cheaper than fancy indexing when every machine runs
+        index = slice(None) if rows is self.rows else rows
+        pc = self.pc[index].copy()
+        w = self.read(rows, pc)
+        op = w >> 27
+        self.instructions_executed[index] += 1
+        # Default fall-through; branch handlers overwrite it
+        self.pc[index] = (pc + OPCODE_SIZES[op]) & ADDRESS_MASK
+
+        if len(rows) and (op == op[0]).all():
+            # Lockstep: one opcode for every machine
+            self._handlers[int(op[0])](rows, pc, (w >> 24) & 7, (w >> 21) & 7, (w >> 18) & 7)
+            return
+        for code in np.unique(op):
+            sel = op == code
+            sub_w = w[sel]
+            self._handlers[int(code)](rows[sel], pc[sel], (sub_w >> 24) & 7,
+                                      (sub_w >> 21) & 7, (sub_w >> 18) & 7)
+
+    def _imm(self, rows, pc):
+        return self.read(rows, (pc + 1) & ADDRESS_MASK)
+
+    def _set_zn(self, rows, r):
+        self.z[self._ix(rows)] = r == 0
+        self.n[self._ix(rows)] = r >> 31
+
+    # ----- Instruction handlers: (rows, pc, r1, r2, r3) -----
+
+    def _op_nop(self, rows, pc, r1, r2, r3):
+        pass
+
+    def _op_hlt(self, rows, pc, r1, r2, r3):
+        self.halted[self._ix(rows)] = True
+        self.pc[self._ix(rows)] = pc
+
+    def _op_setc(self, rows, pc, r1, r2, r3):
+        self.c[self._ix(rows)] = 1
+
+    def _op_not(self, rows, pc, r1, r2, r3):
+        r = self.regs[rows, r2] ^ WORD_MASK
+        self.regs[rows, r1] = r
+        self._set_zn(rows, r)
+        self.c[self._ix(rows)] = 0
+
+    def _op_inc(self, rows, pc, r1, r2, r3):
+        self._add(rows, r1, self.regs[rows, r2], 1)
+
+    def _op_out(self, rows, pc, r1, r2, r3):
+        pos = self.out_len[self._ix(rows)]
+        if len(pos) and pos.max() >= self.out_buf.shape[1]:
+            grown = np.zeros((self.count, 2 * self.out_buf.shape[1]), dtype=np.int64)
+            grown[:, :self.out_buf.shape[1]] = self.out_buf
+            self.out_buf = grown
+        self.out_buf[rows, pos] = self.regs[rows, r2]
+        self.out_len[self._ix(rows)] = pos + 1
+
+    def _op_in(self, rows, pc, r1, r2, r3):
+        pos = self.in_pos[self._ix(rows)]
+        value = self.in_buf[rows, np.minimum(pos, self.in_buf.shape[1] - 1)]
+        self.regs[rows, r1] = np.where(pos < self.in_len[self._ix(rows)], value, 0)
+        self.in_pos[self._ix(rows)] = pos + 1
+
+    def _op_mov(self, rows, pc, r1, r2, r3):
+        self.regs[rows, r1] = self.regs[rows, r2]
+
+    def _op_swap(self, rows, pc, r1, r2, r3):
+        t = self.regs[rows, r2]
+        self.regs[rows, r1] = self.regs[rows, r3]
+        self.regs[rows, r3] = t
+
+    def _add(self, rows, rd, a, b):
+        r = a + b
+        self.c[self._ix(rows)] = r >> 32
+        r &= WORD_MASK
+        self.regs[rows, rd] = r
+        self._set_zn(rows, r)
+
+    def _op_add(self, rows, pc, r1, r2, r3):
+        self._add(rows, r1, self.regs[rows, r2], self.regs[rows, r3])
+
+    def _op_sub(self, rows, pc, r1, r2, r3):
+        a, b = self.regs[rows, r2], self.regs[rows, r3]
+        r = (a - b) & WORD_MASK
+        self.c[self._ix(rows)] = a < b
+        self.regs[rows, r1] = r
+        self._set_zn(rows, r)
+
+    def _op_and(self, rows, pc, r1, r2, r3):
+        r = self.regs[rows, r2] & self.regs[rows, r3]
+        self.regs[rows, r1] = r
+        self._set_zn(rows, r)
+        self.c[self._ix(rows)] = 0
+
+    def _op_iadd(self, rows, pc, r1, r2, r3):
+        self._add(rows, r1, self.regs[rows, r2], self._imm(rows, pc))
+
+    def _op_push(self, rows, pc, r1, r2, r3):
+        self._push(rows, self.regs[rows, r3])
+
+    def _op_pop(self, rows, pc, r1, r2, r3):
+        self.regs[rows, r1] = self._pop(rows)
+
+    def _op_ldm(self, rows, pc, r1, r2, r3):
+        self.regs[rows, r1] = self._imm(rows, pc)
+
+    def _op_ldd(self, rows, pc, r1, r2, r3):
+        addr = (self.regs[rows, r2] + self._imm(rows, pc)) & ADDRESS_MASK
+        self.regs[rows, r1] = self.read(rows, addr)
+
+    def _op_std(self, rows, pc, r1, r2, r3):
+        addr = (self.regs[rows, r2] + self._imm(rows, pc)) & ADDRESS_MASK
+        self.write(rows, addr, self.regs[rows, r3])
+
+    def _jump_if(self, rows, pc, flag: np.ndarray):
+        taken = flag[rows] != 0
+        rows, pc = rows[taken], pc[taken]
+        flag[rows] = 0
+        self.pc[self._ix(rows)] = self._imm(rows, pc) & ADDRESS_MASK
+
+    def _op_jz(self, rows, pc, r1, r2, r3):
+        self._jump_if(rows, pc, self.z)
+
+    def _op_jn(self, rows, pc, r1, r2, r3):
+        self._jump_if(rows, pc, self.n)
+
+    def _op_jc(self, rows, pc, r1, r2, r3):
+        self._jump_if(rows, pc, self.c)
+
+    def _op_jmp(self, rows, pc, r1, r2, r3):
+        self.pc[self._ix(rows)] = self._imm(rows, pc) & ADDRESS_MASK
+
+    def _op_call(self, rows, pc, r1, r2, r3):
+        self._push(rows, (pc + 2) & ADDRESS_MASK)
+        self.pc[self._ix(rows)] = self._imm(rows, pc) & ADDRESS_MASK
+
+    def _op_ret(self, rows, pc, r1, r2, r3):
+        self.pc[self._ix(rows)] = self._pop(rows) & ADDRESS_MASK
+
+    def _op_int(self, rows, pc, r1, r2, r3):
+        self._push(rows, self.ccr()[self._ix(rows)])
+        self._push(rows, (pc + 2) & ADDRESS_MASK)
+        vector = (self._imm(rows, pc) + SOFTWARE_INT_BASE) & ADDRESS_MASK
+        self.pc[self._ix(rows)] = self.read(rows, vector) & ADDRESS_MASK
+
+    def _op_rti(self, rows, pc, r1, r2, r3):
+        self.pc[self._ix(rows)] = self._pop(rows) & ADDRESS_MASK
+        flags = self._pop(rows)
+        self.z[self._ix(rows)] = (flags >> 2) & 1
+        self.n[self._ix(rows)] = (flags >> 1) & 1
+        self.c[self._ix(rows)] = flags & 1
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="batch_simulator",
+        description="Run one program on many machines in lockstep (NumPy)"
+    )
+    parser.add_argument('input_file', type=str,
+                        help='Program to run (.asm is assembled first; .smem, .raw or .mem images are loaded)')
+    parser.add_argument('-N', '--machines', type=int, default=1024,
+                        help='Number of machines (default: 1024)')
+    parser.add_argument('--hex', action='store_true',
+                        help='Treat all numbers as Hex by default (auto-detected otherwise)')
+    parser.add_argument('--in', dest='in_values', type=str, default='',
+                        help='Comma separated IN values; machine i gets each value + i')
+    parser.add_argument('-n', '--max-instructions', type=int, default=100_000,
+                        help='Per-machine instruction limit (default: 100000)')
+    parser.add_argument('--compare', action='store_true',
+                        help='Also run the scalar simulator on every machine and check results')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Verbose output')
+
+    args = parser.parse_args()
+    try:
+        memory = load_program(args.input_file, True if args.hex else None)
+    except (OSError, ValueError) as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+
+    base = parse_value_list(args.in_values, args.hex)
+    in_ports = [[v + i for v in base] for i in range(args.machines)]
+    image = {addr: word for addr, word in enumerate(memory) if word}
+
+    start = time.perf_counter()
+    batch = BatchSimulator(args.machines, image, in_ports, verbose=args.verbose)
+    steps = batch.run(args.max_instructions)
+    elapsed = time.perf_counter() - start
+    total = int(batch.instructions_executed.sum())
+    print(f"{args.machines} machines, {steps} steps, {int(batch.halted.sum())} halted")
+    print(f"[BATCH] {total} instructions in {elapsed * 1000:.2f} ms "
+          f"({total / elapsed / 1e6:.2f} M instr/s aggregate)")
+
+    if args.compare:
+        from simulator import Simulator
+        start = time.perf_counter()
+        mismatches = 0
+        for i in range(args.machines):
+            sim = Simulator(memory, in_ports[i], translate=False)
+            sim.run(args.max_instructions)
+            if (sim.out_port != batch.outputs(i) or sim.regs != batch.registers(i)
+                    or sim.pc != batch.pc[i] or sim.halted != batch.halted[i]):
+                mismatches += 1
+        elapsed = time.perf_counter() - start
+        print(f"[SCALAR] {total} instructions in {elapsed * 1000:.2f} ms "
+              f"({total / elapsed / 1e6:.2f} M instr/s), {mismatches} mismatch(es)")
+
+
+if __name__ == "__main__":
+    main()
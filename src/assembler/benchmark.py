@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Assembler Benchmark Suite
+Generates synthetic programs of configurable size and mix (labels, .DW
+blocks, forward references, .ORG gaps) up to the full 18-bit address space,
+times each assembler phase and writes the results as JSON so runs from
+different commits can be compared.
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import random
+import platform
+import tempfile
+import subprocess
+from typing import Dict, List, Optional
+from isa_constants import ISA
+from assembler import Assembler
+
+
+OUTPUT_FORMATS = ('hex', 'bin', 'mem', 'smem', 'raw')
+
+# Phases in report order; output_<fmt> is generate_output() for that format
+PHASES = ('tokenize', 'first_pass', 'second_pass') + tuple(f'output_{fmt}' for fmt in OUTPUT_FORMATS)
+
+# Largest single item the generator emits (a 2-word instruction)
+_MAX_ITEM_WORDS = 2
+
+
+# ===== Program generator =====
+
+def generate_program(words: int = ISA.MEMORY_WORDS, label_density: float = 0.05,
+                     dw_fraction: float = 0.05, forward_fraction: float = 0.5,
+                     org_gap_every: int = 0, org_gap_words: int = 64,
+                     seed: int = 1) -> List[str]:
+    """
+    Build a random but valid program occupying about `words` words.
+
+    label_density:    chance that an instruction is preceded by a new label
+    dw_fraction:      share of emitted words that live in .DW blocks
+    forward_fraction: share of branches/.DW label references that point forward
+    org_gap_every:    insert a `.ORG` skipping `org_gap_words` words every this
+                      many words (0 disables gaps)
+    """
+    words = max(0x20, min(words, ISA.MEMORY_WORDS))
+    rng = random.Random(seed)
+    reg = lambda: f"R{rng.randrange(8)}"
+    one_reg = ('NOT', 'INC', 'OUT', 'IN', 'PUSH', 'POP')
+    branches = ('JZ', 'JN', 'JC', 'JMP', 'CALL')
+
+    # Reset vector, then code from 0x10
+    lines = ['.ORG 0', '    .DW START', '.ORG 0x10', 'START:']
+    address = 0x10
+    next_gap = address + org_gap_every if org_gap_every > 0 else words
+    labels = 0          # Labels L0 .. L<labels-1> are defined
+    referenced = -1     # Highest label number referenced so far
+
+    def label_ref() -> str:
+        nonlocal referenced
+        if labels and rng.random() >= forward_fraction:
+            target = rng.randrange(labels)
+        else:
+            target = labels + rng.randrange(1, 16)
+            referenced = max(referenced, target)
+        return f"L{target}"
+
+    # Leave room for the final HLT
+    while address + _MAX_ITEM_WORDS < words - 1:
+        if address >= next_gap:
+            gap = min(org_gap_words, words - 1 - _MAX_ITEM_WORDS - address)
+            if gap > 0:
+                address += gap
+                lines.append(f".ORG 0x{address:05X}")
+            next_gap = address + org_gap_every
+            continue
+
+        if rng.random() < label_density:
+            lines.append(f"L{labels}:")
+            labels += 1
+
+        if rng.random() < dw_fraction:
+            count = min(rng.randrange(8, 64), words - 1 - _MAX_ITEM_WORDS - address)
+            if count <= 0:
+                break
+            values = [label_ref() if rng.random() < 0.25 else f"0x{rng.getrandbits(32):08X}"
+                      for _ in range(count)]
+            for i in range(0, count, 8):
+                lines.append("    .DW " + ", ".join(values[i:i + 8]))
+            address += count
+            continue
+
+        kind = rng.randrange(11)
+        if kind == 0:
+            lines.append(f"    ADD {reg()}, {reg()}, {reg()}   ; add")
+        elif kind == 1:
+            lines.append(f"    {rng.choice(one_reg)} {reg()}")
+        elif kind == 2:
+            lines.append(f"    LDM {reg()}, {rng.randrange(-30000, 30000)}  # imm")
+        elif kind == 3:
+            lines.append(f"    LDD {reg()}, {rng.randrange(0, 200)}({reg()})")
+        elif kind == 4:
+            lines.append(f"    STD {reg()}, 0x{rng.randrange(0, 200):X}({reg()}) // store")
+        elif kind == 5:
+            lines.append(f"    {rng.choice(branches)} {label_ref()}")
+        elif kind == 6:
+            lines.append(f"    IADD {reg()}, {reg()}, {rng.randrange(0, 100)}")
+        elif kind == 7:
+            lines.append(f"    MOV {reg()}, {reg()}")
+        elif kind == 8:
+            lines.append(f"    SWAP {reg()}, {reg()}")
+        elif kind == 9:
+            lines.append(f"    SUB {reg()}, {reg()}, {reg()}")
+        else:
+            lines.append("    NOP")
+        address += ISA.INSTRUCTION_SIZES[lines[-1].split()[0]]
+
+    # Define every forward-referenced label that was never reached
+    for n in range(labels, referenced + 1):
+        lines.append(f"L{n}:")
+    lines.append("    HLT")
+    return [line + "\n" for line in lines]
+
+
+# ===== Phase timing =====
+
+def time_phases(lines: List[str], hex_mode: bool = False, repeat: int = 3,
+                out_dir: Optional[str] = None) -> Dict:
+    """
+    Time each assembler phase on `lines`, keeping the best of `repeat` runs.
+    The passes run with the cyclic GC paused, as Assembler.assemble() does.
+    """
+    best = {phase: float('inf') for phase in PHASES}
+    assembler = None
+
+    with tempfile.TemporaryDirectory(dir=out_dir) as tmp:
+        for _ in range(repeat):
+            gc.collect()
+            gc_was_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                tokenizer = Assembler(hex_mode=hex_mode)
+                tokenize_line = tokenizer.tokenize_line
+                start = time.perf_counter()
+                for line in lines:
+                    tokenize_line(line)
+                best['tokenize'] = min(best['tokenize'], time.perf_counter() - start)
+
+                assembler = Assembler(hex_mode=hex_mode)
+                start = time.perf_counter()
+                assembler.first_pass(lines)
+                best['first_pass'] = min(best['first_pass'], time.perf_counter() - start)
+                if assembler.errors:
+                    raise ValueError(f"benchmark program failed to assemble: {assembler.errors[0]}")
+
+                start = time.perf_counter()
+                assembler.second_pass()
+                best['second_pass'] = min(best['second_pass'], time.perf_counter() - start)
+                if assembler.errors:
+                    raise ValueError(f"benchmark program failed to assemble: {assembler.errors[0]}")
+            finally:
+                if gc_was_enabled:
+                    gc.enable()
+
+            for fmt in OUTPUT_FORMATS:
+                path = os.path.join(tmp, f"out.{fmt}")
+                start = time.perf_counter()
+                assembler.generate_output(path, fmt)
+                best[f'output_{fmt}'] = min(best[f'output_{fmt}'], time.perf_counter() - start)
+
+    words = sum(len(instr.machine_code) for instr in assembler.instructions)
+    return {
+        'lines': len(lines),
+        'instructions': len(assembler.instructions),
+        'labels': len(assembler.symbol_table),
+        'words': words,
+        'seconds': best,
+    }
+
+
+def git_revision() -> Optional[str]:
+    """Commit of the working tree the benchmark runs from, if available"""
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def format_results_table(results: List[Dict], baseline: Optional[Dict] = None) -> str:
+    """One row per program, one column (ms) per phase; ratios vs baseline if given"""
+    old_rows = {}
+    if baseline:
+        old_rows = {row['name']: row for row in baseline.get('results', [])}
+
+    header = f"{'Program':<16s} {'Lines':>8s} {'Words':>8s}" + "".join(f" {p:>12s}" for p in PHASES)
+    rows = [header, "-" * len(header)]
+    for row in results:
+        cells = f"{row['name']:<16s} {row['lines']:>8d} {row['words']:>8d}"
+        old = old_rows.get(row['name'])
+        for phase in PHASES:
+            ms = row['seconds'][phase] * 1000
+            if old and old['seconds'].get(phase):
+                cells += f" {old['seconds'][phase] / row['seconds'][phase]:>11.2f}x"
+            else:
+                cells += f" {ms:>12.1f}"
+        rows.append(cells)
+    return "\n".join(rows)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="benchmark",
+        description="Time assembler phases on synthetic programs and write JSON results"
+    )
+    parser.add_argument('--words', type=str, default=f"4096,65536,{ISA.MEMORY_WORDS}",
+                        help=f'Comma separated program sizes in words (max {ISA.MEMORY_WORDS})')
+    parser.add_argument('--labels', type=float, default=0.05,
+                        help='Chance of a label before each instruction (default: 0.05)')
+    parser.add_argument('--dw', type=float, default=0.05,
+                        help='Share of words emitted as .DW blocks (default: 0.05)')
+    parser.add_argument('--forward', type=float, default=0.5,
+                        help='Share of label references that point forward (default: 0.5)')
+    parser.add_argument('--org-gap', type=lambda x: int(x, 0), default=0,
+                        help='Insert a .ORG gap every N words (default: 0, no gaps)')
+    parser.add_argument('--gap-words', type=lambda x: int(x, 0), default=64,
+                        help='Words skipped by each .ORG gap (default: 64)')
+    parser.add_argument('--seed', type=int, default=1, help='Generator seed')
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help='Runs per program; the best time is kept (default: 3)')
+    parser.add_argument('-o', '--output', type=str, default='benchmark.json',
+                        help='JSON results file (default: benchmark.json)')
+    parser.add_argument('--compare', type=str,
+                        help='Earlier JSON results; print speedups against it')
+    parser.add_argument('--save-asm', type=str,
+                        help='Directory to write the generated programs to')
+
+    args = parser.parse_args()
+    try:
+        sizes = [int(w, 0) for w in args.words.split(',') if w.strip()]
+    except ValueError:
+        print(f"ERROR: invalid --words list '{args.words}'")
+        sys.exit(1)
+
+    baseline = None
+    if args.compare:
+        try:
+            with open(args.compare) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as exc:
+            print(f"ERROR: cannot read {args.compare}: {exc}")
+            sys.exit(1)
+
+    results = []
+    for words in sizes:
+        name = f"w{words}"
+        lines = generate_program(words, args.labels, args.dw, args.forward,
+                                 args.org_gap, args.gap_words, args.seed)
+        if args.save_asm:
+            os.makedirs(args.save_asm, exist_ok=True)
+            with open(os.path.join(args.save_asm, f"{name}.asm"), 'w') as f:
+                f.writelines(lines)
+        try:
+            row = time_phases(lines, repeat=args.repeat)
+        except ValueError as exc:
+            print(f"ERROR: {name}: {exc}")
+            sys.exit(1)
+        row['name'] = name
+        results.append(row)
+        print(f"[BENCH] {name}: {row['lines']} lines, "
+              f"{sum(row['seconds'].values()) * 1000:.1f} ms total")
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'config': {
+            'labels': args.labels, 'dw': args.dw, 'forward': args.forward,
+            'org_gap': args.org_gap, 'gap_words': args.gap_words,
+            'seed': args.seed, 'repeat': args.repeat,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print()
+    print(format_results_table(results, baseline))
+    if baseline:
+        print(f"\n(speedup vs {args.compare}, revision {baseline.get('revision')})")
+    else:
+        print(f"\n(milliseconds, best of {args.repeat})")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
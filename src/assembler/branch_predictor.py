@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Trace-Driven Branch Predictor Evaluation
+Records branch traces (PC, opcode, taken, target) by running programs on the
+functional simulator and replays them against configurable predictors: table
+size, index hash (PC, folded XOR, gshare), 1-bit or 2-bit counters, global
+history and a BTB for return targets. Reports the misprediction rate and the
+flush cycles each configuration would cost, with many configurations replayed
+in parallel on a pool of worker processes.
+Requires NumPy for the trace files (.npz).
+"""
+
+import os
+import sys
+import glob
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from isa_constants import ISA
+from simulator import Simulator, load_program, guess_hex_mode, parse_value_list
+
+
+_OP = ISA.OPCODES
+CONDITIONAL_OPCODES = (_OP['JZ'], _OP['JN'], _OP['JC'])
+RETURN_OPCODES = (_OP['RET'], _OP['RTI'])
+
+# Flush costs measured on pipeline.py: a conditional branch resolves in
+# execute, so every misprediction (either direction) flushes two slots; a
+# return pops its target in the memory stage and costs three
+MISPREDICT_COST = 2
+RETURN_COST = 3
+
+# branch_predictor.vhd counter states (reset: WEAKLY_NOT_TAKEN)
+STRONGLY_NOT_TAKEN, WEAKLY_NOT_TAKEN, WEAKLY_TAKEN, STRONGLY_TAKEN = range(4)
+
+INDEX_MODES = ('pc', 'xor', 'gshare')
+STATIC_POLICIES = ('not_taken', 'btfn')
+
+
+# ========== TRACES ==========
+
+class BranchTrace:
+    """Control transfers of one run, as parallel NumPy columns"""
+
+    def __init__(self, name: str, pc, opcode, taken, target, instructions: int):
+        self.name = name
+        self.pc = np.asarray(pc, dtype=np.uint32)
+        self.opcode = np.asarray(opcode, dtype=np.uint8)
+        self.taken = np.asarray(taken, dtype=np.uint8)
+        self.target = np.asarray(target, dtype=np.uint32)
+        self.instructions = instructions
+
+    def __len__(self) -> int:
+        return len(self.pc)
+
+    @property
+    def conditional(self) -> int:
+        return int(np.isin(self.opcode, CONDITIONAL_OPCODES).sum())
+
+    def save(self, path: str):
+        np.savez_compressed(path, pc=self.pc, opcode=self.opcode, taken=self.taken,
+                            target=self.target, instructions=self.instructions,
+                            name=self.name)
+
+    @classmethod
+    def load(cls, path: str) -> 'BranchTrace':
+        with np.load(path) as data:
+            return cls(str(data['name']), data['pc'], data['opcode'], data['taken'],
+                       data['target'], int(data['instructions']))
+
+
+def record_trace(path: str, in_values: Sequence[int] = (), max_instructions: int = 10_000_000,
+                 hex_mode: Optional[bool] = None, interrupts: Sequence[int] = ()) -> BranchTrace:
+    """Run a program (.asm, .mem, .smem or .raw) and keep every control transfer"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    return trace_program(load_program(path, hex_mode), name, in_values, max_instructions, interrupts)
+
+
+def trace_program(memory: List[int], name: str, in_values: Sequence[int] = (),
+                  max_instructions: int = 10_000_000, interrupts: Sequence[int] = ()) -> BranchTrace:
+    """record_trace for a memory image that is already loaded"""
+    sim = Simulator(memory, in_values)
+    sim.branch_trace = []
+    for at in interrupts:
+        sim.schedule_interrupt(at)
+    executed = sim.run(max_instructions)
+    if not sim.branch_trace:
+        return BranchTrace(name, [], [], [], [], executed)
+    pc, opcode, taken, target = zip(*sim.branch_trace)
+    return BranchTrace(name, pc, opcode, taken, target, executed)
+
+
+# ========== PREDICTORS ==========
+
+@dataclass(frozen=True)
+class PredictorConfig:
+    """
+    One predictor design. entries=0 is a static predictor (`static` policy:
+    not_taken, or btfn = backward taken / forward not taken). strong_only
+    redirects only from the strong taken state, like the RTL's use of
+    TreatConditionalAsUnconditional; btb_entries > 0 adds a direct-mapped,
+    tagged BTB that predicts RET/RTI targets (other targets are in the
+    instruction's immediate word).
+    """
+    name: str = ''
+    entries: int = 4
+    counter_bits: int = 2
+    index: str = 'pc'
+    history_bits: int = 0
+    btb_entries: int = 0
+    strong_only: bool = False
+    static: str = 'not_taken'
+
+    @property
+    def label(self) -> str:
+        if self.name:
+            return self.name
+        if not self.entries:
+            text = f"static-{self.static}"
+        else:
+            text = f"{self.entries}x{self.counter_bits}b-{self.index}"
+            if self.index == 'gshare':
+                text += f"{self.history_bits}"
+            if self.strong_only:
+                text += "-strong"
+        return text + (f"+btb{self.btb_entries}" if self.btb_entries else "")
+
+    def validate(self):
+        """ValueError for a design the replay cannot model"""
+        if self.entries < 0 or self.entries & (self.entries - 1):
+            raise ValueError(f"entries must be 0 or a power of two, got {self.entries}")
+        if self.btb_entries < 0 or self.btb_entries & (self.btb_entries - 1):
+            raise ValueError(f"btb must be 0 or a power of two, got {self.btb_entries}")
+        if self.counter_bits not in (1, 2):
+            raise ValueError(f"bits must be 1 or 2, got {self.counter_bits}")
+        if self.index not in INDEX_MODES:
+            raise ValueError(f"index must be one of {', '.join(INDEX_MODES)}, got '{self.index}'")
+        if self.static not in STATIC_POLICIES:
+            raise ValueError(f"static must be one of {', '.join(STATIC_POLICIES)}, got '{self.static}'")
+        if self.history_bits < 0 or (self.history_bits and self.index != 'gshare'):
+            raise ValueError("history bits need index=gshare")
+
+
+# What the hardware does today: branch_predictor.vhd's table is unused and
+# conditional branches are predicted not taken
+STATIC_NOT_TAKEN = PredictorConfig(name='static', entries=0)
+# branch_predictor.vhd if it were wired in: 4 entries, PC(1 downto 0), 2-bit
+RTL_PREDICTOR = PredictorConfig(name='rtl', entries=4, counter_bits=2, index='pc', strong_only=True)
+
+
+def parse_config(spec: str) -> PredictorConfig:
+    """'entries=64,bits=2,index=gshare,history=6,btb=16,strong,name=x' -> PredictorConfig"""
+    keys = {'entries': 'entries', 'bits': 'counter_bits', 'index': 'index',
+            'history': 'history_bits', 'btb': 'btb_entries', 'static': 'static', 'name': 'name'}
+    fields: Dict = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        key, sep, value = item.partition('=')
+        if key == 'strong' and not sep:
+            fields['strong_only'] = True
+        elif key in keys and sep:
+            fields[keys[key]] = value if key in ('index', 'static', 'name') else int(value, 0)
+        else:
+            raise ValueError(f"unknown predictor setting '{item}'")
+    if 'static' in fields and 'entries' not in fields:
+        fields['entries'] = 0
+    config = PredictorConfig(**fields)
+    config.validate()
+    return config
+
+
+def default_sweep() -> List[PredictorConfig]:
+    """Baselines plus table size x counter width x index hash, with and without a BTB"""
+    configs = [STATIC_NOT_TAKEN, PredictorConfig(entries=0, static='btfn'), RTL_PREDICTOR]
+    for btb in (0, 16):
+        for entries in (4, 16, 64, 256):
+            for bits in (1, 2):
+                configs.append(PredictorConfig(entries=entries, counter_bits=bits, btb_entries=btb))
+                configs.append(PredictorConfig(entries=entries, counter_bits=bits, index='xor',
+                                               btb_entries=btb))
+                for history in (4, 8):
+                    configs.append(PredictorConfig(entries=entries, counter_bits=bits, index='gshare',
+                                                   history_bits=history, btb_entries=btb))
+    return configs
+
+
+def replay(trace: BranchTrace, config: PredictorConfig,
+           missed: Optional[bytearray] = None) -> Dict:
+    """
+    Run one trace through one predictor. Tables update as soon as a branch
+    resolves (the RTL updates from execute, one or two branches later at most).
+    `missed`, if given (len(trace) bytes), gets 1 at every mispredicted
+    branch and missed return target.
+    """
+    pcs = trace.pc.tolist()
+    opcodes = trace.opcode.tolist()
+    takens = trace.taken.tolist()
+    targets = trace.target.tolist()
+
+    entries = config.entries
+    mask = entries - 1
+    shift = max(entries.bit_length() - 1, 1)
+    index_mode = config.index
+    history = 0
+    history_mask = (1 << config.history_bits) - 1
+    two_bit = config.counter_bits == 2
+    threshold = STRONGLY_TAKEN if config.strong_only and two_bit else WEAKLY_TAKEN
+    table = [WEAKLY_NOT_TAKEN if two_bit else 0] * max(entries, 1)
+    btfn = config.static == 'btfn'
+    btb_mask = config.btb_entries - 1
+    btb_tags = [-1] * max(config.btb_entries, 1)
+    btb_targets = [0] * max(config.btb_entries, 1)
+
+    conditional = mispredicts = taken_count = 0
+    returns = return_misses = 0
+    for i, (pc, op, taken, target) in enumerate(zip(pcs, opcodes, takens, targets)):
+        if op in CONDITIONAL_OPCODES:
+            conditional += 1
+            taken_count += taken
+            if not entries:
+                predicted = btfn and target <= pc
+            else:
+                if index_mode == 'pc':
+                    slot = pc & mask
+                elif index_mode == 'xor':
+                    slot = (pc ^ (pc >> shift)) & mask
+                else:
+                    slot = (pc ^ history) & mask
+                state = table[slot]
+                if two_bit:
+                    predicted = state >= threshold
+                    if taken:
+                        if state < STRONGLY_TAKEN:
+                            table[slot] = state + 1
+                    elif state > STRONGLY_NOT_TAKEN:
+                        table[slot] = state - 1
+                else:
+                    predicted = state == 1
+                    table[slot] = taken
+                if history_mask:
+                    history = ((history << 1) | taken) & history_mask
+            if predicted != bool(taken):
+                mispredicts += 1
+                if missed is not None:
+                    missed[i] = 1
+        elif op in RETURN_OPCODES:
+            returns += 1
+            if btb_mask >= 0:
+                slot = pc & btb_mask
+                hit = btb_tags[slot] == pc and btb_targets[slot] == target
+            else:
+                hit = False
+            if not hit:
+                return_misses += 1
+                if missed is not None:
+                    missed[i] = 1
+            if btb_mask >= 0:
+                btb_tags[slot] = pc
+                btb_targets[slot] = target
+
+    flush = mispredicts * MISPREDICT_COST + return_misses * RETURN_COST
+    return {
+        'program': trace.name,
+        'config': config.label,
+        'instructions': trace.instructions,
+        'conditional': conditional,
+        'taken': taken_count,
+        'mispredicts': mispredicts,
+        'rate': mispredicts / conditional if conditional else 0.0,
+        'returns': returns,
+        'return_misses': return_misses,
+        'flush_cycles': flush,
+    }
+
+
+# ========== PARALLEL SWEEP ==========
+
+_worker_traces: List[BranchTrace] = []
+
+
+def _init_worker(traces: List[BranchTrace]):
+    global _worker_traces
+    _worker_traces = traces
+
+
+def _replay_job(job: Tuple[int, PredictorConfig]) -> Dict:
+    index, config = job
+    return replay(_worker_traces[index], config)
+
+
+def sweep(traces: List[BranchTrace], configs: List[PredictorConfig],
+          jobs: Optional[int] = None) -> List[Dict]:
+    """
+    Replay every trace against every config; results in (trace, config)
+    order. Traces are sent to each worker once, jobs=1 runs in this process.
+    """
+    work = [(t, config) for t in range(len(traces)) for config in configs]
+    jobs = min(jobs or os.cpu_count() or 1, max(len(work), 1))
+    if jobs == 1:
+        return [replay(traces[t], config) for t, config in work]
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker,
+                             initargs=(traces,)) as pool:
+        return list(pool.map(_replay_job, work, chunksize=max(1, len(work) // (4 * jobs))))
+
+
+def print_results(results: List[Dict], top: Optional[int] = None):
+    by_program: Dict[str, List[Dict]] = {}
+    for r in results:
+        by_program.setdefault(r['program'], []).append(r)
+    for program, rows in by_program.items():
+        first = rows[0]
+        print(f"\n=== {program}: {first['instructions']} instructions, "
+              f"{first['conditional']} conditional ({first['taken']} taken), "
+              f"{first['returns']} returns ===")
+        baseline = next((r['flush_cycles'] for r in rows if r['config'] == STATIC_NOT_TAKEN.label), None)
+        rows = sorted(rows, key=lambda r: (r['flush_cycles'], r['config']))
+        print(f"{'Config':28s} {'Mispred':>9s} {'Rate':>7s} {'RetMiss':>8s} {'Flush':>9s} {'Saved':>9s}")
+        for r in rows[:top]:
+            saved = f"{baseline - r['flush_cycles']:9d}" if baseline is not None else f"{'-':>9s}"
+            print(f"{r['config']:28s} {r['mispredicts']:9d} {r['rate'] * 100:6.2f}% "
+                  f"{r['return_misses']:8d} {r['flush_cycles']:9d} {saved}")
+
+
+def main():
+    import argparse
+    import json
+    parser = argparse.ArgumentParser(
+        prog="branch_predictor",
+        description="Record branch traces and replay them against predictor designs"
+    )
+    parser.add_argument('inputs', nargs='+',
+                        help='Programs (.asm, .mem, .smem, .raw) or saved traces (.npz); globs allowed')
+    parser.add_argument('--hex', action='store_true',
+                        help='Treat all numbers as Hex (default: detect from the header comment)')
+    parser.add_argument('--in', dest='in_values', type=str, default='',
+                        help='Comma separated values for successive IN instructions')
+    parser.add_argument('--interrupt', type=int, action='append', default=[],
+                        help='Raise the hardware interrupt before instruction N (repeatable)')
+    parser.add_argument('-n', '--max-instructions', type=int, default=10_000_000,
+                        help='Stop each program after this many instructions (default: 10M)')
+    parser.add_argument('-c', '--config', action='append', default=[], metavar='SPEC',
+                        help='Predictor to evaluate, e.g. entries=64,bits=2,index=gshare,history=6,btb=16 '
+                             '(repeatable; default: the built-in sweep)')
+    parser.add_argument('--save-trace', type=str, metavar='DIR',
+                        help='Write each recorded trace to DIR/<program>.npz')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Worker processes (default: number of CPUs)')
+    parser.add_argument('--top', type=int, default=None,
+                        help='Only print the N configurations with the fewest flush cycles')
+    parser.add_argument('--json', type=str, help='Write all results to this JSON file')
+
+    args = parser.parse_args()
+    try:
+        configs = [parse_config(spec) for spec in args.config] or default_sweep()
+    except (ValueError, TypeError) as exc:
+        parser.error(str(exc))
+    if args.config and STATIC_NOT_TAKEN not in configs:
+        configs.insert(0, STATIC_NOT_TAKEN)
+
+    paths = []
+    for pattern in args.inputs:
+        matches = sorted(glob.glob(pattern))
+        paths.extend(matches or [pattern])
+    if args.save_trace:
+        os.makedirs(args.save_trace, exist_ok=True)
+
+    traces = []
+    start = time.perf_counter()
+    for path in paths:
+        try:
+            if path.lower().endswith('.npz'):
+                trace = BranchTrace.load(path)
+            else:
+                hex_mode = True if args.hex else None
+                hex_values = args.hex or (path.lower().endswith('.asm') and guess_hex_mode(path))
+                trace = record_trace(path, parse_value_list(args.in_values, hex_values),
+                                     args.max_instructions, hex_mode, args.interrupt)
+        except (OSError, ValueError, KeyError) as exc:
+            print(f"[ERROR] {path}: {exc}")
+            continue
+        if args.save_trace:
+            trace.save(os.path.join(args.save_trace, trace.name + '.npz'))
+        traces.append(trace)
+    if not traces:
+        sys.exit(1)
+    recorded = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = sweep(traces, configs, args.jobs)
+    replayed = time.perf_counter() - start
+
+    print_results(results, args.top)
+    print(f"\n{len(traces)} trace(s), {sum(len(t) for t in traces)} transfers recorded in "
+          f"{recorded:.2f} s; {len(configs)} configuration(s) replayed in {replayed:.2f} s")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'configs': [asdict(c) for c in configs], 'results': results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
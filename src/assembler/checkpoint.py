@@ -0,0 +1,492 @@
+#!/usr/bin/env python3
+"""
+Simulation Checkpoints
+Saves and restores the complete state of a run: pipeline.PipelineModel
+(registers, CCR, PC, SP, the IF/ID, ID/EX, EX/MEM and MEM/WB latches,
+memory-system state, statistics) or simulator.Simulator (registers, flags,
+PC, SP, remaining input, scheduled interrupts). A checkpoint directory
+holds, per snapshot:
+
+  <position>.state  the pickled machine state, memory excluded
+  <position>.raw    the 2^18-word memory as raw little-endian uint32 (the
+                    format load_raw_file reads), mapped with mmap on load
+
+A snapshot whose memory did not change since the previous one points at the
+earlier .raw file instead of writing another. Positions are cycles for the
+pipeline model and executed instructions for the functional simulator.
+Snapshots are taken every N positions while recording, or on demand, and
+restoring one replaces a machine's state in place.
+
+Bisecting two recordings finds the first position where their state
+differs: a binary search over the stored snapshots (no simulation), then
+over the positions between the last equal and the first differing
+snapshot, each probe replaying both runs from the equal one.
+"""
+
+import os
+import sys
+import mmap
+import pickle
+from array import array
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from pipeline import PipelineModel, FORWARD_PATHS
+from simulator import Simulator, load_program, guess_hex_mode, parse_value_list
+
+
+SNAPSHOT_VERSION = 1
+STATE_SUFFIX = '.state'
+MEMORY_SUFFIX = '.raw'
+
+U32_TYPECODE = 'I' if array('I').itemsize == 4 else 'L'
+
+COMPARE_LEVELS = ('arch', 'full')
+# What 'arch' compares (besides memory); 'full' adds the fields below
+ARCH_FIELDS = ('regs', 'ccr', 'sp', 'out_port')
+FULL_FIELDS = {
+    'pipeline': ('pc', 'ifid_instr', 'ifid_pc', 'ifid_valid', 'ifid_take_int',
+                 'idex_ctrl', 'idex_a', 'idex_b', 'idex_rd',
+                 'exmem_ctrl', 'exmem_primary', 'exmem_secondary', 'exmem_rd',
+                 'memwb_ctrl', 'memwb_mem', 'memwb_alu', 'memwb_rd'),
+    'simulator': ('pc',),
+}
+
+
+# ================= MACHINE STATE =================
+
+def kind_of(machine) -> str:
+    if isinstance(machine, PipelineModel):
+        return 'pipeline'
+    if isinstance(machine, Simulator):
+        return 'simulator'
+    raise TypeError(f"cannot checkpoint a {type(machine).__name__}")
+
+
+def position(machine) -> int:
+    """Cycles (pipeline model) or executed instructions (simulator)"""
+    if kind_of(machine) == 'pipeline':
+        return machine.stats.cycles
+    return machine.instructions_executed
+
+
+def is_halted(machine) -> bool:
+    return machine.stats.halted if kind_of(machine) == 'pipeline' else machine.halted
+
+
+def advance(machine, target: int):
+    """Run until `target` (a position) or HLT, whichever comes first"""
+    if kind_of(machine) == 'pipeline':
+        if not machine.stats.halted and machine.stats.cycles < target:
+            machine.run(target)
+    elif not machine.halted and machine.instructions_executed < target:
+        machine.run(target - machine.instructions_executed)
+
+
+def live_state(machine) -> Dict:
+    """The machine's state without memory (shares its objects: read only)"""
+    if kind_of(machine) == 'pipeline':
+        return {name: value for name, value in vars(machine).items() if name != 'memory'}
+    return {
+        'regs': machine.regs, 'ccr': machine.ccr, 'sp': machine.sp, 'pc': machine.pc,
+        'halted': machine.halted, 'instructions_executed': machine.instructions_executed,
+        'out_port': machine.out_port, 'pending_interrupts': machine.pending_interrupts,
+    }
+
+
+def memory_bytes(memory) -> bytes:
+    """A word list as raw little-endian uint32"""
+    words = array(U32_TYPECODE, memory)
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return words.tobytes()
+
+
+def restore_state(machine, state: Dict, memory):
+    """Overwrite the machine with a captured state and a raw memory buffer"""
+    words = array(U32_TYPECODE)
+    words.frombytes(memory)
+    if sys.byteorder == 'big':
+        words.byteswap()
+    machine.memory[:] = words.tolist()
+    if kind_of(machine) == 'pipeline':
+        for name, value in state.items():
+            setattr(machine, name, value)
+        return
+    # Translated blocks hold on to regs and the input iterator: update in place
+    machine.regs[:] = state['regs']
+    machine.out_port[:] = state['out_port']
+    machine.ccr = state['ccr']
+    machine.sp = state['sp']
+    machine.pc = state['pc']
+    machine.halted = state['halted']
+    machine.instructions_executed = state['instructions_executed']
+    machine.pending_interrupts = list(state['pending_interrupts'])
+    machine.set_input(state['inputs'])
+
+
+def _comparable(value):
+    # Control words are compared by what they decode to, not by identity
+    if hasattr(value, 'bubble') and hasattr(value, 'name'):
+        return value.name, value.bubble
+    return value
+
+
+def differences(kind: str, state_a: Dict, memory_a, state_b: Dict, memory_b,
+                level: str = 'arch', limit: int = 8) -> List[str]:
+    """Human-readable list of what differs between two states (empty: equal)"""
+    found = []
+    fields = ARCH_FIELDS + (FULL_FIELDS[kind] if level == 'full' else ())
+    for name in fields:
+        a, b = _comparable(state_a[name]), _comparable(state_b[name])
+        if a == b:
+            continue
+        if name == 'regs':
+            found += [f"R{r}: {x:08X} != {y:08X}" for r, (x, y) in enumerate(zip(a, b)) if x != y]
+        elif name == 'out_port':
+            found.append(f"OUT: {' '.join(f'{v:X}' for v in a[-4:])} != "
+                         f"{' '.join(f'{v:X}' for v in b[-4:])} ({len(a)} vs {len(b)} values)")
+        elif isinstance(a, int) and isinstance(b, int):
+            found.append(f"{name}: {a:X} != {b:X}")
+        else:
+            found.append(f"{name}: {a} != {b}")
+    # bytes(): mmap objects only compare by identity
+    if bytes(memory_a) != bytes(memory_b):
+        words_a, words_b = array(U32_TYPECODE), array(U32_TYPECODE)
+        words_a.frombytes(memory_a)
+        words_b.frombytes(memory_b)
+        if sys.byteorder == 'big':
+            words_a.byteswap()
+            words_b.byteswap()
+        changed = [address for address, (x, y) in enumerate(zip(words_a, words_b)) if x != y]
+        found += [f"M[{address:05X}]: {words_a[address]:08X} != {words_b[address]:08X}"
+                  for address in changed[:limit]]
+        if len(changed) > limit:
+            found.append(f"... {len(changed) - limit} more memory word(s)")
+    return found
+
+
+# ================= STORE =================
+
+class Snapshot:
+    """One stored checkpoint; `memory` is the mapped .raw file"""
+
+    def __init__(self, kind: str, position: int, pickled_state: bytes, memory_path: str):
+        self.kind = kind
+        self.position = position
+        self._pickled_state = pickled_state
+        self.memory_path = memory_path
+        with open(memory_path, 'rb') as f:
+            self.memory = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @property
+    def state(self) -> Dict:
+        """A fresh copy of the saved state on every access"""
+        return pickle.loads(self._pickled_state)
+
+    def restore(self, machine):
+        if kind_of(machine) != self.kind:
+            raise ValueError(f"snapshot of a {self.kind} run cannot restore a {kind_of(machine)}")
+        restore_state(machine, self.state, self.memory)
+
+    def machine(self):
+        """A new machine in this snapshot's state"""
+        machine = PipelineModel() if self.kind == 'pipeline' else Simulator()
+        self.restore(machine)
+        return machine
+
+    def close(self):
+        self.memory.close()
+
+
+class CheckpointStore:
+    """Snapshots of one run in a directory, by position"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._last_memory: Optional[bytes] = None
+        self._last_memory_file: Optional[str] = None
+
+    def _path(self, position: int, suffix: str) -> str:
+        return os.path.join(self.directory, f"{position:012d}{suffix}")
+
+    def positions(self) -> List[int]:
+        return sorted(int(name[:-len(STATE_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.endswith(STATE_SUFFIX) and name[:-len(STATE_SUFFIX)].isdigit())
+
+    def nearest(self, position: int) -> Optional[int]:
+        """Latest snapshot at or before `position`"""
+        positions = self.positions()
+        i = bisect_right(positions, position)
+        return positions[i - 1] if i else None
+
+    def clear(self):
+        """Delete this store's snapshot files (nothing else in the directory)"""
+        for name in os.listdir(self.directory):
+            stem, suffix = os.path.splitext(name)
+            if suffix in (STATE_SUFFIX, MEMORY_SUFFIX) and stem.isdigit():
+                os.remove(os.path.join(self.directory, name))
+        self._last_memory = self._last_memory_file = None
+
+    def save(self, machine) -> int:
+        """Snapshot the machine now; returns its position"""
+        kind = kind_of(machine)
+        at = position(machine)
+        data = memory_bytes(machine.memory)
+        if data != self._last_memory:
+            memory_file = os.path.basename(self._path(at, MEMORY_SUFFIX))
+            with open(self._path(at, MEMORY_SUFFIX), 'w+b') as f:
+                f.truncate(len(data))
+                with mmap.mmap(f.fileno(), len(data)) as mapped:
+                    mapped[:] = data
+            self._last_memory, self._last_memory_file = data, memory_file
+        state = dict(live_state(machine))
+        if kind == 'simulator':
+            # The input iterator cannot be pickled: keep what is left of it
+            state['inputs'] = list(machine._in_iter)
+            machine.set_input(state['inputs'])
+        record = {'version': SNAPSHOT_VERSION, 'kind': kind, 'position': at,
+                  'memory': self._last_memory_file, 'state': pickle.dumps(state)}
+        path = self._path(at, STATE_SUFFIX)
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(record, f)
+        os.replace(path + '.tmp', path)
+        return at
+
+    def load(self, position: int) -> Snapshot:
+        """ValueError if there is no usable snapshot at `position`"""
+        path = self._path(position, STATE_SUFFIX)
+        try:
+            with open(path, 'rb') as f:
+                record = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError) as exc:
+            raise ValueError(f"no snapshot at {position} in '{self.directory}': {exc}")
+        if not isinstance(record, dict) or record.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f"'{path}' was written by another checkpoint version")
+        return Snapshot(record['kind'], record['position'], record['state'],
+                        os.path.join(self.directory, record['memory']))
+
+
+# ================= RECORD / BISECT =================
+
+def record(machine, store: CheckpointStore, every: int, limit: int, marks=()) -> int:
+    """
+    Run to `limit` or HLT, saving a snapshot at the start, every `every`
+    positions, at each of `marks` and at the end. Returns the snapshots saved.
+    """
+    marks = sorted(set(marks))
+    store.save(machine)
+    saved = 1
+    while position(machine) < limit and not is_halted(machine):
+        at = position(machine)
+        target = min(limit, (at // every + 1) * every if every else limit)
+        later = [m for m in marks if m > at]
+        if later:
+            target = min(target, later[0])
+        advance(machine, target)
+        store.save(machine)
+        saved += 1
+    return saved
+
+
+def _probe(snapshot_a: Snapshot, snapshot_b: Snapshot, target: int):
+    machine_a, machine_b = snapshot_a.machine(), snapshot_b.machine()
+    advance(machine_a, target)
+    advance(machine_b, target)
+    return machine_a, machine_b
+
+
+def _machine_differences(machine_a, machine_b, level: str) -> List[str]:
+    return differences(kind_of(machine_a), live_state(machine_a), memory_bytes(machine_a.memory),
+                       live_state(machine_b), memory_bytes(machine_b.memory), level)
+
+
+def first_divergence(store_a: CheckpointStore, store_b: CheckpointStore, level: str = 'arch',
+                     limit: Optional[int] = None) -> Tuple[Optional[int], List[str], int]:
+    """
+    First position at which the two recorded runs differ, what differs
+    there, and how many replays it took. Position None: no difference up to
+    `limit` (default: the last snapshot of either run). Within the search
+    range a difference, once there, is assumed to stay.
+    """
+    common = sorted(set(store_a.positions()) & set(store_b.positions()))
+    if not common:
+        raise ValueError("the recordings have no snapshot position in common")
+    loaded: Dict[int, Tuple[Snapshot, Snapshot]] = {}
+
+    def pair(at: int) -> Tuple[Snapshot, Snapshot]:
+        if at not in loaded:
+            a, b = store_a.load(at), store_b.load(at)
+            if a.kind != b.kind:
+                raise ValueError(f"cannot compare a {a.kind} run with a {b.kind} run")
+            loaded[at] = (a, b)
+        return loaded[at]
+
+    def stored_differences(at: int) -> List[str]:
+        a, b = pair(at)
+        return differences(a.kind, a.state, a.memory, b.state, b.memory, level)
+
+    # Snapshots first: no simulation
+    lo, hi = -1, len(common)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if stored_differences(common[mid]):
+            hi = mid
+        else:
+            lo = mid
+    if lo < 0:
+        return common[0], stored_differences(common[0]), 0
+
+    start = common[lo]
+    replays = 0
+    if hi < len(common):
+        end = common[hi]
+    else:
+        end = limit if limit is not None else max(store_a.positions()[-1], store_b.positions()[-1])
+        if end <= start:
+            return None, [], replays
+        machine_a, machine_b = _probe(*pair(start), end)
+        replays += 1
+        if not _machine_differences(machine_a, machine_b, level):
+            return None, [], replays
+
+    # Then the positions between the last equal and the first differing snapshot
+    low, high = start, end
+    while high - low > 1:
+        mid = (low + high) // 2
+        machine_a, machine_b = _probe(*pair(start), mid)
+        replays += 1
+        if _machine_differences(machine_a, machine_b, level):
+            high = mid
+        else:
+            low = mid
+    machine_a, machine_b = _probe(*pair(start), high)
+    return high, _machine_differences(machine_a, machine_b, level), replays + 1
+
+
+def format_state(machine) -> str:
+    """Registers, flags, PC, SP and (pipeline model) the latch contents"""
+    kind = kind_of(machine)
+    state = live_state(machine)
+    unit = 'cycle' if kind == 'pipeline' else 'instruction'
+    lines = [f"{kind} at {unit} {position(machine)}{' (halted)' if is_halted(machine) else ''}",
+             f"PC={state['pc']:05X} SP={state['sp']:05X} CCR={state['ccr']:03b}",
+             "  ".join(f"R{r}={value:08X}" for r, value in enumerate(state['regs']))]
+    if kind == 'pipeline':
+        lines.append(f"IF/ID  {'valid' if state['ifid_valid'] else 'bubble':6s} "
+                     f"instr={state['ifid_instr']:08X} pc={state['ifid_pc']:05X}")
+        for latch in ('idex', 'exmem', 'memwb'):
+            ctrl = state[f'{latch}_ctrl']
+            text = ctrl.name if ctrl.bubble is None else f"{ctrl.name}({ctrl.bubble})"
+            lines.append(f"{latch.upper():6s} {text:18s} pc={state[f'{latch}_pc']:05X} "
+                         f"rd=R{state[f'{latch}_rd']}")
+    if state['out_port']:
+        lines.append("OUT " + " ".join(f"{v:X}" for v in state['out_port'][-16:]))
+    return "\n".join(lines)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="checkpoint",
+        description="Record, list, resume and bisect checkpoints of pipeline-model or simulator runs"
+    )
+    parser.add_argument('directory', type=str, help='Checkpoint directory')
+    parser.add_argument('--record', type=str, metavar='PROGRAM',
+                        help='Run PROGRAM from reset and snapshot it into the directory (replacing it)')
+    parser.add_argument('--every', type=int, default=10_000,
+                        help='Snapshot interval in cycles/instructions while recording (default: 10000)')
+    parser.add_argument('--at', type=int, action='append', default=[], metavar='POS',
+                        help='Also snapshot at POS while recording (repeatable)')
+    parser.add_argument('-c', '--max-cycles', type=int, default=None,
+                        help='Stop recording here (default: 1000000); when bisecting, also compare '
+                             'the runs this far past their last snapshot')
+    parser.add_argument('--functional', action='store_true',
+                        help='Record the functional simulator (positions are instructions)')
+    parser.add_argument('--hex', action='store_true',
+                        help='Treat all numbers as Hex by default (auto-detected otherwise)')
+    parser.add_argument('--in', dest='in_values', type=str, default='',
+                        help='Comma separated values for successive IN instructions')
+    parser.add_argument('--interrupt', type=int, action='append', default=[],
+                        help='Hardware interrupt at cycle N (instruction N with --functional); repeatable')
+    parser.add_argument('-m', '--memory', type=str, default=None, metavar='SPEC',
+                        help='Memory system for the pipeline model, as in pipeline.py -m')
+    parser.add_argument('--forward', type=str, default=','.join(FORWARD_PATHS), metavar='PATHS',
+                        help='Forwarding paths for the pipeline model, as in pipeline.py --forward')
+    parser.add_argument('--resume', type=int, metavar='POS',
+                        help='Restore the latest snapshot at or before POS, run to POS and show the state')
+    parser.add_argument('--run', type=int, default=0, metavar='N',
+                        help='With --resume: continue N more cycles/instructions')
+    parser.add_argument('--save', action='store_true',
+                        help='With --resume: snapshot the final state into the directory')
+    parser.add_argument('--bisect', type=str, metavar='OTHER',
+                        help='Find the first position where this recording and OTHER differ')
+    parser.add_argument('--compare', choices=COMPARE_LEVELS, default='arch',
+                        help="'arch': registers, CCR, SP, OUT and memory; "
+                             "'full': also PC and pipeline latches (default: arch)")
+
+    args = parser.parse_args()
+    store = CheckpointStore(args.directory)
+    try:
+        if args.record:
+            hex_values = args.hex or (args.record.lower().endswith('.asm') and guess_hex_mode(args.record))
+            in_values = parse_value_list(args.in_values, hex_values)
+            memory = load_program(args.record, True if args.hex else None)
+            if args.functional:
+                machine = Simulator(memory, in_values)
+                for at in args.interrupt:
+                    machine.schedule_interrupt(at)
+            else:
+                memory_system = None
+                if args.memory:
+                    from memory_system import MemorySystem, parse_config
+                    memory_system = MemorySystem(parse_config(args.memory))
+                forwarding = [p.strip() for p in args.forward.split(',') if p.strip() not in ('', 'none')]
+                machine = PipelineModel(memory, in_values, args.interrupt,
+                                        memory_system=memory_system, forwarding=forwarding)
+            store.clear()
+            saved = record(machine, store, args.every, args.max_cycles or 1_000_000, args.at)
+            print(format_state(machine))
+            print(f"\n{saved} snapshot(s) in {args.directory}")
+
+        elif args.resume is not None:
+            nearest = store.nearest(args.resume)
+            if nearest is None:
+                raise ValueError(f"no snapshot at or before {args.resume} in '{args.directory}'")
+            machine = store.load(nearest).machine()
+            advance(machine, args.resume)
+            if args.run:
+                advance(machine, position(machine) + args.run)
+            print(f"Restored {nearest}, replayed {position(machine) - nearest}\n")
+            print(format_state(machine))
+            if args.save:
+                print(f"\nSaved snapshot at {store.save(machine)}")
+
+        elif args.bisect:
+            at, found, replays = first_divergence(store, CheckpointStore(args.bisect), args.compare,
+                                                  args.max_cycles)
+            if at is None:
+                print(f"No difference ({args.compare}); {replays} replay(s)")
+            else:
+                print(f"First difference ({args.compare}) at {at}, found with {replays} replay(s):")
+                for line in found:
+                    print(f"  {line}")
+                sys.exit(1)
+
+        else:
+            for at in store.positions():
+                snapshot = store.load(at)
+                state = snapshot.state
+                halted = state['stats'].halted if snapshot.kind == 'pipeline' else state['halted']
+                print(f"{at:12d}  {snapshot.kind:9s} PC={state['pc']:05X} "
+                      f"OUT={len(state['out_port'])}{'  halted' if halted else ''}  "
+                      f"[{os.path.basename(snapshot.memory_path)}]")
+                snapshot.close()
+    except (OSError, ValueError, TypeError) as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+"""
+Hardware Design-Space Sweep
+Enumerates microarchitecture designs and runs every program of a corpus on
+pipeline.PipelineModel under each of them, in a pool of worker processes:
+
+  - forwarding: which of the EX/MEM and MEM/WB paths exist (decode
+    interlocks on a missing one)
+  - branch predictor: a branch_predictor.PredictorConfig (table size,
+    strong-only redirect = TreatConditionalAsUnconditional, ...). The model
+    fetches as the RTL does, so the predictor's saving is the flush-cycle
+    difference against static not-taken from branch_predictor.replay on the
+    program's functional-simulator trace
+  - memory ports and caches: a memory_system.MemoryConfig
+  - interrupt handling cost: cycles added to (negative: removed from) every
+    INT / hardware interrupt entry
+
+Results are memoized on disk keyed by (program image hash, config hash); the
+config hash covers the model's source files, so a model change invalidates
+old entries. The report is a Pareto table of mean CPI against an estimated
+hardware cost.
+Requires NumPy (branch traces).
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import itertools
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict, replace
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from isa_constants import ISA
+from pipeline import PipelineModel, FORWARD_PATHS
+from memory_system import MemoryConfig, MemorySystem, RTL_MEMORY, parse_config as parse_memory
+from branch_predictor import (PredictorConfig, STATIC_NOT_TAKEN, replay, trace_program,
+                              parse_config as parse_predictor)
+from simulator import load_program
+
+
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = '.sweep_cache'
+
+# Sources whose behaviour the cached results depend on
+MODEL_FILES = ('pipeline.py', 'memory_system.py', 'branch_predictor.py', 'simulator.py',
+               'design_sweep.py')
+
+U32_TYPECODE = 'I' if array('I').itemsize == 4 else 'L'
+
+# ========== HARDWARE COST ==========
+# Rough sizes in bit equivalents (a flip-flop, an SRAM bit or one bit of a
+# mux input each count 1): enough to rank designs, not a synthesis result.
+WORD_BITS = 32
+ADDRESS_BITS = ISA.ADDRESS_WIDTH
+# One more input on the A, B and store-data muxes plus two 3-bit comparators
+FORWARD_PATH_COST = 3 * WORD_BITS + 2 * 3
+# Comparators and the freeze line that replace a missing path
+INTERLOCK_COST = 2 * 3 + 4
+# Second read port on the program memory (instruction fetch)
+SPLIT_PORT_COST = 16 * WORD_BITS
+# Per cycle taken out of interrupt entry: a shadow register and its sequencing
+INTERRUPT_CYCLE_COST = WORD_BITS + 8
+
+
+@dataclass(frozen=True)
+class DesignConfig:
+    """
+    One point of the design space. forwarding lists the paths that exist;
+    interrupt_cycles is added to every interrupt entry (the RTL is 0).
+    """
+    name: str = ''
+    forwarding: Tuple[str, ...] = FORWARD_PATHS
+    predictor: PredictorConfig = STATIC_NOT_TAKEN
+    memory: MemoryConfig = RTL_MEMORY
+    interrupt_cycles: int = 0
+
+    @property
+    def label(self) -> str:
+        if self.name:
+            return self.name
+        paths = set(self.forwarding)
+        if paths == set(FORWARD_PATHS):
+            forwarding = 'fwd'
+        elif not paths:
+            forwarding = 'nofwd'
+        else:
+            forwarding = 'fwd-' + '+'.join(p for p in FORWARD_PATHS if p in paths)
+        text = f"{forwarding}/{self.predictor.label}/{self.memory.label}"
+        return text + (f"/irq{self.interrupt_cycles:+d}" if self.interrupt_cycles else "")
+
+    def validate(self):
+        """ValueError for a design the sweep cannot model"""
+        unknown = set(self.forwarding).difference(FORWARD_PATHS)
+        if unknown:
+            raise ValueError(f"unknown forwarding path(s): {', '.join(sorted(unknown))}")
+        self.predictor.validate()
+        self.memory.validate()
+
+
+# What the hardware does today
+RTL_DESIGN = DesignConfig(name='rtl')
+
+
+def parse_forwarding(spec: str) -> Tuple[str, ...]:
+    """'ex_mem,mem_wb', 'ex_mem' or 'none' -> forwarding paths in FORWARD_PATHS order"""
+    paths = {p.strip() for p in spec.split(',') if p.strip()} - {'none'}
+    unknown = paths.difference(FORWARD_PATHS)
+    if unknown:
+        raise ValueError(f"unknown forwarding path(s): {', '.join(sorted(unknown))}")
+    return tuple(p for p in FORWARD_PATHS if p in paths)
+
+
+def default_axes() -> Dict[str, List]:
+    """Every forwarding subset, 4- to 64-entry tables with and without strong-only, two port layouts"""
+    predictors = [STATIC_NOT_TAKEN]
+    for entries in (4, 16, 64):
+        for strong in (False, True):
+            predictors.append(PredictorConfig(entries=entries, strong_only=strong))
+    return {
+        'forwarding': [FORWARD_PATHS, ('ex_mem',), ('mem_wb',), ()],
+        'predictor': predictors,
+        'memory': [RTL_MEMORY, MemoryConfig(ports='split')],
+        'interrupt_cycles': [0, -1],
+    }
+
+
+def enumerate_designs(axes: Dict[str, List]) -> List[DesignConfig]:
+    """Cartesian product of the axes, the RTL design first"""
+    designs = [RTL_DESIGN]
+    seen = {config_key(RTL_DESIGN)}
+    for forwarding, predictor, memory, interrupt_cycles in itertools.product(
+            axes['forwarding'], axes['predictor'], axes['memory'], axes['interrupt_cycles']):
+        design = DesignConfig(forwarding=forwarding, predictor=predictor, memory=memory,
+                              interrupt_cycles=interrupt_cycles)
+        design.validate()
+        key = config_key(design)
+        if key not in seen:
+            seen.add(key)
+            designs.append(design)
+    return designs
+
+
+def _cache_cost(words: int, ways: int, line: int) -> int:
+    if not words:
+        return 0
+    lines = words // line
+    sets = lines // ways
+    tag_bits = ADDRESS_BITS - (sets.bit_length() - 1) - (line.bit_length() - 1)
+    lru_bits = (ways - 1).bit_length()
+    return words * WORD_BITS + lines * (tag_bits + 1 + lru_bits)
+
+
+def hardware_cost(design: DesignConfig) -> int:
+    """Estimated size of the parts the sweep varies, in bit equivalents"""
+    cost = len(design.forwarding) * FORWARD_PATH_COST
+    cost += (len(FORWARD_PATHS) - len(design.forwarding)) * INTERLOCK_COST
+
+    predictor = design.predictor
+    if predictor.entries:
+        cost += predictor.entries * predictor.counter_bits + predictor.history_bits
+    if predictor.btb_entries:
+        tag_bits = ADDRESS_BITS - (predictor.btb_entries.bit_length() - 1)
+        cost += predictor.btb_entries * (tag_bits + ADDRESS_BITS + 1)
+
+    memory = design.memory
+    if memory.split:
+        cost += SPLIT_PORT_COST
+    cost += _cache_cost(memory.icache_words, memory.icache_ways, memory.icache_line)
+    cost += _cache_cost(memory.dcache_words, memory.dcache_ways, memory.dcache_line)
+    cost += memory.prefetch_lines * (memory.icache_line * WORD_BITS + ADDRESS_BITS)
+
+    cost += max(0, -design.interrupt_cycles) * INTERRUPT_CYCLE_COST
+    return cost
+
+
+# ================= KEYS AND CACHE =================
+
+_fingerprint: Optional[str] = None
+
+
+def model_fingerprint() -> str:
+    """Hash of the sources in MODEL_FILES"""
+    global _fingerprint
+    if _fingerprint is None:
+        digest = hashlib.sha256(str(CACHE_VERSION).encode())
+        here = os.path.dirname(os.path.abspath(__file__))
+        for name in MODEL_FILES:
+            with open(os.path.join(here, name), 'rb') as f:
+                digest.update(f.read())
+        _fingerprint = digest.hexdigest()
+    return _fingerprint
+
+
+def config_key(design: DesignConfig) -> str:
+    """Hash of the design (labels excluded) and of the model that evaluates it"""
+    unnamed = replace(design, name='', predictor=replace(design.predictor, name=''),
+                      memory=replace(design.memory, name=''))
+    text = json.dumps({'model': model_fingerprint(), 'design': asdict(unnamed)}, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def image_key(memory: List[int], in_values: Sequence[int], max_cycles: int) -> str:
+    """Hash of a memory image and the inputs it is run with"""
+    digest = hashlib.sha256(array(U32_TYPECODE, memory).tobytes())
+    digest.update(json.dumps({'in': list(in_values), 'max_cycles': max_cycles}).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """One JSON file per (image, config) pair under `directory`; None disables it"""
+
+    def __init__(self, directory: Optional[str]):
+        self.directory = directory
+        self.hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def path(self, image: str, config: str) -> str:
+        return os.path.join(self.directory, f"{image[:20]}-{config[:20]}.json")
+
+    def get(self, image: str, config: str) -> Optional[Dict]:
+        entry = None
+        if self.directory:
+            try:
+                with open(self.path(image, config), 'r') as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                entry = None
+        if not isinstance(entry, dict) or entry.get('image') != image or entry.get('config') != config:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry['result']
+
+    def put(self, image: str, config: str, result: Dict):
+        if not self.directory:
+            return
+        path = self.path(image, config)
+        temp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp, 'w') as f:
+                json.dump({'image': image, 'config': config, 'result': result}, f)
+            os.replace(temp, path)
+        except OSError as exc:
+            print(f"[WARNING] Could not write cache entry '{path}': {exc}")
+
+
+# ================= RUNS =================
+
+def run_group(memory: List[int], name: str, designs: List[DesignConfig], in_values=(),
+              max_cycles: int = 100_000, traces: Optional[Dict] = None) -> List[Dict]:
+    """
+    Designs sharing forwarding and memory system: one pipeline run, then the
+    predictor and interrupt-cost adjustments for each design.
+    `traces` memoizes branch traces by retired-instruction count.
+    """
+    first = designs[0]
+    uncached = replace(first.memory, name='') == MemoryConfig()
+    memory_system = None if uncached else MemorySystem(first.memory)
+    model = PipelineModel(memory, in_values, memory_system=memory_system, forwarding=first.forwarding)
+    stats = model.run(max_cycles)
+
+    static_flush = None
+    results = []
+    for design in designs:
+        saved = 0
+        if design.predictor != STATIC_NOT_TAKEN:
+            traces = {} if traces is None else traces
+            trace = traces.get(stats.instructions)
+            if trace is None:
+                trace = traces[stats.instructions] = trace_program(list(memory), name, in_values,
+                                                                   stats.instructions)
+            if static_flush is None:
+                static_flush = replay(trace, STATIC_NOT_TAKEN)['flush_cycles']
+            saved = static_flush - replay(trace, design.predictor)['flush_cycles']
+        cycles = stats.cycles - saved + design.interrupt_cycles * stats.interrupts
+        results.append({
+            'cycles': cycles,
+            'pipeline_cycles': stats.cycles,
+            'instructions': stats.instructions,
+            'cpi': cycles / stats.instructions if stats.instructions else float('inf'),
+            'halted': stats.halted,
+            'flush_saved': saved,
+            'interrupts': stats.interrupts,
+            'hazard_stalls': stats.stalls['hazard'],
+            'outputs': list(model.out_port),
+        })
+    return results
+
+
+_worker_programs: List[Tuple[str, List[int]]] = []
+_worker_traces: Dict[int, Dict] = {}
+
+
+def _init_worker(programs: List[Tuple[str, List[int]]]):
+    global _worker_programs
+    _worker_programs = programs
+
+
+def _group_job(job) -> List[Dict]:
+    index, designs, in_values, max_cycles = job
+    name, memory = _worker_programs[index]
+    return run_group(memory, name, designs, in_values, max_cycles, _worker_traces.setdefault(index, {}))
+
+
+def sweep(programs: Dict[str, List[int]], designs: List[DesignConfig], in_values=(),
+          max_cycles: int = 100_000, cache: Optional[ResultCache] = None,
+          jobs: Optional[int] = None) -> Dict[str, List[Dict]]:
+    """
+    Every program under every design, in design order per program. Pairs
+    found in the cache are not run again; the others are grouped by
+    (program, forwarding, memory system) and run in worker processes
+    (jobs=1 runs in this process). 'output_differs' marks a halted run whose
+    OUT values differ from the first design's.
+    """
+    cache = cache or ResultCache(None)
+    items = list(programs.items())
+    config_keys = [config_key(d) for d in designs]
+    image_keys = [image_key(memory, in_values, max_cycles) for _, memory in items]
+    results: Dict[str, List[Optional[Dict]]] = {}
+    groups: Dict[Tuple, List[int]] = {}
+    for index, (name, memory) in enumerate(items):
+        row = results[name] = [cache.get(image_keys[index], key) for key in config_keys]
+        for n, design in enumerate(designs):
+            if row[n] is None:
+                groups.setdefault((index, design.forwarding, design.memory), []).append(n)
+
+    work = [(index, [designs[n] for n in members], list(in_values), max_cycles)
+            for (index, _, _), members in groups.items()]
+    jobs = min(jobs or os.cpu_count() or 1, max(len(work), 1))
+    if jobs == 1:
+        _init_worker(items)
+        done = [_group_job(job) for job in work]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(items,)) as pool:
+            done = list(pool.map(_group_job, work))
+
+    for ((index, _, _), members), rows in zip(groups.items(), done):
+        name = items[index][0]
+        for n, row in zip(members, rows):
+            cache.put(image_keys[index], config_keys[n], row)
+            results[name][n] = row
+
+    for rows in results.values():
+        reference = rows[0]
+        for design, row in zip(designs, rows):
+            row['config'] = design.label
+            row['output_differs'] = (row['halted'] and reference['halted']
+                                     and row['outputs'] != reference['outputs'])
+    return results
+
+
+# ================= PARETO =================
+
+def summarize(designs: List[DesignConfig], results: Dict[str, List[Dict]]) -> List[Dict]:
+    """Mean CPI, cost and Pareto membership of every design (cost ascending)"""
+    rows = []
+    for n, design in enumerate(designs):
+        column = [program_rows[n] for program_rows in results.values()]
+        mean_cpi = sum(r['cpi'] for r in column) / len(column) if column else 0.0
+        rows.append({
+            'config': design.label,
+            'cost': hardware_cost(design),
+            'mean_cpi': mean_cpi,
+            'differs': sum(1 for r in column if r['output_differs']),
+            'pareto': False,
+        })
+    reference = rows[0]['mean_cpi'] if rows else 0.0
+    for row in rows:
+        row['cpi_delta'] = row['mean_cpi'] - reference
+    rows.sort(key=lambda r: (r['cost'], r['mean_cpi'], r['config']))
+    best = float('inf')
+    for row in rows:
+        if row['mean_cpi'] < best:
+            row['pareto'] = True
+            best = row['mean_cpi']
+    return rows
+
+
+def format_summary(rows: List[Dict], programs: int, show_all: bool = False) -> str:
+    header = f"{'Design':52s} {'Cost':>7s} {'Mean CPI':>9s} {'dCPI':>8s}  Pareto"
+    title = "All designs" if show_all else "Pareto frontier"
+    lines = [f"{title} over {programs} program(s) (cost in bit equivalents):", header, "-" * len(header)]
+    for row in rows:
+        if not (show_all or row['pareto']):
+            continue
+        text = (f"{row['config'][:52]:52s} {row['cost']:7d} {row['mean_cpi']:9.3f} "
+                f"{row['cpi_delta']:+8.3f}  {'*' if row['pareto'] else ''}")
+        if row['differs']:
+            text += f"  (OUT differs in {row['differs']})"
+        lines.append(text.rstrip())
+    return "\n".join(lines)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="design_sweep",
+        description="Pipeline-model sweep over forwarding, branch predictor, memory ports and interrupt "
+                    "cost, with a result cache and a CPI / hardware-cost Pareto table"
+    )
+    parser.add_argument('inputs', nargs='+',
+                        help='Programs or globs (.asm is assembled first, anything else is read as .mem)')
+    parser.add_argument('--hex', action='store_true',
+                        help='Treat all numbers as Hex by default (auto-detected otherwise)')
+    parser.add_argument('--forward', type=str, action='append', default=[], metavar='PATHS',
+                        help="Forwarding paths of one design point, e.g. 'ex_mem,mem_wb', 'mem_wb' "
+                             "or 'none' (repeatable; default: all four)")
+    parser.add_argument('-p', '--predictor', type=str, action='append', default=[], metavar='SPEC',
+                        help="Predictor as in branch_predictor.py -c, e.g. 'entries=64,strong' or "
+                             "'static=not_taken' (repeatable)")
+    parser.add_argument('-m', '--memory', type=str, action='append', default=[], metavar='SPEC',
+                        help="Memory system as in memory_system.py -m, e.g. 'split' (repeatable)")
+    parser.add_argument('--irq', type=int, action='append', default=[], metavar='N',
+                        help='Cycles added to each interrupt entry, negative to remove (repeatable)')
+    parser.add_argument('--in', dest='in_values', type=str, default='',
+                        help='Comma separated values for successive IN instructions')
+    parser.add_argument('-c', '--max-cycles', type=int, default=100_000,
+                        help='Stop each program after this many cycles (default: 100000)')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Worker processes (default: number of CPUs)')
+    parser.add_argument('--cache', type=str, default=DEFAULT_CACHE_DIR, metavar='DIR',
+                        help=f'Result cache directory (default: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--no-cache', action='store_true', help='Neither read nor write the cache')
+    parser.add_argument('--all', action='store_true', help='List every design, not only the Pareto frontier')
+    parser.add_argument('--json', type=str, metavar='FILE', help='Also write designs, results and summary')
+
+    args = parser.parse_args()
+    axes = default_axes()
+    try:
+        if args.forward:
+            axes['forwarding'] = [parse_forwarding(spec) for spec in args.forward]
+        if args.predictor:
+            axes['predictor'] = [parse_predictor(spec) for spec in args.predictor]
+        if args.memory:
+            axes['memory'] = [parse_memory(spec) for spec in args.memory]
+        if args.irq:
+            axes['interrupt_cycles'] = args.irq
+        designs = enumerate_designs(axes)
+    except (ValueError, TypeError) as exc:
+        parser.error(str(exc))
+
+    paths = []
+    for pattern in args.inputs:
+        paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    programs: Dict[str, List[int]] = {}
+    for path in paths:
+        try:
+            programs[os.path.basename(path)] = load_program(path, True if args.hex else None)
+        except (OSError, ValueError) as exc:
+            print(f"ERROR: {exc}")
+            sys.exit(1)
+    in_values = [int(v, 16 if args.hex else 0) for v in args.in_values.split(',') if v.strip()]
+
+    cache = ResultCache(None if args.no_cache else args.cache)
+    start = time.perf_counter()
+    results = sweep(programs, designs, in_values, args.max_cycles, cache, args.jobs)
+    elapsed = time.perf_counter() - start
+
+    summary = summarize(designs, results)
+    print(format_summary(summary, len(programs), args.all))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'designs': [dict(asdict(d), label=d.label, cost=hardware_cost(d)) for d in designs],
+                       'results': results, 'summary': summary}, f, indent=2)
+        print(f"\nResults: {args.json}")
+    print(f"\n{len(programs)} program(s) x {len(designs)} design(s): {cache.misses} run, "
+          f"{cache.hits} from cache, {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
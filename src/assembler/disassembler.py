@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""
+Vectorized Disassembler for Memory Images
+Loads a whole image (.mem, .smem, .raw or .asm) into a NumPy uint32 array,
+decodes the opcode and register fields of every word in one vectorized pass
+with the ISA.SHIFT_* constants, then walks the words linearly so the second
+word of a 2-word instruction is consumed as its immediate.
+
+The output re-assembles with assembler.py to the identical image: a word is
+written as an instruction only if the assembler would encode that
+instruction back to exactly the same word(s) (unused fields zero, immediates
+in range); anything else is written as .DW. Branch targets that start an
+instruction get L_<address> labels, and long runs of zero words are skipped
+with .ORG.
+Requires NumPy.
+"""
+
+import sys
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+from isa_constants import ISA
+from simulator import load_sparse_file
+
+
+NAMES = ['NOP'] * 32
+for _name, _code in ISA.OPCODES.items():
+    NAMES[_code] = _name
+_KNOWN = np.zeros(32, dtype=bool)
+_KNOWN[list(ISA.OPCODES.values())] = True
+SIZES = np.array([ISA.get_size(name) for name in NAMES], dtype=np.int64)
+
+_R1 = 7 << ISA.SHIFT_R1
+_R2 = 7 << ISA.SHIFT_R2
+_R3 = 7 << ISA.SHIFT_R3
+# Register fields each opcode's encoder may set (see Assembler.encode_*)
+_FIELDS = {
+    'NOT': _R1 | _R2, 'INC': _R1 | _R2, 'OUT': _R2, 'IN': _R1, 'PUSH': _R3, 'POP': _R1,
+    'MOV': _R1 | _R2, 'SWAP': _R1 | _R2 | _R3,
+    'ADD': _R1 | _R2 | _R3, 'SUB': _R1 | _R2 | _R3, 'AND': _R1 | _R2 | _R3,
+    'IADD': _R1 | _R2, 'LDM': _R1, 'LDD': _R1 | _R2, 'STD': _R2 | _R3,
+}
+FIELD_MASKS = np.array([_FIELDS.get(name, 0) | (0x1F << ISA.SHIFT_OPCODE) for name in NAMES],
+                       dtype=np.uint32)
+# Encoders that write R1 and R2 from one operand
+_SAME_R1_R2 = np.zeros(32, dtype=bool)
+_SAME_R1_R2[[ISA.OPCODES[name] for name in ('NOT', 'INC', 'SWAP')]] = True
+
+# Second-word rules: 16-bit sign-extended, any 32-bit value, or an 18-bit address
+_SEXT16 = np.zeros(32, dtype=bool)
+_SEXT16[[ISA.OPCODES[name] for name in ('IADD', 'LDD', 'STD', 'INT')]] = True
+_ADDRESS = np.zeros(32, dtype=bool)
+_ADDRESS[[ISA.OPCODES[name] for name in ISA.BRANCH_INSTRUCTIONS]] = True
+
+# Zero words this many or more in a row (outside instructions) become one .ORG
+MIN_ZERO_RUN = 8
+
+
+def load_image(path: str) -> Tuple[np.ndarray, int]:
+    """
+    (full-size uint32 image, number of words the file covers). .asm files
+    are assembled; the length then ends at the last word written.
+    """
+    image = np.zeros(ISA.MEMORY_WORDS, dtype=np.uint32)
+    lowered = path.lower()
+    if lowered.endswith('.asm'):
+        from simulator import assemble_file
+        assembler = assemble_file(path)
+        image[:] = np.frombuffer(assembler.memory_image, dtype=np.uint32)
+        highest = assembler.highest_address()
+        return image, 0 if highest is None else highest + 1
+    if lowered.endswith('.smem'):
+        length = 0
+        for address, words in load_sparse_file(path):
+            end = min(address + len(words), ISA.MEMORY_WORDS)
+            image[address:end] = words[:end - address]
+            length = max(length, end)
+        return image, length
+    if lowered.endswith('.raw'):
+        words = np.fromfile(path, dtype='<u4')[:ISA.MEMORY_WORDS]
+    else:
+        with open(path, 'r') as f:
+            lines = f.read().split()
+        try:
+            words = np.frombuffer(bytes.fromhex(''.join(line.zfill(8) for line in lines)), dtype='>u4')
+            if len(words) != len(lines):
+                raise ValueError
+        except ValueError:
+            words = np.array([int(line, 16) & 0xFFFFFFFF for line in lines], dtype=np.uint32)
+        words = words[:ISA.MEMORY_WORDS]
+    image[:len(words)] = words
+    return image, len(words)
+
+
+def decode(words: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized pass over every word: (opcode, size), where size is the
+    instruction size if the word (with the next one as its immediate)
+    re-encodes exactly, and 0 if it can only be written as .DW
+    """
+    op = (words >> ISA.SHIFT_OPCODE).astype(np.int64)
+    r1 = (words >> ISA.SHIFT_R1) & 7
+    r2 = (words >> ISA.SHIFT_R2) & 7
+    canonical = _KNOWN[op] & ((words & ~FIELD_MASKS[op]) == 0)
+    canonical &= ~_SAME_R1_R2[op] | (r1 == r2)
+
+    size = np.where(canonical, SIZES[op], 0)
+    following = np.empty_like(words)
+    following[:-1] = words[1:]
+    two_word = size == 2
+    high = following >> 15
+    ok = np.where(_SEXT16[op], (high == 0) | (high == 0x1FFFF),
+                  np.where(_ADDRESS[op], following < ISA.MEMORY_WORDS, True))
+    ok[-1] = False
+    size[two_word & ~ok] = 0
+    return op, size
+
+
+def instruction_starts(size: np.ndarray, length: int) -> np.ndarray:
+    """Linear walk: addresses where an instruction (or .DW word) starts"""
+    starts = np.empty(length, dtype=np.int64)
+    steps = np.maximum(size[:length], 1).tolist()
+    count = addr = 0
+    while addr < length:
+        starts[count] = addr
+        count += 1
+        addr += steps[addr]
+    return starts[:count]
+
+
+def disassemble(image: np.ndarray, length: int, addresses: bool = True,
+                source: str = '') -> str:
+    """Assembly text that re-assembles to `image` over [0, length)"""
+    words = image[:ISA.MEMORY_WORDS]
+    op, size = decode(words)
+    starts = instruction_starts(size, length)
+    if not len(starts):
+        return f"; {source or 'image'}: empty\n"
+    # An instruction whose immediate would run past `length` is data instead
+    overrun = starts + np.maximum(size[starts], 1) > length
+    size[starts[overrun]] = 0
+
+    start_words = words[starts]
+    start_ops = op[starts]
+    start_size = size[starts]
+
+    # Zero-word runs outside instructions are skipped; the last word is
+    # always written so a .mem image keeps its length
+    zero = (start_words == 0)
+    zero[-1] = False
+    run_id = np.cumsum(np.concatenate(([1], (~zero[1:] | ~zero[:-1]) | (np.diff(starts) != 1))))
+    run_length = np.bincount(run_id)[run_id]
+    skipped = zero & (run_length >= MIN_ZERO_RUN)
+    emitted = ~skipped
+    needs_org = emitted & np.concatenate(([starts[0] != 0], skipped[:-1]))
+
+    # Labels for branch targets that start an emitted instruction
+    following = np.zeros(len(words), dtype=np.uint32)
+    following[:-1] = words[1:]
+    start_imm = following[starts]
+    is_branch = _ADDRESS[start_ops] & (start_size == 2)
+    targets = np.unique(start_imm[is_branch])
+    label_at = np.zeros(ISA.MEMORY_WORDS, dtype=bool)
+    label_at[starts[emitted]] = True
+    targets = targets[label_at[targets]]
+    label_at[:] = False
+    label_at[targets] = True
+
+    r1 = ((start_words >> ISA.SHIFT_R1) & 7).tolist()
+    r2 = ((start_words >> ISA.SHIFT_R2) & 7).tolist()
+    r3 = ((start_words >> ISA.SHIFT_R3) & 7).tolist()
+    imm = start_imm.tolist()
+    text = np.empty(len(starts), dtype=object)
+    kinds = np.where(start_size == 0, -1, start_ops)
+    for kind in np.unique(kinds[emitted]).tolist():
+        rows = np.nonzero((kinds == kind) & emitted)[0]
+        if kind < 0:
+            text[rows] = [f".DW 0x{v:08X}" for v in start_words[rows].tolist()]
+            continue
+        rows = rows.tolist()
+        name = NAMES[kind]
+        if name in ISA.NO_OPERAND_INSTRUCTIONS:
+            formatted = [name] * len(rows)
+        elif name in ('NOT', 'INC', 'IN', 'POP'):
+            formatted = [f"{name} R{r1[i]}" for i in rows]
+        elif name == 'OUT':
+            formatted = [f"OUT R{r2[i]}" for i in rows]
+        elif name == 'PUSH':
+            formatted = [f"PUSH R{r3[i]}" for i in rows]
+        elif name == 'MOV':
+            formatted = [f"MOV R{r2[i]}, R{r1[i]}" for i in rows]
+        elif name == 'SWAP':
+            formatted = [f"SWAP R{r3[i]}, R{r1[i]}" for i in rows]
+        elif name in ISA.THREE_OPERAND_INSTRUCTIONS:
+            formatted = [f"{name} R{r1[i]}, R{r2[i]}, R{r3[i]}" for i in rows]
+        elif name == 'IADD':
+            formatted = [f"IADD R{r1[i]}, R{r2[i]}, 0x{imm[i] & 0xFFFF:X}" for i in rows]
+        elif name == 'LDM':
+            formatted = [f"LDM R{r1[i]}, 0x{imm[i]:X}" for i in rows]
+        elif name == 'LDD':
+            formatted = [f"LDD R{r1[i]}, 0x{imm[i] & 0xFFFF:X}(R{r2[i]})" for i in rows]
+        elif name == 'STD':
+            formatted = [f"STD R{r3[i]}, 0x{imm[i] & 0xFFFF:X}(R{r2[i]})" for i in rows]
+        elif name == 'INT':
+            formatted = [f"INT 0x{imm[i] & 0xFFFF:X}" for i in rows]
+        else:
+            formatted = [f"{name} L_{imm[i]:05X}" if label_at[imm[i]] else f"{name} 0x{imm[i]:X}"
+                         for i in rows]
+        text[rows] = formatted
+
+    rows = np.nonzero(emitted)[0]
+    if addresses:
+        body = [f"    {line:32s}; {addr:05X}" for line, addr in zip(text[rows].tolist(), starts[rows].tolist())]
+    else:
+        body = [f"    {line}" for line in text[rows].tolist()]
+    # .ORG and label lines go in front of the few records that need them
+    out = [f"; Disassembly of {source or 'image'}: {length} words, {len(rows)} records"]
+    labelled = label_at[starts]
+    done = 0
+    for pos in np.nonzero((needs_org | labelled)[rows])[0].tolist():
+        out.extend(body[done:pos])
+        i = rows[pos]
+        if needs_org[i]:
+            out.append(f"\n.ORG 0x{starts[i]:X}")
+        if labelled[i]:
+            out.append(f"L_{starts[i]:05X}:")
+        done = pos
+    out.extend(body[done:])
+    return "\n".join(out) + "\n"
+
+
+def reassemble(text: str) -> Optional[np.ndarray]:
+    """Assemble disassembler output; the image, or None on errors"""
+    from assembler import Assembler
+    assembler = Assembler()
+    assembler.first_pass(text.splitlines())
+    if not assembler.errors:
+        assembler.second_pass()
+    if assembler.errors:
+        return None
+    return np.frombuffer(assembler.memory_image, dtype=np.uint32)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="disassembler",
+        description="Disassemble a memory image into assembly that re-assembles to the same image"
+    )
+    parser.add_argument('input_file', type=str, help='Image to disassemble (.mem, .smem, .raw or .asm)')
+    parser.add_argument('-o', '--output', type=str, help='Output .asm file (default: stdout)')
+    parser.add_argument('--no-addresses', action='store_true',
+                        help='Leave out the address comment on every line')
+    parser.add_argument('--verify', action='store_true',
+                        help='Re-assemble the output and compare it with the image')
+
+    args = parser.parse_args()
+    try:
+        image, length = load_image(args.input_file)
+    except (OSError, ValueError) as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        sys.exit(1)
+
+    start = time.perf_counter()
+    text = disassemble(image, length, not args.no_addresses, args.input_file)
+    elapsed = time.perf_counter() - start
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+    print(f"[DISASSEMBLED] {length} words in {elapsed * 1000:.1f} ms", file=sys.stderr)
+
+    if args.verify:
+        rebuilt = reassemble(text)
+        if rebuilt is None:
+            print("[VERIFY] output does not assemble", file=sys.stderr)
+            sys.exit(1)
+        differ = np.nonzero(rebuilt != image)[0]
+        if len(differ):
+            print(f"[VERIFY] {len(differ)} word(s) differ, first at {differ[0]:05X}", file=sys.stderr)
+            sys.exit(1)
+        print("[VERIFY] re-assembled image is identical", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,604 @@
+#!/usr/bin/env python3
+"""
+Differential Fuzzer
+Generates constrained-random programs that always assemble and terminate,
+then checks each one through every tool that must agree on it:
+
+  - assemble (assembler.py)
+  - disassemble and re-assemble to the same image, and decode every code
+    word back to the source operands (disassembler.py)
+  - run on the interpreted and the translated functional simulator and on
+    the cycle-level pipeline model, and compare the final architectural
+    state: halted, R0-R7, SP, OUT values and memory
+
+Programs are built from ISA.OPCODES: straight-line ALU, I/O and data-memory
+instructions, forward branches on whatever flags are current, bounded
+loops, balanced PUSH/POP groups, CALL into an acyclic set of subroutines,
+INT into straight-line handlers and a .DW data block.
+Three documented differences between the pipeline model (like the RTL) and
+the ISA remain: reading a register right after POP into it, JMP/CALL less
+than two instructions after one using the memory port (the RTL then takes
+the jump target from the data bus) and an LDM immediate with CALL's opcode
+bits (decode detects CALL on the raw IF/ID word). They are generated like
+anything else. A pipeline failure that goes away once avoid_rtl_hazards()
+rewrites the program around them is reported as a known mismatch and does
+not fail the run; --avoid-rtl-hazards applies that rewrite up front.
+
+A failing program is reduced by delta debugging over the generator's items
+to a minimal program that still fails the same way.
+Requires NumPy (disassembler).
+"""
+
+import os
+import sys
+import time
+import random
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from isa_constants import ISA
+from assembler import Assembler
+from disassembler import disassemble, reassemble
+from simulator import Simulator
+from pipeline import PipelineModel
+
+
+WORD_MASK = 0xFFFFFFFF
+MODELS = ('interpreter', 'translator', 'pipeline')
+# The pipeline model's limit is cycles, the simulators' is instructions
+PIPELINE_CYCLES_PER_INSTRUCTION = 5
+
+# ========== PROGRAM LAYOUT ==========
+# M[0] reset vector, M[1] hardware interrupt vector, M[2..] INT vectors;
+# the data block follows the vectors, code starts at CODE_ORG
+INT_HANDLERS = 2
+DATA_ORG = 2 + INT_HANDLERS
+DATA_WORDS = 16
+CODE_ORG = 0x20
+
+GENERAL = ('R0', 'R1', 'R2', 'R3', 'R4', 'R5')
+DATA_BASE = 'R6'            # Holds DATA_ORG for LDD/STD
+LOOP_COUNTER = 'R7'
+REGISTERS = GENERAL + (DATA_BASE, LOOP_COUNTER)
+
+# Instructions that write Z, N and C, put in front of some conditional jumps
+FLAG_SETTERS = ('NOT', 'INC', 'ADD', 'SUB', 'AND', 'IADD')
+CONDITIONAL = ('JZ', 'JN', 'JC')
+SETTER_BEFORE_BRANCH = 0.5  # Otherwise the jump tests the flags left by earlier code
+# A JMP/CALL up to JUMP_DISTANCE instructions after one of these (or at a
+# CALL target) goes to the wrong address on the pipeline model and the RTL;
+# NOPs are put in between
+MEMORY_INSTRUCTIONS = ('PUSH', 'POP', 'LDD', 'STD')
+JUMP_DISTANCE = 2
+# An immediate word with this opcode in bits 31:27 acts as a CALL
+CALL_OPCODE = ISA.OPCODES['CALL']
+IMM16_EDGES = (0, 1, -1, 0x7FFF, -0x8000, 0xFFFF)
+IMM32_EDGES = (0, 1, 0x7FFFFFFF, 0x80000000, 0xFFFFFFFF)
+
+# A generator item: its own source lines (str) and the items nested in it
+# (list), which the minimizer may drop without breaking the program, e.g.
+# ['JZ L4', [...body items...], 'L4:'] or a whole loop or PUSH/POP group
+Item = List
+
+
+# ================= GENERATOR =================
+
+class ProgramGenerator:
+    """
+    One random program per seed, as a tree of items (see Item). Control flow
+    only goes forward except for counted loops, subroutine i only calls
+    subroutines after it and handlers neither call nor interrupt, so every
+    program halts.
+    """
+
+    def __init__(self, seed: int, size: int = 24, subroutines: int = 3):
+        self.random = random.Random(seed)
+        self.seed = seed
+        self.size = size
+        self.subroutines = subroutines
+        self.labels = 0
+        # Mnemonic -> emitter of one item built around it
+        self.emitters = {
+            'NOP': self.plain, 'HLT': None, 'SETC': self.plain,
+            'NOT': self.single, 'INC': self.single, 'IN': self.single, 'OUT': self.output,
+            'MOV': self.move, 'SWAP': self.swap,
+            'ADD': self.three, 'SUB': self.three, 'AND': self.three,
+            'IADD': self.iadd, 'LDM': self.ldm, 'LDD': self.ldd, 'STD': self.std,
+            'PUSH': self.stack, 'POP': self.stack,
+            'JZ': self.branch, 'JN': self.branch, 'JC': self.branch, 'JMP': self.jump,
+            'CALL': self.call, 'RET': None, 'INT': self.interrupt, 'RTI': None,
+        }
+        assert set(self.emitters) == set(ISA.OPCODES)
+
+    def label(self, prefix: str = 'L') -> str:
+        self.labels += 1
+        return f"{prefix}{self.labels}"
+
+    def reg(self, pool: Sequence[str] = GENERAL) -> str:
+        return self.random.choice(pool)
+
+    def imm16(self) -> int:
+        if self.random.random() < 0.3:
+            return self.random.choice(IMM16_EDGES)
+        return self.random.randint(-0x8000, 0x7FFF)
+
+    def imm32(self) -> str:
+        if self.random.random() < 0.3:
+            return f"0x{self.random.choice(IMM32_EDGES):X}"
+        return f"0x{self.random.getrandbits(32):X}"
+
+    # ========== ITEMS ==========
+    # Each emitter takes the context ('main', 'sub<k>', 'isr') and depth
+
+    def plain(self, mnemonic, context, depth) -> Item:
+        return [mnemonic]
+
+    def single(self, mnemonic, context, depth) -> Item:
+        return [f"{mnemonic} {self.reg()}"]
+
+    def output(self, mnemonic, context, depth) -> Item:
+        return [f"OUT {self.reg(REGISTERS)}"]
+
+    def move(self, mnemonic, context, depth) -> Item:
+        return [f"MOV {self.reg(REGISTERS)}, {self.reg()}"]
+
+    def swap(self, mnemonic, context, depth) -> Item:
+        return [f"SWAP {self.reg()}, {self.reg()}"]
+
+    def three(self, mnemonic, context, depth) -> Item:
+        return [f"{mnemonic} {self.reg()}, {self.reg(REGISTERS)}, {self.reg(REGISTERS)}"]
+
+    def iadd(self, mnemonic, context, depth) -> Item:
+        return [f"IADD {self.reg()}, {self.reg(REGISTERS)}, {self.imm16()}"]
+
+    def ldm(self, mnemonic, context, depth) -> Item:
+        return [f"LDM {self.reg()}, {self.imm32()}"]
+
+    def ldd(self, mnemonic, context, depth) -> Item:
+        return [f"LDD {self.reg()}, {self.random.randrange(DATA_WORDS)}({DATA_BASE})"]
+
+    def std(self, mnemonic, context, depth) -> Item:
+        return [f"STD {self.reg(REGISTERS)}, {self.random.randrange(DATA_WORDS)}({DATA_BASE})"]
+
+    def setter(self) -> Item:
+        mnemonic = self.random.choice(FLAG_SETTERS)
+        return self.emitters[mnemonic](mnemonic, None, 0)
+
+    def stack(self, mnemonic, context, depth) -> Item:
+        count = self.random.randint(1, 3)
+        lines = [f"PUSH {self.reg(REGISTERS)}" for _ in range(count)]
+        lines += self.straight(self.random.randint(0, 3))
+        lines += [f"POP {self.reg()}" for _ in range(count)]
+        return lines
+
+    def branch(self, mnemonic, context, depth) -> Item:
+        target = self.label()
+        setter = self.setter() if self.random.random() < SETTER_BEFORE_BRANCH else []
+        return (setter + [f"{mnemonic} {target}"]
+                + self.items(self.random.randint(0, 3), context, depth + 1) + [f"{target}:"])
+
+    def jump(self, mnemonic, context, depth) -> Item:
+        target = self.label()
+        return [f"JMP {target}"] + self.straight(self.random.randint(0, 2)) + [f"{target}:"]
+
+    def loop(self, context, depth) -> Item:
+        top, out = self.label('loop'), self.label('done')
+        return ([f"LDM {LOOP_COUNTER}, {self.random.randint(1, 4)}", f"{top}:"]
+                + self.items(self.random.randint(1, 4), context, depth + 1)
+                + [f"IADD {LOOP_COUNTER}, {LOOP_COUNTER}, -1", f"JZ {out}", f"JMP {top}", f"{out}:"])
+
+    def call(self, mnemonic, context, depth) -> Item:
+        first = int(context[3:]) + 1 if context.startswith('sub') else 0
+        if first >= self.subroutines:
+            return self.setter()
+        return [f"CALL sub{self.random.randrange(first, self.subroutines)}"]
+
+    def interrupt(self, mnemonic, context, depth) -> Item:
+        # Handlers return with RTI, which restores the flags INT pushed
+        return self.setter() + [f"INT {self.random.randrange(INT_HANDLERS)}"]
+
+    def straight(self, count: int) -> List[Item]:
+        return self.items(count, 'isr', 99)
+
+    def items(self, count: int, context: str, depth: int) -> List[Item]:
+        choices = [m for m, emit in self.emitters.items() if emit is not None]
+        if context == 'isr':
+            choices = [m for m in choices if m not in ('CALL', 'INT')]
+        if depth >= 2:
+            choices = [m for m in choices if m not in ('PUSH', 'POP') + CONDITIONAL]
+        if depth >= 99:
+            choices = [m for m in choices if m != 'JMP']
+        items: List[Item] = []
+        for _ in range(count):
+            if context == 'main' and depth == 0 and self.random.random() < 0.08:
+                items.append(self.loop(context, depth))
+                continue
+            mnemonic = self.random.choice(choices)
+            items.append(self.emitters[mnemonic](mnemonic, context, depth))
+        return items
+
+    # ========== PROGRAM ==========
+
+    def tree(self) -> Item:
+        rnd = self.random
+        lines: Item = [f"; fuzzer seed {self.seed}", ".ORG 0", ".DW main", ".DW 0"]
+        lines += [f".DW isr{n}" for n in range(INT_HANDLERS)]
+        lines += ["data:"] + [f".DW 0x{rnd.getrandbits(32):X}" for _ in range(DATA_WORDS)]
+        lines += [f".ORG 0x{CODE_ORG:X}", "main:", f"LDM {DATA_BASE}, {DATA_ORG}"]
+        lines += self.items(self.size, 'main', 0) + ["HLT"]
+        for k in range(self.subroutines):
+            lines += [f"sub{k}:"] + self.items(rnd.randint(1, max(self.size // 4, 1)), f"sub{k}", 0)
+            lines += ["RET"]
+        for n in range(INT_HANDLERS):
+            lines += [f"isr{n}:"] + self.straight(rnd.randint(1, 5)) + ["RTI"]
+        return lines
+
+
+def flatten(item: Item) -> List[str]:
+    lines: List[str] = []
+    for element in item:
+        if isinstance(element, str):
+            lines.append(element)
+        else:
+            lines.extend(flatten(element))
+    return lines
+
+
+def build(tree: Item, avoid_hazards: bool = False) -> List[str]:
+    """Source lines of a program tree"""
+    lines = flatten(tree)
+    return avoid_rtl_hazards(lines) if avoid_hazards else lines
+
+
+def avoid_rtl_hazards(lines: List[str]) -> List[str]:
+    """
+    The same program with the known RTL differences worked around: a NOP
+    after the last POP of a group, bit 31 flipped in CALL-like LDM
+    immediates and NOPs in front of JMP/CALL (see separate_jumps). None of
+    them changes what the program computes on the ISA.
+    """
+    out: List[str] = []
+    for n, line in enumerate(lines):
+        if line.startswith('LDM '):
+            register, value = line[4:].split(', ')
+            if int(value, 0) >> 27 == CALL_OPCODE:
+                line = f"LDM {register}, 0x{int(value, 0) ^ (1 << 31):X}"
+        out.append(line)
+        if line.startswith('POP ') and not (n + 1 < len(lines) and lines[n + 1].startswith('POP ')):
+            out.append('NOP')
+    return separate_jumps(out)
+
+
+def separate_jumps(lines: List[str]) -> List[str]:
+    """
+    NOPs in front of every JMP/CALL closer than JUMP_DISTANCE to a memory
+    instruction or to the start of a subroutine (the CALL's push is in MEM).
+    Source order stands in for execution order: forward jumps only skip
+    code and a loop jumps back after IADD and JZ, so the distance it gives
+    is never too long.
+    """
+    out: List[str] = []
+    since = JUMP_DISTANCE   # Instructions since the last memory instruction
+    for line in lines:
+        if line.endswith(':'):
+            if line.startswith('sub'):
+                since = 0
+        elif not line.startswith(('.', ';')):
+            mnemonic = line.split(None, 1)[0]
+            if mnemonic in ('JMP', 'CALL'):
+                out.extend(['NOP'] * (JUMP_DISTANCE - since))
+            since = 0 if mnemonic in MEMORY_INSTRUCTIONS else since + 1
+        out.append(line)
+    return out
+
+
+def generate(seed: int, size: int = 24, avoid_hazards: bool = False) -> List[str]:
+    return build(ProgramGenerator(seed, size).tree(), avoid_hazards)
+
+
+# ================= CHECKS =================
+
+def _canonical(assembler: Assembler, mnemonic: str, operand: str, symbols: Dict[str, int]):
+    """Operand in a form comparable between source and disassembly"""
+    reg = assembler.parse_register(operand)
+    if reg is not None:
+        return 'R', reg
+    offset = assembler.parse_offset_operand(operand)
+    if offset is not None:
+        return 'M', offset[0] & 0xFFFF, offset[1]
+    if operand in symbols:
+        value = symbols[operand]
+    elif operand.startswith('L_'):
+        value = int(operand[2:], 16)
+    else:
+        value = assembler.parse_number(operand)
+        if value is None:
+            return operand
+    return value & (0xFFFF if mnemonic in ('IADD', 'INT') else WORD_MASK)
+
+
+def decode_mismatches(assembler: Assembler, text: str) -> List[str]:
+    """Code records whose disassembly does not name the source operands"""
+    records: Dict[int, Tuple] = {}
+    for line in text.splitlines():
+        code, _, address = line.partition(';')
+        if not address.strip() or ':' in code or code.lstrip().startswith('.'):
+            continue
+        _, mnemonic, operands = assembler.tokenize_line(code)
+        if mnemonic:
+            records[int(address, 16)] = mnemonic, operands
+    symbols = assembler.symbol_table
+    problems = []
+    for instr in assembler.instructions:
+        if instr.mnemonic.startswith('.'):
+            continue
+        expected = (instr.mnemonic, [_canonical(assembler, instr.mnemonic, op, symbols)
+                                     for op in instr.operands])
+        found = records.get(instr.address)
+        if found is not None:
+            found = (found[0], [_canonical(assembler, found[0], op, {}) for op in found[1]])
+        if found != expected:
+            problems.append(f"{instr.address:05X}: {instr.mnemonic} {', '.join(instr.operands)}"
+                            f" disassembles as {found}")
+    return problems
+
+
+def run_model(model: str, memory: List[int], in_values: Sequence[int], max_cycles: int):
+    """(halted, regs, sp, out_port, memory) after running one model"""
+    if model == 'pipeline':
+        machine = PipelineModel(memory, in_values)
+        halted = machine.run(max_cycles * PIPELINE_CYCLES_PER_INSTRUCTION).halted
+    else:
+        machine = Simulator(memory, in_values, translate=(model == 'translator'))
+        machine.run(max_cycles)
+        halted = machine.halted
+    return halted, machine.regs, machine.sp, machine.out_port, machine.memory
+
+
+def compare_runs(reference: Tuple, other: Tuple) -> Optional[str]:
+    """First architectural difference between two halted runs"""
+    for n in range(8):
+        if reference[1][n] != other[1][n]:
+            return f"R{n} {reference[1][n]:08X} vs {other[1][n]:08X}"
+    if reference[2] != other[2]:
+        return f"SP {reference[2]:05X} vs {other[2]:05X}"
+    if reference[3] != other[3]:
+        return f"OUT {[hex(v) for v in reference[3]]} vs {[hex(v) for v in other[3]]}"
+    if reference[4] != other[4]:
+        address = next(a for a, (x, y) in enumerate(zip(reference[4], other[4])) if x != y)
+        return f"M[{address:05X}] {reference[4][address]:08X} vs {other[4][address]:08X}"
+    return None
+
+
+def check(lines: List[str], in_values: Sequence[int] = (), max_cycles: int = 2000,
+          models: Sequence[str] = MODELS) -> Optional[Tuple[str, str]]:
+    """
+    Every check on one program: None when all pass, else (signature, detail).
+    The signature names the kind of failure and the models involved; the
+    minimizer keeps a reduction only if the signature stays the same.
+    """
+    assembler = Assembler()
+    assembler.first_pass(lines)
+    if not assembler.errors:
+        assembler.second_pass()
+    if assembler.errors:
+        return 'assemble', assembler.errors[0]
+    highest = assembler.highest_address()
+    length = 0 if highest is None else highest + 1
+
+    # Only the used prefix: decoding the whole 2^18-word image dominates otherwise
+    image = np.frombuffer(assembler.memory_image, dtype=np.uint32)[:length]
+    text = disassemble(image.copy(), length)
+    again = reassemble(text)
+    if again is None:
+        return 'roundtrip', 'disassembly does not assemble'
+    differ = np.nonzero(again[:length] != image)[0]
+    if len(differ):
+        address = int(differ[0])
+        return 'roundtrip', f"M[{address:05X}] {int(image[address]):08X} -> {int(again[address]):08X}"
+    problems = decode_mismatches(assembler, text)
+    if problems:
+        return 'decode', problems[0]
+
+    memory = assembler.memory_image[:length].tolist()
+    runs = []
+    for model in models:
+        try:
+            runs.append(run_model(model, memory, in_values, max_cycles))
+        except Exception as exc:
+            return f"crash {model}", f"{type(exc).__name__}: {exc}"
+    reference = runs[0]
+    for model, run in zip(models[1:], runs[1:]):
+        if run[0] != reference[0]:
+            return (f"hang {model if reference[0] else models[0]}",
+                    f"{models[0]} halted {reference[0]}, {model} {run[0]}")
+        if run[0]:
+            difference = compare_runs(reference, run)
+            if difference:
+                return f"diverge {models[0]}/{model}", difference
+    return None
+
+
+def classify(lines: List[str], **options) -> Optional[Tuple[str, str]]:
+    """
+    check(), with a pipeline hang or divergence that avoid_rtl_hazards()
+    makes disappear marked as a known mismatch ('known ...' signature)
+    """
+    result = check(lines, **options)
+    if (result is not None and result[0].startswith(('hang', 'diverge'))
+            and 'pipeline' in result[0] and check(avoid_rtl_hazards(lines), **options) is None):
+        return f"known {result[0]}", result[1]
+    return result
+
+
+def is_known(failure: Dict) -> bool:
+    return failure['signature'].startswith('known ')
+
+
+# ================= MINIMIZATION =================
+
+def minimize(tree: Item, signature: str, avoid_hazards: bool = False, **options) -> List[str]:
+    """
+    Hierarchical delta debugging: ddmin over the nested items of the tree,
+    outermost first, keeping a reduction while the failure signature stays
+    the same. Only whole items are dropped, so every candidate is still a
+    well-formed program (balanced stack, defined labels, vectors in place).
+    The tree is reduced in place; returns its source lines.
+    """
+    def fails() -> bool:
+        result = classify(build(tree, avoid_hazards), **options)
+        return result is not None and result[0] == signature
+
+    pending = [tree]
+    while pending:
+        node = pending.pop(0)
+        original = node[:]
+        fixed = [n for n, element in enumerate(original) if isinstance(element, str)]
+        keep = [n for n, element in enumerate(original) if not isinstance(element, str)]
+
+        def fails_with(candidate: List[int]) -> bool:
+            node[:] = [original[n] for n in sorted(fixed + candidate)]
+            return fails()
+
+        chunks = 2
+        while keep:
+            size = -(-len(keep) // chunks)
+            for start in range(0, len(keep), size):
+                candidate = keep[:start] + keep[start + size:]
+                if fails_with(candidate):
+                    keep = candidate
+                    chunks = max(chunks - 1, 2)
+                    break
+            else:
+                if size == 1:
+                    break
+                chunks = min(chunks * 2, len(keep))
+        node[:] = [original[n] for n in sorted(fixed + keep)]
+        pending.extend(original[n] for n in keep)
+    return build(tree, avoid_hazards)
+
+
+# ================= DRIVER =================
+
+_worker_options: Dict = {}
+
+
+def _init_worker(options: Dict):
+    global _worker_options
+    _worker_options = options
+
+
+def fuzz_one(seed: int) -> Optional[Dict]:
+    """Generate, check and (on failure) minimize one program"""
+    options = _worker_options
+    rnd = random.Random(seed)
+    in_values = [rnd.getrandbits(32) for _ in range(4)]
+    tree = ProgramGenerator(seed, options['size']).tree()
+    lines = build(tree, options['avoid_hazards'])
+    check_options = dict(in_values=in_values, max_cycles=options['max_cycles'], models=options['models'])
+    result = classify(lines, **check_options)
+    if result is None:
+        return None
+    signature, detail = result
+    # Known mismatches are frequent and already understood: not worth reducing
+    if options['minimize'] and not signature.startswith('known '):
+        reduced = minimize(tree, signature, options['avoid_hazards'], **check_options)
+    else:
+        reduced = lines
+    return {'seed': seed, 'signature': signature, 'detail': detail, 'lines': len(lines),
+            'in_values': in_values, 'minimized': reduced}
+
+
+def _fuzz_chunk(seeds: range) -> List[Dict]:
+    return [failure for failure in map(fuzz_one, seeds) if failure is not None]
+
+
+def fuzz(seeds: range, options: Dict, jobs: Optional[int] = None) -> List[Dict]:
+    """Failures among `seeds`, in seed order (jobs=1 runs in this process)"""
+    jobs = min(jobs or os.cpu_count() or 1, max(len(seeds), 1))
+    if jobs == 1:
+        _init_worker(options)
+        return _fuzz_chunk(seeds)
+    step = max(1, min(64, len(seeds) // (jobs * 4)))
+    chunks = [seeds[i:i + step] for i in range(0, len(seeds), step)]
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(options,)) as pool:
+        return [failure for found in pool.map(_fuzz_chunk, chunks) for failure in found]
+
+
+def format_failure(failure: Dict) -> str:
+    if is_known(failure):
+        return f"seed {failure['seed']}: {failure['signature']}: {failure['detail']}"
+    lines = [f"seed {failure['seed']}: {failure['signature']}: {failure['detail']}",
+             f"  minimized {failure['lines']} -> {len(failure['minimized'])} lines, "
+             f"IN values {', '.join(hex(v) for v in failure['in_values'])}"]
+    lines += [f"    {line}" for line in failure['minimized']]
+    return "\n".join(lines)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="fuzzer",
+        description="Random valid programs checked across assembler, disassembler, functional "
+                    "simulator and pipeline model, with failing programs minimized"
+    )
+    parser.add_argument('-n', '--count', type=int, default=1000, help='Programs to generate (default: 1000)')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='First seed (default: 0)')
+    parser.add_argument('--size', type=int, default=24, help='Items in main (default: 24)')
+    parser.add_argument('-c', '--max-cycles', type=int, default=2000,
+                        help='Instruction limit per run, times 5 in cycles for the pipeline (default: 2000)')
+    parser.add_argument('--models', type=str, default=','.join(MODELS),
+                        help=f"Models to compare, first is the reference (default: {','.join(MODELS)})")
+    parser.add_argument('--avoid-rtl-hazards', action='store_true',
+                        help='Work around POP load-use, JMP/CALL near memory instructions and '
+                             'CALL-like LDM immediates instead of reporting them as known mismatches')
+    parser.add_argument('--no-minimize', action='store_true', help='Report failing programs unreduced')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help='Worker processes (default: number of CPUs)')
+    parser.add_argument('-o', '--out', type=str, metavar='DIR',
+                        help='Write each minimized failure to DIR/fuzz_<seed>.asm')
+    parser.add_argument('--show', type=int, metavar='SEED', help='Print the program of one seed and check it')
+
+    args = parser.parse_args()
+    models = tuple(m.strip() for m in args.models.split(',') if m.strip())
+    unknown = set(models).difference(MODELS)
+    if unknown or not models:
+        parser.error(f"models must be among {', '.join(MODELS)}")
+    options = {'size': args.size, 'avoid_hazards': args.avoid_rtl_hazards, 'max_cycles': args.max_cycles,
+               'models': models, 'minimize': not args.no_minimize}
+
+    if args.show is not None:
+        lines = generate(args.show, args.size, args.avoid_rtl_hazards)
+        print("\n".join(lines))
+        _init_worker(options)
+        failure = fuzz_one(args.show)
+        print(f"\n; {format_failure(failure) if failure else 'all checks pass'}")
+        sys.exit(1 if failure and not is_known(failure) else 0)
+
+    start = time.perf_counter()
+    failures = fuzz(range(args.seed, args.seed + args.count), options, args.jobs)
+    elapsed = time.perf_counter() - start
+
+    for failure in failures:
+        print(format_failure(failure))
+        if args.out and not is_known(failure):
+            os.makedirs(args.out, exist_ok=True)
+            path = os.path.join(args.out, f"fuzz_{failure['seed']}.asm")
+            with open(path, 'w') as f:
+                f.write(f"; {failure['signature']}: {failure['detail']}\n")
+                f.write(f"; IN values: {', '.join(hex(v) for v in failure['in_values'])}\n")
+                f.write("\n".join(failure['minimized']) + "\n")
+    kinds: Dict[str, int] = {}
+    for failure in failures:
+        kinds[failure['signature']] = kinds.get(failure['signature'], 0) + 1
+    summary = ', '.join(f"{n} {kind}" for kind, n in sorted(kinds.items()) if not kind.startswith('known ')) or 'none'
+    known = ', '.join(f"{n} {kind[6:]}" for kind, n in sorted(kinds.items()) if kind.startswith('known ')) or 'none'
+    print(f"{args.count} program(s) in {elapsed:.2f} s ({args.count / elapsed:.0f}/s), "
+          f"failures: {summary}; known RTL mismatches: {known}")
+    sys.exit(1 if any(not is_known(failure) for failure in failures) else 0)
+
+
+if __name__ == "__main__":
+    main()
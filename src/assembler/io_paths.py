@@ -0,0 +1,56 @@
+"""
+Input and Output Paths
+Glob expansion of source arguments and the output file name derived from a
+source, shared by the command-line tools that assemble many files
+(batch_assembler.py, watcher.py).
+"""
+
+import os
+import glob
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+OUTPUT_EXTENSIONS = {'hex': '.hex', 'bin': '.bin', 'mem': '.mem', 'smem': '.smem', 'raw': '.raw'}
+
+
+def output_path(path: str, fmt: str, output: Optional[str] = None, out_dir: Optional[str] = None) -> str:
+    """-o for a single input, otherwise <out_dir or source dir>/<name>.<fmt>"""
+    if output:
+        return output
+    name = os.path.splitext(os.path.basename(path))[0] + OUTPUT_EXTENSIONS[fmt]
+    return os.path.join(out_dir or os.path.dirname(path) or '.', name)
+
+
+def expand_patterns(patterns: List[str]) -> List[str]:
+    """Files matching the given paths/globs, in a stable order"""
+    files = []
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        for match in sorted(matches):
+            if match not in files:
+                files.append(match)
+    return files
+
+
+def colliding_outputs(jobs: Sequence[Tuple[str, str]]) -> Dict[str, List[str]]:
+    """
+    Outputs claimed by more than one (input, output) pair, e.g. a/test.asm
+    and b/test.asm under one --out-dir: output -> its inputs, in order
+    """
+    claims: Dict[str, List[str]] = {}
+    names: Dict[str, str] = {}
+    for path, output in jobs:
+        key = os.path.normcase(os.path.abspath(output))
+        names.setdefault(key, output)
+        claims.setdefault(key, []).append(path)
+    return {names[key]: paths for key, paths in claims.items() if len(set(paths)) > 1}
+
+
+def collision_errors(jobs: Sequence[Tuple[str, str]]) -> Dict[str, str]:
+    """Input -> error for every input whose output another input also claims"""
+    errors = {}
+    for output, paths in colliding_outputs(jobs).items():
+        for path in paths:
+            others = ', '.join(sorted(set(paths) - {path}))
+            errors[path] = f"Output '{output}' is also the output of {others}; not assembled"
+    return errors
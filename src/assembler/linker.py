@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Linker for Relocatable Assembler Objects
+Places separately assembled modules (assembler.py -c) in the 18-bit address
+space, resolves .GLOBAL/.EXTERN symbols, patches relocations and writes the
+final memory image in any assembler output format. Sources given as .asm are
+assembled to objects first, and only when the object is missing or older
+than its source, so a one-module change costs that module plus the link.
+"""
+
+import os
+import sys
+import json
+from array import array
+from typing import Dict, List, Optional, Tuple
+from isa_constants import ISA
+from assembler import (Assembler, WORD_TYPECODE, OBJECT_FORMAT, OBJECT_FORMAT_VERSION)
+
+
+class ObjectModule:
+    """One relocatable object as loaded from disk"""
+
+    def __init__(self, name: str, path: str, size: int,
+                 sections: List[Tuple[int, array]], exports: Dict[str, int],
+                 imports: List[str], relocations: List[Tuple[int, str, Optional[str]]]):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.sections = sections
+        self.exports = exports
+        self.imports = imports
+        self.relocations = relocations
+        self.base: Optional[int] = None
+
+
+def load_object(path: str) -> ObjectModule:
+    """Read an object written by Assembler.generate_object (ValueError if it is not one)"""
+    with open(path, 'r') as f:
+        obj = json.load(f)
+    if not isinstance(obj, dict) or obj.get('format') != OBJECT_FORMAT:
+        raise ValueError(f"'{path}' is not an assembler object file")
+    if obj.get('version') != OBJECT_FORMAT_VERSION:
+        raise ValueError(f"'{path}' has object format version {obj.get('version')}, "
+                         f"expected {OBJECT_FORMAT_VERSION}; reassemble it")
+
+    sections = []
+    for start, digits in obj['sections']:
+        words = array(WORD_TYPECODE, bytes.fromhex(digits))
+        if sys.byteorder == 'little':
+            words.byteswap()
+        sections.append((start, words))
+    relocations = [(at, kind, symbol) for at, kind, symbol in obj['relocations']]
+    name = os.path.splitext(os.path.basename(path))[0]
+    return ObjectModule(name, path, obj['size'], sections, obj['exports'],
+                        obj['imports'], relocations)
+
+
+def ensure_object(source: str, obj_dir: Optional[str] = None,
+                  hex_mode: Optional[bool] = None) -> Tuple[str, Optional[List[str]]]:
+    """
+    Object path for an .asm source, assembling it only if the object is
+    missing, older than the source or assembled with another hex mode.
+    Returns (object path, errors or None).
+    """
+    name = os.path.splitext(os.path.basename(source))[0] + '.obj'
+    obj_path = os.path.join(obj_dir or os.path.dirname(source) or '.', name)
+    if hex_mode is None:
+        from simulator import guess_hex_mode
+        try:
+            hex_mode = guess_hex_mode(source)
+        except OSError:
+            hex_mode = False
+    try:
+        if os.path.getmtime(obj_path) >= os.path.getmtime(source):
+            with open(obj_path, 'r') as f:
+                obj = json.load(f)
+            if (isinstance(obj, dict) and obj.get('version') == OBJECT_FORMAT_VERSION
+                    and obj.get('hex_mode') == hex_mode):
+                return obj_path, None
+    except (OSError, ValueError):
+        pass
+
+    assembler = Assembler(hex_mode=hex_mode)
+    if not assembler.assemble_object(source):
+        return obj_path, assembler.errors
+    assembler.generate_object(obj_path, source)
+    return obj_path, None
+
+
+class Linker:
+    def __init__(self, verbose=False):
+        self.verbose = verbose
+        self.modules: List[ObjectModule] = []
+        self.symbols: Dict[str, int] = {}
+        self.errors = []
+        self.memory_image = array(WORD_TYPECODE)
+        self.occupied = bytearray()
+
+    def log(self, message: str):
+        if self.verbose:
+            print(f"[LINKER] {message}")
+
+    def error(self, message: str, module: Optional[ObjectModule] = None):
+        if module is not None:
+            message = f"{module.name}: {message}"
+        self.errors.append(message)
+
+    def add_module(self, module: ObjectModule, base: Optional[int] = None):
+        """Add a module, at `base` or (None) right after the previous one"""
+        module.base = base
+        self.modules.append(module)
+
+    def place_modules(self):
+        """Give unplaced modules consecutive bases and check the memory limit"""
+        next_base = 0
+        for module in self.modules:
+            if module.base is None:
+                module.base = next_base
+            if module.base < 0 or module.base + module.size > ISA.MEMORY_WORDS:
+                self.error(f"{module.size} words at {module.base:05X} exceed memory size "
+                           f"(18-bit limit: {ISA.MEMORY_WORDS:05X})", module)
+            next_base = max(next_base, module.base + module.size)
+            self.log(f"Module {module.name} at {module.base:05X} ({module.size} words)")
+
+    def check_overlaps(self):
+        """Every pair of modules whose used words share an address"""
+        runs = sorted(((module.base + start, module.base + start + len(words), module)
+                       for module in self.modules for start, words in module.sections),
+                      key=lambda run: (run[0], run[1]))
+        # Compare each run with the furthest-reaching run before it, not just its neighbour
+        reach, owner = -1, None
+        for start, end, module in runs:
+            if start < reach and owner is not module:
+                self.error(f"overlaps module {owner.name} at {start:05X}", module)
+            if end > reach:
+                reach, owner = end, module
+
+    def resolve_symbols(self):
+        """Global symbol table from every module's exports"""
+        owners: Dict[str, ObjectModule] = {}
+        for module in self.modules:
+            for name, offset in module.exports.items():
+                if name in owners:
+                    self.error(f"'{name}' is already exported by {owners[name].name}", module)
+                    continue
+                owners[name] = module
+                self.symbols[name] = module.base + offset
+
+    def link(self) -> bool:
+        """Place, resolve and relocate every module into one memory image"""
+        self.place_modules()
+        if self.errors:
+            return False
+        self.check_overlaps()
+        self.resolve_symbols()
+        if self.errors:
+            return False
+
+        image = self.memory_image = array(WORD_TYPECODE, bytes(4 * ISA.MEMORY_WORDS))
+        occupied = self.occupied = bytearray(ISA.MEMORY_WORDS // 8)
+        for module in self.modules:
+            base = module.base
+            for start, words in module.sections:
+                addr = base + start
+                image[addr:addr + len(words)] = words
+                for addr in range(addr, addr + len(words)):
+                    occupied[addr >> 3] |= 1 << (addr & 7)
+
+            for at, kind, symbol in module.relocations:
+                addr = base + at
+                if symbol is None:
+                    target = base
+                elif symbol in self.symbols:
+                    target = self.symbols[symbol]
+                else:
+                    self.error(f"undefined external symbol '{symbol}'", module)
+                    continue
+                # The assembled word holds the module-relative address or,
+                # for imports, the addend (0)
+                value = image[addr] + target
+                if kind == 'branch' and value >= ISA.MEMORY_WORDS:
+                    self.error(f"branch target {value:X} at {addr:05X} exceeds 18-bit memory space",
+                               module)
+                image[addr] = value & 0xFFFFFFFF
+            self.log(f"Module {module.name}: {len(module.relocations)} relocations patched")
+
+        return len(self.errors) == 0
+
+    def generate_output(self, output_file: str, format_type: str = 'mem', start_address: int = 0):
+        """Write the linked image with the assembler's output formatter"""
+        writer = Assembler(verbose=self.verbose)
+        writer.memory_image = self.memory_image
+        writer.occupied = self.occupied
+        writer.generate_output(output_file, format_type, start_address)
+
+    def print_map(self):
+        print("\n=== Link Map ===")
+        for module in sorted(self.modules, key=lambda m: m.base):
+            print(f"{module.base:05X}-{module.base + max(module.size, 1) - 1:05X}  {module.name}")
+        if self.symbols:
+            print("\n=== Global Symbols ===")
+            for name, addr in sorted(self.symbols.items(), key=lambda x: x[1]):
+                print(f"{name:20s} -> {addr:05X}")
+
+    def print_errors(self):
+        if self.errors:
+            print("\n=== Errors ===")
+            for error in self.errors:
+                print(f"ERROR: {error}")
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="linker",
+        description="Link relocatable objects (assembler.py -c) into one memory image"
+    )
+    parser.add_argument('inputs', nargs='+',
+                        help='Object files (.obj) or sources (.asm, assembled when out of date)')
+    parser.add_argument('-o', '--output', type=str,
+                        default='output.mem', help='Output file')
+    parser.add_argument('-f', '--format', type=str,
+                        choices=['hex', 'bin', 'mem', 'smem', 'raw'], default='mem', help='Output format')
+    parser.add_argument('--place', action='append', default=[], metavar='MODULE=ADDR',
+                        help='Base address of a module (by file name without extension); '
+                             'others follow the previous module')
+    parser.add_argument('--obj-dir', type=str,
+                        help='Where objects of .asm inputs are kept (default: next to the source)')
+    parser.add_argument('--hex', action='store_true',
+                        help='Assemble .asm inputs with hex numbers (default: detect per file)')
+    parser.add_argument('--start-address', type=lambda x: int(x, 0), default=0,
+                        help='Starting address')
+    parser.add_argument('-m', '--map', action='store_true', help='Print the link map')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Verbose output')
+
+    args = parser.parse_args()
+    placements = {}
+    for item in args.place:
+        name, _, addr = item.partition('=')
+        try:
+            placements[name] = int(addr, 0)
+        except ValueError:
+            parser.error(f"invalid --place '{item}' (expected MODULE=ADDR)")
+    if args.obj_dir:
+        os.makedirs(args.obj_dir, exist_ok=True)
+
+    linker = Linker(verbose=args.verbose)
+    failed = False
+    for path in args.inputs:
+        if path.lower().endswith('.asm'):
+            path, errors = ensure_object(path, args.obj_dir, True if args.hex else None)
+            if errors:
+                failed = True
+                print(f"[ERROR] {path}:")
+                for err in errors:
+                    print(f"  {err}")
+                continue
+        try:
+            module = load_object(path)
+        except (OSError, ValueError, KeyError) as exc:
+            failed = True
+            print(f"[ERROR] {path}: {exc}")
+            continue
+        linker.add_module(module, placements.pop(module.name, None))
+    for name in placements:
+        print(f"[ERROR] --place: no module named '{name}'")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+    if not linker.link():
+        linker.print_errors()
+        sys.exit(1)
+    linker.generate_output(args.output, args.format, args.start_address)
+    if args.map:
+        linker.print_map()
+    print(f"\n[SUCCESS] Linked {len(linker.modules)} module(s) -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+#!/usr/bin/env python3
+"""
+Memory-System Design Exploration
+Runs programs on pipeline.PipelineModel with a configurable memory system in
+place of the RTL's single uncached port, where every LDD/STD/PUSH/POP (and
+the CALL/RET/INT stack traffic) blocks fetch through
+memory_hazard_unit.PassPC:
+
+  - ports: `unified` (one port: a MEM access still blocks fetch) or `split`
+    (separate instruction and data ports: fetch never yields to MEM)
+  - I-cache and D-cache: size in words, associativity (1 = direct-mapped)
+    and line length, LRU replacement, write-allocate
+  - miss latency: cycles the whole pipeline freezes on a miss (blocking
+    caches; with split ports an I-miss and a D-miss in the same cycle overlap)
+  - prefetch buffer: next-line instruction prefetch into a small FIFO that
+    is checked on an I-cache miss (the prefetch is assumed to have finished)
+
+The caches only model timing; data always comes from the model's memory.
+Reports fetch-blocked cycles, cache stall cycles, hit rates and the CPI
+change against the RTL for every program under every configuration.
+"""
+
+import os
+import sys
+import glob
+import json
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from pipeline import PipelineModel
+from simulator import load_program
+
+
+PORTS = ('unified', 'split')
+
+
+@dataclass(frozen=True)
+class MemoryConfig:
+    """
+    One memory-system design. A cache with 0 words is absent (the port then
+    answers in the same cycle, like the RTL's memory).
+    """
+    name: str = ''
+    ports: str = 'unified'
+    icache_words: int = 0
+    icache_ways: int = 1
+    icache_line: int = 4
+    dcache_words: int = 0
+    dcache_ways: int = 1
+    dcache_line: int = 4
+    miss_latency: int = 10
+    prefetch_lines: int = 0
+
+    @property
+    def split(self) -> bool:
+        return self.ports == 'split'
+
+    @property
+    def label(self) -> str:
+        if self.name:
+            return self.name
+        text = self.ports
+        if self.icache_words:
+            text += f"+I{self.icache_words}x{self.icache_ways}/{self.icache_line}"
+            if self.prefetch_lines:
+                text += f"+pf{self.prefetch_lines}"
+        if self.dcache_words:
+            text += f"+D{self.dcache_words}x{self.dcache_ways}/{self.dcache_line}"
+        if self.icache_words or self.dcache_words:
+            text += f"+m{self.miss_latency}"
+        return text
+
+    def validate(self):
+        """ValueError for a design the model cannot simulate"""
+        if self.ports not in PORTS:
+            raise ValueError(f"ports must be one of {', '.join(PORTS)}, got '{self.ports}'")
+        for cache, words, ways, line in (('icache', self.icache_words, self.icache_ways, self.icache_line),
+                                         ('dcache', self.dcache_words, self.dcache_ways, self.dcache_line)):
+            if not words:
+                continue
+            for what, value in (('size', words), ('ways', ways), ('line', line)):
+                if value < 1 or value & (value - 1):
+                    raise ValueError(f"{cache} {what} must be a power of two, got {value}")
+            if words < ways * line:
+                raise ValueError(f"{cache} of {words} words cannot hold {ways} ways of {line}-word lines")
+        if self.miss_latency < 0:
+            raise ValueError(f"miss latency must be >= 0, got {self.miss_latency}")
+        if self.prefetch_lines < 0 or (self.prefetch_lines and not self.icache_words):
+            raise ValueError("prefetch needs an icache")
+
+
+# What the hardware does today: one port, no caches
+RTL_MEMORY = MemoryConfig(name='rtl')
+
+
+def _parse_cache(value: str) -> Tuple[int, int, int]:
+    """'256', '256:2' or '256:2:8' -> (words, ways, line words)"""
+    parts = [int(part, 0) for part in value.split(':')]
+    if not 1 <= len(parts) <= 3:
+        raise ValueError(f"cache geometry is SIZE[:WAYS[:LINE]], got '{value}'")
+    defaults = [0, 1, 4]
+    parts += defaults[len(parts):]
+    return parts[0], parts[1], parts[2]
+
+
+def parse_config(spec: str) -> MemoryConfig:
+    """'split,icache=256:2:4,dcache=128:1:4,miss=10,prefetch=2,name=x' -> MemoryConfig"""
+    fields: Dict = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        key, sep, value = item.partition('=')
+        if key in PORTS and not sep:
+            fields['ports'] = key
+        elif key in ('icache', 'dcache') and sep:
+            fields[f'{key}_words'], fields[f'{key}_ways'], fields[f'{key}_line'] = _parse_cache(value)
+        elif key == 'miss' and sep:
+            fields['miss_latency'] = int(value, 0)
+        elif key == 'prefetch' and sep:
+            fields['prefetch_lines'] = int(value, 0)
+        elif key == 'name' and sep:
+            fields['name'] = value
+        else:
+            raise ValueError(f"unknown memory setting '{item}'")
+    config = MemoryConfig(**fields)
+    config.validate()
+    return config
+
+
+def default_configs() -> List[MemoryConfig]:
+    """The RTL, split ports alone, then small and larger caches behind either port layout"""
+    configs = [RTL_MEMORY, MemoryConfig(ports='split')]
+    for ports in PORTS:
+        configs.append(MemoryConfig(ports=ports, icache_words=64, dcache_words=64))
+    configs.append(MemoryConfig(ports='split', icache_words=64, icache_ways=2,
+                                dcache_words=64, dcache_ways=2))
+    configs.append(MemoryConfig(ports='split', icache_words=64, prefetch_lines=2, dcache_words=64))
+    configs.append(MemoryConfig(ports='split', icache_words=256, icache_ways=2,
+                                dcache_words=256, dcache_ways=2))
+    configs.append(MemoryConfig(ports='unified', icache_words=256, icache_ways=2, prefetch_lines=4,
+                                dcache_words=256, dcache_ways=2))
+    return configs
+
+
+# ================= CACHES =================
+
+class Cache:
+    """
+    Set-associative tag store with LRU replacement. Only hits and misses are
+    tracked; the data stays in the pipeline model's memory.
+    """
+
+    def __init__(self, words: int, ways: int, line_words: int):
+        self.ways = ways
+        self.line_shift = line_words.bit_length() - 1
+        self.set_mask = words // (ways * line_words) - 1
+        self.sets: List[List[int]] = [[] for _ in range(self.set_mask + 1)]  # Line numbers, LRU first
+        self.hits = 0
+        self.misses = 0
+
+    def line(self, address: int) -> int:
+        return address >> self.line_shift
+
+    def lookup(self, line: int) -> bool:
+        """Count one access; a hit becomes the most recently used line of its set"""
+        lines = self.sets[line & self.set_mask]
+        if line in lines:
+            if lines[-1] != line:
+                lines.remove(line)
+                lines.append(line)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def contains(self, line: int) -> bool:
+        return line in self.sets[line & self.set_mask]
+
+    def fill(self, line: int):
+        lines = self.sets[line & self.set_mask]
+        lines.append(line)
+        if len(lines) > self.ways:
+            del lines[0]
+
+    @property
+    def accesses(self) -> int:
+        return self.hits + self.misses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.hits / self.accesses if self.accesses else 0.0
+
+
+class MemorySystem:
+    """Per-run state of one MemoryConfig, driven by PipelineModel.memory_stall"""
+
+    def __init__(self, config: MemoryConfig):
+        self.config = config
+        self.split = config.split
+        self.icache = (Cache(config.icache_words, config.icache_ways, config.icache_line)
+                       if config.icache_words else None)
+        self.dcache = (Cache(config.dcache_words, config.dcache_ways, config.dcache_line)
+                       if config.dcache_words else None)
+        self.prefetch = deque(maxlen=config.prefetch_lines or None)
+        self.prefetch_hits = 0
+        self.last_fetch: Optional[int] = None
+        # The access that caused a freeze is repeated when it ends, and then hits
+        self.replay = False
+
+    def access(self, fetch: Optional[int], data: Optional[int], write: bool) -> Tuple[int, Optional[str]]:
+        """
+        Fetch address and MEM-stage address of this cycle (None: no access).
+        Returns the miss freeze in cycles and its stall cause.
+        """
+        if self.replay:
+            self.replay = False
+            return 0, None
+        latency = self.config.miss_latency
+        wait, cause = 0, None
+        # A frozen PC fetches the same word again: one access, not one per cycle
+        if fetch is not None and fetch != self.last_fetch:
+            self.last_fetch = fetch
+            if self.icache is not None and not self.fetch_hit(fetch):
+                wait, cause = latency, 'icache'
+        if data is not None and self.dcache is not None:
+            line = self.dcache.line(data)
+            if not self.dcache.lookup(line):
+                self.dcache.fill(line)
+                if latency > wait:
+                    wait, cause = latency, 'dcache'
+        self.replay = bool(wait)
+        return wait, cause
+
+    def fetch_hit(self, address: int) -> bool:
+        """I-cache lookup; on a miss the line is filled, from the prefetch buffer if it is there"""
+        icache = self.icache
+        line = icache.line(address)
+        if icache.lookup(line):
+            return True
+        icache.fill(line)
+        buffered = line in self.prefetch
+        if buffered:
+            self.prefetch.remove(line)
+            self.prefetch_hits += 1
+        if self.prefetch.maxlen:
+            following = line + 1
+            if not icache.contains(following) and following not in self.prefetch:
+                self.prefetch.append(following)
+        return buffered
+
+
+# ================= RUNS =================
+
+def run_program(memory: List[int], config: MemoryConfig, in_values=(), interrupts=(),
+                max_cycles: int = 100_000) -> Dict:
+    """One program under one memory system: the pipeline's stats plus cache counters"""
+    system = MemorySystem(config)
+    model = PipelineModel(memory, in_values, interrupts, memory_system=system)
+    stats = model.run(max_cycles)
+    result = {
+        'config': config.label,
+        'cycles': stats.cycles,
+        'instructions': stats.instructions,
+        'cpi': stats.cpi,
+        'halted': stats.halted,
+        'fetch_blocked': stats.fetch_blocked,
+        'icache_stalls': stats.stalls['icache'],
+        'dcache_stalls': stats.stalls['dcache'],
+        'icache_hit_rate': None,
+        'dcache_hit_rate': None,
+        'prefetch_hits': system.prefetch_hits,
+        'outputs': list(model.out_port),
+    }
+    if system.icache is not None:
+        result['icache_hit_rate'] = system.icache.hit_rate
+    if system.dcache is not None:
+        result['dcache_hit_rate'] = system.dcache.hit_rate
+    return result
+
+
+def evaluate(programs: Dict[str, List[int]], configs: List[MemoryConfig], in_values=(),
+             interrupts=(), max_cycles: int = 100_000) -> Dict[str, List[Dict]]:
+    """
+    Every program under every config. 'cpi_delta' is against the first
+    config; 'output_differs' marks a halted run whose OUT values differ from
+    the first config's, as the unchanged hazards (POP has no load-use
+    interlock) resolve differently once memory timing changes.
+    """
+    results: Dict[str, List[Dict]] = {}
+    for name, memory in programs.items():
+        rows = [run_program(memory, config, in_values, interrupts, max_cycles) for config in configs]
+        reference = rows[0]
+        for row in rows:
+            row['cpi_delta'] = row['cpi'] - reference['cpi']
+            row['output_differs'] = (row['halted'] and reference['halted']
+                                     and row['outputs'] != reference['outputs'])
+        results[name] = rows
+    return results
+
+
+def _rate(value: Optional[float]) -> str:
+    return f"{100 * value:6.1f}%" if value is not None else f"{'-':>7s}"
+
+
+def format_results(results: Dict[str, List[Dict]]) -> str:
+    """Per-program tables plus the mean CPI change of every config"""
+    header = (f"{'Config':36s} {'Cycles':>8s} {'CPI':>6s} {'dCPI':>7s} {'Blocked':>8s} "
+              f"{'I-stall':>8s} {'D-stall':>8s} {'I-hit':>7s} {'D-hit':>7s} {'PF':>5s}")
+    lines = []
+    for name, rows in results.items():
+        lines += ["", name, header, "-" * len(header)]
+        for row in rows:
+            text = (f"{row['config'][:36]:36s} {row['cycles']:8d} {row['cpi']:6.2f} {row['cpi_delta']:+7.2f} "
+                    f"{row['fetch_blocked']:8d} {row['icache_stalls']:8d} {row['dcache_stalls']:8d} "
+                    f"{_rate(row['icache_hit_rate'])} {_rate(row['dcache_hit_rate'])} {row['prefetch_hits']:5d}")
+            if not row['halted']:
+                text += "  (no HLT)"
+            if row['output_differs']:
+                text += "  (OUT differs)"
+            lines.append(text)
+
+    if results:
+        first = next(iter(results.values()))
+        summary = f"{'Config':36s} {'Mean CPI':>9s} {'Mean dCPI':>10s} {'Blocked':>9s}"
+        lines += ["", f"Summary over {len(results)} program(s):", summary, "-" * len(summary)]
+        for n, row in enumerate(first):
+            column = [rows[n] for rows in results.values()]
+            mean_cpi = sum(r['cpi'] for r in column) / len(column)
+            mean_delta = sum(r['cpi_delta'] for r in column) / len(column)
+            blocked = sum(r['fetch_blocked'] for r in column)
+            lines.append(f"{row['config'][:36]:36s} {mean_cpi:9.3f} {mean_delta:+10.3f} {blocked:9d}")
+    return "\n".join(lines)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="memory_system",
+        description="Fetch blocking, cache hit rates and CPI of each program under memory-system designs"
+    )
+    parser.add_argument('inputs', nargs='+',
+                        help='Programs or globs (.asm is assembled first, anything else is read as .mem)')
+    parser.add_argument('--hex', action='store_true',
+                        help='Treat all numbers as Hex by default (auto-detected otherwise)')
+    parser.add_argument('-m', '--memory', type=str, action='append', default=[], metavar='SPEC',
+                        help="Design to evaluate (repeatable), e.g. 'split,icache=256:2:4,dcache=128,"
+                             "miss=10,prefetch=2'; the RTL is always the first, the reference for dCPI "
+                             "(default: a built-in set)")
+    parser.add_argument('--in', dest='in_values', type=str, default='',
+                        help='Comma separated values for successive IN instructions')
+    parser.add_argument('--interrupt', type=int, action='append', default=[],
+                        help='Assert the hardware interrupt during cycle N (repeatable)')
+    parser.add_argument('-c', '--max-cycles', type=int, default=100_000,
+                        help='Stop each program after this many cycles (default: 100000)')
+    parser.add_argument('--json', type=str, metavar='FILE', help='Also write the results as JSON')
+
+    args = parser.parse_args()
+    try:
+        configs = [RTL_MEMORY] + [parse_config(spec) for spec in args.memory] if args.memory \
+            else default_configs()
+    except (ValueError, TypeError) as exc:
+        parser.error(str(exc))
+
+    paths = []
+    for pattern in args.inputs:
+        paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    programs: Dict[str, List[int]] = {}
+    for path in paths:
+        try:
+            programs[os.path.basename(path)] = load_program(path, True if args.hex else None)
+        except (OSError, ValueError) as exc:
+            print(f"ERROR: {exc}")
+            sys.exit(1)
+    in_values = [int(v, 16 if args.hex else 0) for v in args.in_values.split(',') if v.strip()]
+
+    start = time.perf_counter()
+    results = evaluate(programs, configs, in_values, args.interrupt, args.max_cycles)
+    elapsed = time.perf_counter() - start
+    print(format_results(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults: {args.json}")
+    print(f"\n{len(programs)} program(s) x {len(configs)} design(s) in {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Peephole Optimizer
+Optional pass between the assembler's first and second pass that rewrites
+wasteful sequences inside basic blocks and repeats until nothing changes:
+
+  PUSH Rx; RET (the JMP Rx macro) with Rx loaded by LDM  -> JMP <value>
+  MOV Rx, Rx                                             -> removed
+  IADD Rx, Rx, 0  (flags overwritten before use)         -> removed
+  IADD Rx, Ry, 0  (flags overwritten before use)         -> MOV Ry, Rx
+  LDM Rx, n       (Rx written again before it is read)   -> removed
+  JMP to the next instruction                            -> removed
+
+Addresses and labels are laid out again after every round. Code that a
+numeric address points into (JMP 0x14, .DW 0x10, ...), and the code laid out
+before it, is left as it is: moving it would break the number.
+"""
+
+from typing import Dict, List
+from isa_constants import ISA
+from assembler import Instruction
+from analyzer import analyze_program, block_runs, instruction_effects, numeric_addresses, pinned_runs
+
+
+PATTERNS = ('jmp_register', 'mov_self', 'iadd_zero', 'iadd_move', 'dead_ldm', 'jump_next')
+
+# Rounds are bounded; every rewrite shrinks the program, so this is only a guard
+MAX_ROUNDS = 32
+
+
+def flags_dead_after(effects: List, index: int) -> bool:
+    """True if the CCR is fully overwritten later in the block before anything reads it"""
+    for fx in effects[index + 1:]:
+        if fx.flags_read or fx.barrier:
+            return False
+        if fx.flags_written:
+            return True
+    return False
+
+
+def register_dead_after(effects: List, index: int, register: int) -> bool:
+    """True if `register` is written later in the block before anything reads it"""
+    for fx in effects[index + 1:]:
+        if register in fx.reads or fx.barrier:
+            return False
+        if register in fx.writes:
+            return True
+    return False
+
+
+def optimize_block(assembler, block: List, counts: Dict[str, int]) -> List:
+    """One left-to-right sweep over a block; returns `block` itself if nothing applied"""
+    parse_register = assembler.parse_register
+    parse_number = assembler.parse_number
+    effects = [instruction_effects(assembler, instr) for instr in block]
+    known: Dict[int, int] = {}     # Registers holding an LDM constant
+    out = []
+    changed = False
+
+    i = 0
+    while i < len(block):
+        instr = block[i]
+        fx = effects[i]
+        mnemonic = instr.mnemonic
+        ops = instr.operands
+        replacement = instr
+
+        if mnemonic == 'PUSH' and ops and i + 1 < len(block) and block[i + 1].mnemonic == 'RET':
+            value = known.get(parse_register(ops[0]))
+            if value is not None and 0 <= value < ISA.MEMORY_WORDS:
+                out.append(Instruction(instr.label, 'JMP', (f"0x{value:X}",), instr.line_num, instr.address))
+                counts['jmp_register'] += 1
+                changed = True
+                i += 2
+                continue
+
+        if mnemonic == 'MOV' and len(ops) >= 2 and parse_register(ops[0]) is not None \
+                and parse_register(ops[0]) == parse_register(ops[1]):
+            replacement = None
+            counts['mov_self'] += 1
+
+        elif mnemonic == 'IADD' and len(ops) >= 3 and parse_number(ops[2]) == 0 \
+                and None not in (parse_register(ops[0]), parse_register(ops[1])) \
+                and flags_dead_after(effects, i):
+            if parse_register(ops[0]) == parse_register(ops[1]):
+                replacement = None
+                counts['iadd_zero'] += 1
+            else:
+                replacement = Instruction(instr.label, 'MOV', (ops[1], ops[0]), instr.line_num, instr.address)
+                counts['iadd_move'] += 1
+
+        elif mnemonic == 'LDM' and len(ops) >= 2 and parse_register(ops[0]) is not None \
+                and register_dead_after(effects, i, parse_register(ops[0])):
+            replacement = None
+            counts['dead_ldm'] += 1
+
+        elif mnemonic == 'JMP' and ops and i == len(block) - 1:
+            target = assembler.symbol_table.get(ops[0])
+            if target is None:
+                target = parse_number(ops[0])
+            if target == instr.address + ISA.INSTRUCTION_SIZES['JMP']:
+                replacement = None
+                counts['jump_next'] += 1
+
+        if replacement is not instr:
+            changed = True
+        for register in fx.writes:
+            known.pop(register, None)
+        if replacement is not None:
+            if replacement.mnemonic == 'LDM':
+                value = parse_number(ops[1])
+                if value is not None:
+                    known[parse_register(ops[0])] = value
+            out.append(replacement)
+        i += 1
+
+    return out if changed else block
+
+
+def peephole(assembler) -> Dict[str, int]:
+    """Optimizer pass: rewrite every basic block to a fixpoint"""
+    before = analyze_program(assembler)
+    words_before = sum(ISA.INSTRUCTION_SIZES.get(instr.mnemonic, 1) for instr in assembler.instructions)
+    counts = dict.fromkeys(PATTERNS, 0)
+
+    rounds = 0
+    pinned = set()
+    while rounds < MAX_ROUNDS:
+        rounds += 1
+        groups = []
+        changed = False
+        runs = block_runs(assembler)
+        pinned = pinned_runs(runs, numeric_addresses(assembler), with_preceding=True)
+        for index, run in enumerate(runs):
+            start = run[0].address
+            last = run[-1]
+            size = last.address + ISA.INSTRUCTION_SIZES.get(last.mnemonic, 1) - start
+            if last.mnemonic == '.DW' or index in pinned:
+                new_run = run
+            else:
+                new_run = optimize_block(assembler, run, counts)
+            changed = changed or new_run is not run
+            groups.append((start, size, new_run))
+        if not changed:
+            break
+        assembler.relayout(groups)
+
+    after = analyze_program(assembler)
+    words_after = sum(ISA.INSTRUCTION_SIZES.get(instr.mnemonic, 1) for instr in assembler.instructions)
+    stats = {pattern: count for pattern, count in counts.items() if count}
+    code_pinned = sum(1 for index in pinned if runs[index][0].mnemonic != '.DW')
+    if code_pinned:
+        stats['blocks_pinned'] = code_pinned
+    stats.update({
+        'rounds': rounds,
+        'words_saved': words_before - words_after,
+        'cycles_before': before.cycles,
+        'cycles_after': after.cycles,
+        'cycles_saved': before.cycles - after.cycles,
+    })
+    return stats
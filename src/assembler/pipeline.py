@@ -0,0 +1,757 @@
+#!/usr/bin/env python3
+"""
+Cycle-Level Pipeline Model for 5-Stage Pipelined RISC Processor
+Mirrors src/processor_top.vhd: IF/ID, ID/EX, EX/MEM, MEM/WB latches plus the
+opcode decoder, interrupt unit, forwarding unit, memory hazard unit, freeze
+control and branch decision unit, evaluated once per clock. Where the RTL
+departs from the ISA (CCR after a not-taken JZ/JN/JC, the reset-cycle fetch)
+the model follows the ISA, like simulator.py.
+Reports total cycles, CPI and stall cycles broken down by cause.
+"""
+
+import sys
+import glob
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+from isa_constants import ISA
+from simulator import load_program
+
+
+ADDRESS_MASK = ISA.MEMORY_WORDS - 1
+WORD_MASK = 0xFFFFFFFF
+
+# ========== CONSTANTS (pkg_opcodes.vhd) ==========
+ALU_ADD, ALU_SUB, ALU_AND, ALU_NOT, ALU_INC, ALU_PASS_A, ALU_PASS_B, ALU_SETC = range(8)
+
+OUTB_REGFILE, OUTB_PUSHED_PC, OUTB_IMMEDIATE, OUTB_INPUT_PORT = range(4)
+
+COND_NONE, COND_ZERO, COND_NEGATIVE, COND_CARRY = range(4)
+
+PASS_INT_NORMAL, PASS_INT_RESET, PASS_INT_SOFTWARE, PASS_INT_HARDWARE = range(4)
+
+TARGET_DECODE, TARGET_EXECUTE, TARGET_MEMORY, TARGET_RESET = range(4)
+
+FORWARD_NONE, FORWARD_MEM_WB, FORWARD_EX_MEM = range(3)
+
+# Paths of forwarding_unit.vhd. A model built without one of them interlocks
+# decode until the value can be read or forwarded (design_sweep.py only)
+FORWARD_PATHS = ('ex_mem', 'mem_wb')
+
+# Stall causes, in report order. A stall cycle is a cycle in which the
+# writeback stage retires no program instruction; the bubble occupying WB
+# carries the cause recorded where it was created.
+STALL_CAUSES = (
+    'fill',       # Pipeline fill after reset
+    'memory',     # MEM stage owns the single memory port (PassPC = 0)
+    'immediate',  # Second word of a 2-word instruction occupies decode
+    'jump',       # JMP/CALL redirect from decode (IF/ID flush)
+    'branch',     # Taken conditional branch resolved in execute
+    'return',     # RET/RTI: PC popped in the memory stage
+    'interrupt',  # INT / hardware interrupt sequencing (PUSH FLAGS, PUSH PC)
+    'swap',       # Second cycle of SWAP
+    'hazard',     # Decode interlock on a disabled forwarding path (design_sweep.py configurations only)
+    'icache',     # Instruction cache miss (memory_system.py configurations only)
+    'dcache',     # Data cache miss (memory_system.py configurations only)
+)
+
+
+class Control:
+    """
+    One decoded control word (the four records of control_signals_pkg.vhd
+    flattened). Flags that the decoder sets in both the decode and memory
+    records (IsSwap, IsInterrupt, IsReturn, IsReti) are stored once.
+    """
+    __slots__ = (
+        'name', 'bubble',
+        # decode_control_t
+        'out_b', 'is_interrupt', 'is_return', 'is_call', 'is_reti', 'is_jmp',
+        'is_jmp_cond', 'is_swap', 'require_imm', 'is_hlt',
+        # execute_control_t
+        'ccr_we', 'pass_ccr', 'pass_imm', 'alu_op', 'cond',
+        # memory_control_t
+        'sp_enable', 'sp_inc', 'sp_to_mem', 'pass_int', 'mem_read', 'mem_write', 'mem_to_ccr',
+        # writeback_control_t
+        'pass_mem', 'reg_write', 'out_en',
+    )
+
+    def __init__(self, name: str, bubble: Optional[str] = None, **signals):
+        self.name = name
+        self.bubble = bubble  # Stall cause when this is not a program instruction
+        for slot in self.__slots__[2:]:
+            setattr(self, slot, signals.pop(slot, 0))
+        if signals:
+            raise TypeError(f"Unknown control signals: {', '.join(signals)}")
+
+    @property
+    def uses_memory(self) -> bool:
+        return bool(self.mem_read or self.mem_write)
+
+    def __repr__(self):
+        return f"Control({self.name})"
+
+
+def build_decode_table() -> List[Control]:
+    """Normal opcode decoding (opcode_decoder.vhd 'case opcode')"""
+    imm = dict(out_b=OUTB_IMMEDIATE, require_imm=1, pass_imm=1)
+    alu = dict(ccr_we=1, reg_write=1)
+    push = dict(sp_enable=1, sp_inc=0, sp_to_mem=1, mem_write=1)
+    pop = dict(sp_enable=1, sp_inc=1, sp_to_mem=1, mem_read=1)
+    signals = {
+        'NOP':  {},
+        'HLT':  dict(is_hlt=1),
+        'SETC': dict(ccr_we=1, alu_op=ALU_SETC),
+        'NOT':  dict(alu_op=ALU_NOT, **alu),
+        'INC':  dict(alu_op=ALU_INC, **alu),
+        'OUT':  dict(alu_op=ALU_PASS_A, out_en=1),
+        'IN':   dict(out_b=OUTB_INPUT_PORT, alu_op=ALU_PASS_B, reg_write=1),
+        'MOV':  dict(alu_op=ALU_PASS_A, reg_write=1),
+        'SWAP': dict(is_swap=1, alu_op=ALU_PASS_B, reg_write=1),
+        'ADD':  dict(alu_op=ALU_ADD, **alu),
+        'SUB':  dict(alu_op=ALU_SUB, **alu),
+        'AND':  dict(alu_op=ALU_AND, **alu),
+        'IADD': dict(alu_op=ALU_ADD, **imm, **alu),
+        'PUSH': dict(**push),
+        'POP':  dict(reg_write=1, pass_mem=1, **pop),
+        'LDM':  dict(alu_op=ALU_PASS_B, reg_write=1, **imm),
+        'LDD':  dict(require_imm=1, pass_imm=1, alu_op=ALU_ADD, mem_read=1,
+                     reg_write=1, pass_mem=1),
+        'STD':  dict(require_imm=1, pass_imm=1, alu_op=ALU_ADD, mem_write=1),
+        'JZ':   dict(is_jmp_cond=1, cond=COND_ZERO, ccr_we=1, **imm),
+        'JN':   dict(is_jmp_cond=1, cond=COND_NEGATIVE, ccr_we=1, **imm),
+        'JC':   dict(is_jmp_cond=1, cond=COND_CARRY, ccr_we=1, **imm),
+        'JMP':  dict(is_jmp=1, **imm),
+        'CALL': dict(is_call=1, is_jmp=1, require_imm=1, out_b=OUTB_PUSHED_PC, **push),
+        'RET':  dict(is_return=1, **pop),
+        'INT':  dict(is_interrupt=1, require_imm=1, out_b=OUTB_IMMEDIATE,
+                     pass_int=PASS_INT_SOFTWARE, alu_op=ALU_PASS_B, mem_read=1),
+        'RTI':  dict(is_reti=1, **pop),
+    }
+    table = [Control('NOP')] * 32  # Invalid opcodes decode as NOP
+    for mnemonic, opcode in ISA.OPCODES.items():
+        table[opcode] = Control(mnemonic, **signals[mnemonic])
+    return table
+
+
+DECODE_TABLE = build_decode_table()
+
+
+def build_source_table() -> List[Tuple[bool, bool]]:
+    """Whether each opcode reads Rb (bits 23-21) and Rc (bits 20-18) in decode"""
+    reads_rb = {'NOT', 'INC', 'OUT', 'MOV', 'SWAP', 'ADD', 'SUB', 'AND', 'IADD', 'LDD', 'STD'}
+    reads_rc = {'SWAP', 'ADD', 'SUB', 'AND', 'PUSH', 'STD'}
+    table = [(False, False)] * 32
+    for mnemonic, opcode in ISA.OPCODES.items():
+        table[opcode] = (mnemonic in reads_rb, mnemonic in reads_rc)
+    return table
+
+
+SOURCE_TABLE = build_source_table()
+
+# Interrupt-unit overrides and other non-instruction control words
+CTRL_PUSH_PC = Control('PUSH_PC', 'interrupt', sp_enable=1, sp_to_mem=1, mem_write=1,
+                       out_b=OUTB_PUSHED_PC)
+CTRL_PUSH_FLAGS = Control('PUSH_FLAGS', 'interrupt', sp_enable=1, sp_to_mem=1, mem_write=1,
+                          pass_ccr=1)
+CTRL_POP_FLAGS = Control('POP_FLAGS', 'return', sp_enable=1, sp_inc=1, sp_to_mem=1,
+                         mem_read=1, mem_to_ccr=1)
+CTRL_HW_INTERRUPT = Control('HW_INT', 'interrupt', is_interrupt=1,
+                            pass_int=PASS_INT_HARDWARE, mem_read=1)
+CTRL_SWAP_SECOND = Control('SWAP2', 'swap', alu_op=ALU_PASS_A, reg_write=1)
+CTRL_OVERRIDE_NOP = {cause: Control('NOP', cause) for cause in ('interrupt', 'return')}
+CTRL_BUBBLE = {cause: Control('NOP', cause) for cause in STALL_CAUSES}
+
+
+@dataclass
+class PipelineStats:
+    """Per-program results of a PipelineModel run"""
+    cycles: int = 0
+    instructions: int = 0
+    halted: bool = False
+    stalls: Dict[str, int] = field(default_factory=lambda: {c: 0 for c in STALL_CAUSES})
+    fetch_blocked: int = 0        # Cycles with PassPC = 0
+    branches_taken: int = 0       # Conditional branches redirected from execute
+    interrupts: int = 0           # INT and hardware interrupts entered
+    forwards: Dict[str, int] = field(default_factory=lambda: {'ex_mem': 0, 'mem_wb': 0})
+
+    @property
+    def cpi(self) -> float:
+        return self.cycles / self.instructions if self.instructions else float('inf')
+
+    @property
+    def stall_cycles(self) -> int:
+        return sum(self.stalls.values())
+
+
+class PipelineModel:
+    """
+    Clocked model of processor_top. Each call to cycle() evaluates the
+    combinational network from the current latch contents and then applies
+    one rising edge. Register-file writes happen on the falling edge, so a
+    value written back is visible to decode in the same cycle.
+
+    The memory data bus is modelled as 0 when neither fetch nor the MEM stage
+    reads (the VHDL drives 'Z').
+    """
+
+    def __init__(self, memory: Optional[List[int]] = None,
+                 in_port: Optional[Iterable[int]] = None,
+                 interrupts: Iterable[int] = (), verbose: bool = False,
+                 memory_system=None, forwarding: Iterable[str] = FORWARD_PATHS):
+        self.verbose = verbose
+        # memory_system.MemorySystem: ports and caches in place of the single
+        # uncached port of the RTL (None keeps the RTL behaviour)
+        self.memory_system = memory_system
+        forwarding = set(forwarding)
+        unknown = forwarding.difference(FORWARD_PATHS)
+        if unknown:
+            raise ValueError(f"unknown forwarding path(s): {', '.join(sorted(unknown))}")
+        self.forward_ex_mem = 'ex_mem' in forwarding
+        self.forward_mem_wb = 'mem_wb' in forwarding
+        self.interlocks = not (self.forward_ex_mem and self.forward_mem_wb)
+        self.memory: List[int] = [0] * ISA.MEMORY_WORDS
+        if memory is not None:
+            n = min(len(memory), ISA.MEMORY_WORDS)
+            self.memory[:n] = [w & WORD_MASK for w in memory[:n]]
+        self.in_values: List[int] = [v & WORD_MASK for v in (in_port or [])]
+        self.interrupt_cycles = set(interrupts)  # Cycles with hardware_interrupt = '1'
+        self.out_port: List[int] = []
+        self.reset()
+
+    def log(self, message: str):
+        if self.verbose:
+            print(f"[PIPELINE] {message}")
+
+    def reset(self):
+        """Assert rst: every register returns to its VHDL reset value"""
+        self.regs: List[int] = [0] * 8
+        self.ccr = 0                 # [2]=Z [1]=N [0]=C
+        self.sp = ISA.INITIAL_SP
+        self.pc = 0
+        self.reset_pending = 1
+        self.pending_hw_interrupt = 0
+        self.in_committed = 0
+        self.memory_wait = 0         # Cycles left in a cache miss freeze
+        self.memory_wait_cause = None
+        # IF/ID
+        self.ifid_instr = 0
+        self.ifid_pc = 0
+        self.ifid_pushed_pc = 0
+        self.ifid_take_int = 0
+        self.ifid_valid = False      # False: flushed/reset slot (decodes as a bubble)
+        self.ifid_cause = 'fill'
+        # ID/EX
+        self.idex_ctrl = CTRL_BUBBLE['fill']
+        self.idex_pc = self.idex_a = self.idex_b = 0
+        self.idex_rs1 = self.idex_rs2 = self.idex_rd = 0
+        # EX/MEM
+        self.exmem_ctrl = CTRL_BUBBLE['fill']
+        self.exmem_pc = self.exmem_primary = self.exmem_secondary = self.exmem_rd = 0
+        # MEM/WB
+        self.memwb_ctrl = CTRL_BUBBLE['fill']
+        self.memwb_pc = self.memwb_mem = self.memwb_alu = self.memwb_rd = 0
+        self.stats = PipelineStats()
+
+    # ================= QUERIES =================
+
+    @property
+    def halted(self) -> bool:
+        """HLT is frozen in decode and every later stage holds a bubble"""
+        # The second half of SWAP counts as a 'swap' bubble but still writes back
+        return bool(self.ifid_valid and DECODE_TABLE[self.ifid_instr >> 27].is_hlt
+                and not self.idex_ctrl.is_swap and not self.idex_ctrl.require_imm
+                and self.idex_ctrl.bubble is not None
+                and self.exmem_ctrl.bubble is not None and self.exmem_ctrl is not CTRL_SWAP_SECOND
+                and self.memwb_ctrl.bubble is not None and self.memwb_ctrl is not CTRL_SWAP_SECOND)
+
+    def data_address(self) -> int:
+        """Address the MEM stage drives this cycle (stack, vector or ALU result)"""
+        exmem = self.exmem_ctrl
+        if exmem.sp_to_mem:
+            sp = self.sp
+            return (sp + 1 if sp < ISA.INITIAL_SP else sp) if exmem.sp_inc else sp
+        if exmem.pass_int == PASS_INT_NORMAL:
+            return self.exmem_primary & ADDRESS_MASK
+        if exmem.pass_int == PASS_INT_SOFTWARE:
+            return (self.exmem_primary + 2) & ADDRESS_MASK
+        if exmem.pass_int == PASS_INT_HARDWARE:
+            return 1
+        return 0
+
+    # ================= CLOCK =================
+
+    def memory_stall(self) -> bool:
+        """
+        Cache misses freeze the whole pipeline (blocking caches): True while
+        this cycle is one of those frozen cycles.
+        """
+        stats = self.stats
+        if not self.memory_wait:
+            exmem = self.exmem_ctrl
+            data = exmem.mem_read or exmem.mem_write
+            memory_system = self.memory_system
+            fetch = self.pc & ADDRESS_MASK if not data or memory_system.split else None
+            wait, cause = memory_system.access(fetch, self.data_address() if data else None,
+                                               exmem.mem_write)
+            if not wait:
+                return False
+            self.memory_wait, self.memory_wait_cause = wait, cause
+        self.memory_wait -= 1
+        stats.stalls[self.memory_wait_cause] += 1
+        if stats.cycles in self.interrupt_cycles:
+            self.pending_hw_interrupt = 1
+        stats.cycles += 1
+        return True
+
+    def cycle(self):
+        """Evaluate one clock cycle and apply the rising edge"""
+        if self.memory_system is not None and self.memory_stall():
+            return
+        mem = self.memory
+        regs = self.regs
+        stats = self.stats
+        idex = self.idex_ctrl
+        exmem = self.exmem_ctrl
+        memwb = self.memwb_ctrl
+
+        # ---------- Writeback (falling edge writes the register file) ----------
+        wb_data = self.memwb_mem if memwb.pass_mem else self.memwb_alu
+        if memwb.reg_write:
+            regs[self.memwb_rd] = wb_data
+        if memwb.out_en:
+            self.out_port.append(wb_data)
+        if memwb.bubble is None:
+            stats.instructions += 1
+            if memwb.out_b == OUTB_INPUT_PORT:
+                self.in_committed += 1
+        else:
+            stats.stalls[memwb.bubble] += 1
+
+        # ---------- Memory stage + memory hazard unit ----------
+        sp = self.sp
+        sp_inc = sp + 1 if sp < ISA.INITIAL_SP else sp
+        mem_addr = self.data_address()
+        pass_pc = not (exmem.mem_read or exmem.mem_write)
+        if pass_pc:
+            mem_data = mem[self.pc & ADDRESS_MASK]
+        elif exmem.mem_read and not exmem.mem_write:
+            mem_data = mem[mem_addr]
+        else:
+            mem_data = 0
+        # What decode sees as the fetched word; the same bus unless ports are split
+        fetch_data = mem_data
+        if not pass_pc:
+            if self.memory_system is not None and self.memory_system.split:
+                # Separate instruction port: fetch goes on while MEM uses the data port
+                pass_pc = True
+                fetch_data = mem[self.pc & ADDRESS_MASK]
+            else:
+                stats.fetch_blocked += 1
+
+        # ---------- Interrupt unit ----------
+        if idex.is_interrupt:
+            override = CTRL_PUSH_FLAGS
+        elif exmem.is_interrupt:
+            override = CTRL_PUSH_PC
+        elif idex.is_reti:
+            override = CTRL_POP_FLAGS
+        elif exmem.is_reti or idex.is_return or exmem.is_return:
+            override = CTRL_OVERRIDE_NOP['return']
+        else:
+            override = None
+
+        # ---------- Opcode decoder ----------
+        instr = self.ifid_instr
+        if idex.is_swap:
+            ctrl = CTRL_SWAP_SECOND
+        elif override is not None:
+            ctrl = override
+        elif self.ifid_take_int:
+            ctrl = CTRL_HW_INTERRUPT
+        elif idex.require_imm:
+            ctrl = CTRL_BUBBLE['immediate']
+        elif not self.ifid_valid:
+            ctrl = CTRL_BUBBLE[self.ifid_cause]
+        else:
+            ctrl = DECODE_TABLE[instr >> 27]
+
+        freeze_fetch = (idex.is_interrupt or exmem.is_reti or idex.is_reti or
+                        exmem.is_return or idex.is_return or exmem.is_interrupt or
+                        ctrl.is_interrupt or ctrl.is_reti or ctrl.is_return)
+
+        blocking = (ctrl.is_interrupt or ctrl.is_call or ctrl.is_return or ctrl.is_reti or
+                    idex.is_interrupt or idex.is_call or idex.is_return or idex.is_reti or
+                    ctrl.is_jmp_cond)
+        take_hw_int = self.pending_hw_interrupt and not blocking
+
+        # ---------- Decode datapath ----------
+        rb = (instr >> 21) & 7
+        rc = (instr >> 18) & 7
+        operand_a = regs[rb]
+        out_b = ctrl.out_b
+        if out_b == OUTB_REGFILE:
+            operand_b = regs[rc]
+        elif out_b == OUTB_PUSHED_PC:
+            operand_b = self.ifid_pushed_pc
+        elif out_b == OUTB_IMMEDIATE:
+            operand_b = fetch_data
+        else:
+            in_flight = (idex.bubble is None and idex.out_b == OUTB_INPUT_PORT) + \
+                        (exmem.bubble is None and exmem.out_b == OUTB_INPUT_PORT)
+            index = self.in_committed + in_flight
+            operand_b = self.in_values[index] if index < len(self.in_values) else 0
+        rd = rc if idex.is_swap else (instr >> 24) & 7
+
+        # ---------- Interlock (only with a forwarding path left out) ----------
+        interlock = False
+        if self.interlocks and ctrl.bubble is None:
+            reads_rb, reads_rc = SOURCE_TABLE[instr >> 27]
+            for producer, producer_rd, forwarded in ((idex, self.idex_rd, self.forward_ex_mem),
+                                                     (exmem, self.exmem_rd, self.forward_mem_wb)):
+                if not forwarded and producer.reg_write and \
+                        ((reads_rb and producer_rd == rb) or (reads_rc and producer_rd == rc)):
+                    interlock = True
+
+        # ---------- Forwarding unit ----------
+        rs1, rs2 = self.idex_rs1, self.idex_rs2
+        ex_fwd = exmem.reg_write and self.forward_ex_mem
+        ex_rd = self.exmem_rd
+        wb_fwd = memwb.reg_write and self.forward_mem_wb
+        wb_rd = self.memwb_rd
+        if ex_fwd and ex_rd == rs1 and not exmem.is_swap:
+            in_a = self.exmem_primary
+            stats.forwards['ex_mem'] += 1
+        elif wb_fwd and wb_rd == rs1:
+            in_a = wb_data
+            stats.forwards['mem_wb'] += 1
+        else:
+            in_a = self.idex_a
+        if idex.out_b == OUTB_REGFILE and not idex.pass_imm and ex_fwd and ex_rd == rs2 \
+                and not exmem.is_swap:
+            in_b = self.exmem_primary
+            stats.forwards['ex_mem'] += 1
+        elif idex.out_b == OUTB_REGFILE and not idex.pass_imm and wb_fwd and wb_rd == rs2:
+            in_b = wb_data
+            stats.forwards['mem_wb'] += 1
+        else:
+            in_b = instr if idex.pass_imm else self.idex_b
+        if idex.pass_ccr:
+            secondary = self.ccr
+        elif idex.out_b == OUTB_REGFILE and ex_fwd and ex_rd == rs2:
+            secondary = self.exmem_primary
+        elif idex.out_b == OUTB_REGFILE and wb_fwd and wb_rd == rs2:
+            secondary = wb_data
+        else:
+            secondary = self.idex_b
+
+        # ---------- Execute: ALU + CCR ----------
+        op = idex.alu_op
+        carry = 0
+        if op == ALU_ADD:
+            result = in_a + in_b
+            carry = result >> 32
+            result &= WORD_MASK
+        elif op == ALU_SUB:
+            result = (in_a - in_b) & WORD_MASK
+            carry = 1 if in_a < in_b else 0
+        elif op == ALU_AND:
+            result = in_a & in_b
+        elif op == ALU_NOT:
+            result = ~in_a & WORD_MASK
+        elif op == ALU_INC:
+            result = in_a + 1
+            carry = result >> 32
+            result &= WORD_MASK
+        elif op == ALU_PASS_A:
+            result = in_a
+        elif op == ALU_PASS_B:
+            result = in_b
+        else:
+            result = 0
+            carry = 1
+
+        ccr = self.ccr
+        cond = idex.cond
+        if cond == COND_ZERO:
+            actual_taken = (ccr >> 2) & 1
+        elif cond == COND_NEGATIVE:
+            actual_taken = (ccr >> 1) & 1
+        elif cond == COND_CARRY:
+            actual_taken = ccr & 1
+        else:
+            actual_taken = 0
+        next_ccr = ccr
+        if idex.ccr_we or exmem.mem_to_ccr:
+            if exmem.mem_to_ccr:
+                next_ccr = mem_data & 7
+            elif actual_taken and cond == COND_NEGATIVE:
+                next_ccr = ccr & 0b101
+            elif actual_taken and cond == COND_CARRY:
+                next_ccr = ccr & 0b110
+            elif actual_taken and cond == COND_ZERO:
+                next_ccr = ccr & 0b011
+            elif cond != COND_NONE:
+                # The ISA keeps the flags on a not-taken JZ/JN/JC; the RTL
+                # decoder sets ccr_we and writes the ALU flags here instead
+                pass
+            elif op == ALU_SETC:
+                next_ccr = ccr | 1
+            else:
+                next_ccr = ((result == 0) << 2) | ((result >> 31) << 1) | carry
+
+        # ---------- Branch decision unit ----------
+        branch = False
+        target_select = TARGET_DECODE
+        if exmem.pass_int in (PASS_INT_SOFTWARE, PASS_INT_HARDWARE) or exmem.is_reti \
+                or exmem.is_return:
+            branch, target_select = True, TARGET_MEMORY
+            if exmem.pass_int:
+                stats.interrupts += 1
+        elif (self.ifid_valid and (instr >> 27) == ISA.OPCODES['CALL']) or ctrl.is_jmp:
+            branch, target_select = True, TARGET_DECODE
+        elif idex.is_jmp_cond and actual_taken:
+            branch, target_select = True, TARGET_EXECUTE
+            stats.branches_taken += 1
+
+        # ---------- Freeze control ----------
+        pc_freeze = False
+        ifde_we = True
+        nop_ifde = False
+        nop_deex = False
+        ifde_cause = deex_cause = None
+        if ctrl.is_hlt:
+            pc_freeze = True
+            ifde_we = False
+            nop_deex, deex_cause = True, 'fill'
+        else:
+            if freeze_fetch:
+                ifde_we = False
+            elif ctrl.is_swap:
+                pc_freeze = True
+                ifde_we = False
+            if branch:
+                ifde_we = True
+                nop_ifde = True
+                if target_select == TARGET_MEMORY:
+                    ifde_cause = 'interrupt' if exmem.pass_int else 'return'
+                elif target_select == TARGET_EXECUTE:
+                    ifde_cause = 'branch'
+                    nop_deex, deex_cause = True, 'branch'
+                else:
+                    ifde_cause = 'jump'
+            if not pass_pc:
+                pc_freeze = True
+                nop_ifde = True
+                ifde_cause = ifde_cause or 'memory'
+                if ctrl.require_imm:
+                    ifde_we = False
+                    if not nop_deex:
+                        nop_deex, deex_cause = True, 'memory'
+            if interlock and not branch:
+                # Hold the instruction in decode and send a bubble to execute
+                pc_freeze = True
+                ifde_we = False
+                if not nop_deex:
+                    nop_deex, deex_cause = True, 'hazard'
+
+        if self.reset_pending:
+            # The word read on the reset cycle is the reset vector, not an
+            # instruction. The RTL latches it into IF/ID all the same, which
+            # only decodes as a NOP while M[0] is a plain address.
+            nop_ifde, ifde_cause = True, 'fill'
+
+        # ---------- PC ----------
+        pc = self.pc
+        if self.reset_pending:
+            next_pc = fetch_data
+        elif branch:
+            if target_select == TARGET_DECODE:
+                next_pc = fetch_data
+            elif target_select == TARGET_EXECUTE:
+                next_pc = self.idex_b
+            else:
+                next_pc = mem_data
+        elif not pc_freeze:
+            next_pc = (pc + 1) & WORD_MASK
+        else:
+            next_pc = pc
+        pushed_pc = next_pc if take_hw_int else (pc + 2) & WORD_MASK
+
+        # ================= RISING EDGE =================
+        if exmem.mem_write:
+            mem[mem_addr] = self.exmem_secondary & WORD_MASK
+        if exmem.sp_enable:
+            self.sp = sp_inc if exmem.sp_inc else (sp - 1) & ADDRESS_MASK
+
+        # MEM/WB
+        self.memwb_ctrl = exmem
+        self.memwb_pc = self.exmem_pc
+        self.memwb_mem = mem_data
+        self.memwb_alu = self.exmem_primary
+        self.memwb_rd = self.exmem_rd
+        # EX/MEM
+        self.exmem_ctrl = idex
+        self.exmem_pc = self.idex_pc
+        self.exmem_primary = result
+        self.exmem_secondary = secondary
+        self.exmem_rd = self.idex_rd
+        # ID/EX
+        if nop_deex:
+            self.idex_ctrl = CTRL_BUBBLE[deex_cause]
+            self.idex_pc = self.idex_a = self.idex_b = 0
+            self.idex_rs1 = self.idex_rs2 = self.idex_rd = 0
+        else:
+            self.idex_ctrl = ctrl
+            self.idex_pc = self.ifid_pc
+            self.idex_a = operand_a
+            self.idex_b = operand_b
+            self.idex_rs1 = rb
+            self.idex_rs2 = rc
+            self.idex_rd = rd
+        # IF/ID
+        if ifde_we:
+            self.ifid_pc = pc
+            self.ifid_pushed_pc = pushed_pc
+            self.ifid_take_int = take_hw_int
+            if nop_ifde:
+                self.ifid_instr = 0
+                self.ifid_valid = False
+                self.ifid_cause = ifde_cause
+            else:
+                self.ifid_instr = fetch_data
+                self.ifid_valid = True
+        self.ccr = next_ccr
+        self.pc = next_pc
+        self.reset_pending = 0
+        if stats.cycles in self.interrupt_cycles:
+            self.pending_hw_interrupt = 1
+        elif not blocking and not interlock and self.pending_hw_interrupt:
+            self.pending_hw_interrupt = 0
+        stats.cycles += 1
+
+    def run(self, max_cycles: int = 1_000_000) -> PipelineStats:
+        """Clock until HLT drains through the pipeline or max_cycles elapse"""
+        stats = self.stats
+        while stats.cycles < max_cycles:
+            if self.halted:
+                stats.halted = True
+                stats.instructions += 1  # The HLT itself
+                break
+            self.cycle()
+        self.log(f"{stats.cycles} cycles, {stats.instructions} instructions")
+        return stats
+
+
+def format_stats_table(results: Dict[str, PipelineStats]) -> str:
+    """Render per-program results as an aligned text table"""
+    causes = [c for c in STALL_CAUSES if any(s.stalls[c] for s in results.values())]
+    header = f"{'Program':28s} {'Cycles':>8s} {'Instr':>8s} {'CPI':>6s} {'Stalls':>7s}"
+    header += "".join(f" {c:>9s}" for c in causes)
+    lines = [header, "-" * len(header)]
+    for name, s in results.items():
+        row = f"{name:28s} {s.cycles:8d} {s.instructions:8d} {s.cpi:6.2f} {s.stall_cycles:7d}"
+        row += "".join(f" {s.stalls[c]:9d}" for c in causes)
+        if not s.halted:
+            row += "  (no HLT)"
+        lines.append(row)
+    return "\n".join(lines)
+
+
+def check_against_simulator(model: PipelineModel, memory: List[int],
+                            in_values: List[int], max_cycles: int) -> Optional[str]:
+    """
+    Run the functional simulator on the same image: None when both models
+    halt with the same registers, SP and OUT values, else the first difference.
+    """
+    from simulator import Simulator
+    simulator = Simulator(memory, in_values)
+    simulator.run(max_cycles)       # Never more instructions than cycles
+    if not (model.stats.halted and simulator.halted):
+        return f"halted: pipeline {model.stats.halted}, simulator {simulator.halted}"
+    for n in range(8):
+        if model.regs[n] != simulator.regs[n]:
+            return f"R{n}: pipeline {model.regs[n]:08X}, simulator {simulator.regs[n]:08X}"
+    if model.sp != simulator.sp:
+        return f"SP: pipeline {model.sp:05X}, simulator {simulator.sp:05X}"
+    if model.out_port != simulator.out_port:
+        return (f"OUT: pipeline {[hex(v) for v in model.out_port]}, "
+                f"simulator {[hex(v) for v in simulator.out_port]}")
+    return None
+
+
+def main():
+    import argparse
+    import os
+    parser = argparse.ArgumentParser(
+        prog="pipeline",
+        description="Cycle-level model of the 5-stage pipeline (CPI and stall breakdown)"
+    )
+    parser.add_argument('inputs', nargs='+',
+                        help='Programs or globs (.asm is assembled first, anything else is read as .mem)')
+    parser.add_argument('--hex', action='store_true',
+                        help='Treat all numbers as Hex by default (auto-detected otherwise)')
+    parser.add_argument('--in', dest='in_values', type=str, default='',
+                        help='Comma separated values for successive IN instructions')
+    parser.add_argument('--interrupt', type=int, action='append', default=[],
+                        help='Assert the hardware interrupt during cycle N (repeatable)')
+    parser.add_argument('-c', '--max-cycles', type=int, default=100_000,
+                        help='Stop each program after this many cycles (default: 100000)')
+    parser.add_argument('-m', '--memory', type=str, default=None, metavar='SPEC',
+                        help="Memory system instead of the RTL's single port, as in memory_system.py -m "
+                             "(e.g. 'split,icache=256:2,dcache=128,miss=10')")
+    parser.add_argument('--forward', type=str, default=','.join(FORWARD_PATHS), metavar='PATHS',
+                        help="Forwarding paths to keep, comma separated ('none' for neither); "
+                             "decode interlocks on the others (default: ex_mem,mem_wb)")
+    parser.add_argument('--check', action='store_true',
+                        help='Also run the functional simulator; exit 1 unless both models halt '
+                             'with the same registers, SP and OUT values')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Verbose output')
+
+    args = parser.parse_args()
+    forwarding = [p.strip() for p in args.forward.split(',') if p.strip() and p.strip() != 'none']
+    if set(forwarding).difference(FORWARD_PATHS):
+        parser.error(f"--forward takes {', '.join(FORWARD_PATHS)} or none, got '{args.forward}'")
+    memory_config = None
+    if args.memory:
+        from memory_system import MemorySystem, parse_config
+        try:
+            memory_config = parse_config(args.memory)
+        except (ValueError, TypeError) as exc:
+            parser.error(str(exc))
+    paths = []
+    for pattern in args.inputs:
+        paths.extend(sorted(glob.glob(pattern)) or [pattern])
+
+    results: Dict[str, PipelineStats] = {}
+    mismatches: Dict[str, str] = {}
+    start = time.perf_counter()
+    for path in paths:
+        try:
+            memory = load_program(path, True if args.hex else None)
+        except (OSError, ValueError) as exc:
+            print(f"ERROR: {exc}")
+            sys.exit(1)
+        in_values = [int(v, 16 if args.hex else 0) for v in args.in_values.split(',') if v.strip()]
+        model = PipelineModel(memory, in_values, args.interrupt, verbose=args.verbose,
+                              memory_system=MemorySystem(memory_config) if memory_config else None,
+                              forwarding=forwarding)
+        results[os.path.basename(path)] = model.run(args.max_cycles)
+        if args.check:
+            mismatch = check_against_simulator(model, memory, in_values, args.max_cycles)
+            if mismatch:
+                mismatches[os.path.basename(path)] = mismatch
+    elapsed = time.perf_counter() - start
+
+    print(format_stats_table(results))
+    total = sum(s.cycles for s in results.values())
+    print(f"\n{len(results)} program(s), {total} cycles simulated in {elapsed:.2f} s")
+    if args.check:
+        for name, mismatch in mismatches.items():
+            print(f"[CHECK] {name}: {mismatch}")
+        print(f"[CHECK] {len(results) - len(mismatches)}/{len(results)} program(s) agree with the simulator")
+        if mismatches:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
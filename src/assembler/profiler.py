@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+"""
+Per-PC Execution Profiler
+Runs an assembled program on the functional simulator with branch tracing
+on, rebuilds per-address execution counts from the trace and estimates the
+cycles, stall cycles and branch mispredictions of every instruction with
+the pipeline costs used by analyzer.py and branch_predictor.py. Results are
+mapped back to source lines and labels through the assembler's records and
+symbol table, hot loops are found from taken backward branches, and the
+profile can be written as an annotated listing or as collapsed stacks
+(CALL/RET call paths) for flamegraph tools.
+Requires NumPy.
+"""
+
+import os
+import sys
+import time
+from bisect import bisect_right
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from isa_constants import ISA
+from simulator import (Simulator, TRACE_HW_INTERRUPT, assemble_file, guess_hex_mode,
+                       parse_value_list)
+from analyzer import STALL_COSTS
+from branch_predictor import (BranchTrace, PredictorConfig, STATIC_NOT_TAKEN, MISPREDICT_COST,
+                              RETURN_COST, CONDITIONAL_OPCODES, RETURN_OPCODES, parse_config, replay)
+
+
+_OP = ISA.OPCODES
+# Transfers that continue at a target (JMP/CALL/INT always, conditionals when taken)
+_BACKWARD_OPCODES = CONDITIONAL_OPCODES + (_OP['JMP'],)
+_CALL_OPCODES = (_OP['CALL'], _OP['INT'], TRACE_HW_INTERRUPT)
+
+# A mispredicted conditional pays the branch flush instead of its immediate slot
+CONDITIONAL_MISS_EXTRA = MISPREDICT_COST - STALL_COSTS['JZ']['immediate']
+
+
+class Profile:
+    """
+    Per-address results of one run. Arrays are indexed by word address and
+    only meaningful at instruction starts (assembler records).
+    """
+
+    def __init__(self, name: str, assembler, trace: BranchTrace, missed: np.ndarray,
+                 counts: np.ndarray, cycles: np.ndarray, misses: np.ndarray,
+                 stacks: Dict[Tuple[str, ...], int], halted: bool):
+        self.name = name
+        self.assembler = assembler
+        self.trace = trace
+        self.missed = missed
+        self.counts = counts
+        self.cycles = cycles
+        self.misses = misses
+        self.stacks = stacks
+        self.halted = halted
+        self.records = [instr for instr in assembler.instructions if instr.mnemonic != '.DW']
+        self.by_address = {instr.address: instr for instr in self.records}
+        labels = sorted((addr, name) for name, addr in assembler.symbol_table.items())
+        self._label_addresses = [addr for addr, _ in labels]
+        self._label_names = [name for _, name in labels]
+
+    @property
+    def instructions(self) -> int:
+        return self.trace.instructions
+
+    @property
+    def total_cycles(self) -> int:
+        return int(self.cycles.sum())
+
+    @property
+    def stall_cycles(self) -> int:
+        return self.total_cycles - self.instructions
+
+    @property
+    def outside(self) -> int:
+        """Instructions executed outside the assembled code"""
+        return self.instructions - int(self.counts[list(self.by_address)].sum())
+
+    def label_of(self, address: int) -> str:
+        """Enclosing label as `name` or `name+offset` (hex address if none)"""
+        i = bisect_right(self._label_addresses, address) - 1
+        if i < 0:
+            return f"{address:05X}"
+        offset = address - self._label_addresses[i]
+        return self._label_names[i] + (f"+{offset}" if offset else "")
+
+    def function_of(self, address: int) -> str:
+        return self.label_of(address).split('+')[0]
+
+
+def execution_counts(trace: BranchTrace, start_pc: int,
+                     end_pc: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Rebuild per-word execution counts from a branch trace: execution is
+    straight-line between transfers, so each segment [start, end) adds one
+    to every word it covers. Segment i ends with transfer i; the last one
+    ends at `end_pc`. Returns (counts, segment starts, segment ends).
+    """
+    pcs = trace.pc.astype(np.int64)
+    ops = trace.opcode
+    sizes = np.where(np.isin(ops, RETURN_OPCODES), 1, 2)
+    sizes[ops == TRACE_HW_INTERRUPT] = 0
+    ends = pcs + sizes
+    follow = np.where(trace.taken.astype(bool), trace.target.astype(np.int64), ends)
+    starts = np.concatenate(([start_pc], follow))
+    ends = np.concatenate((ends, [end_pc]))
+
+    diff = np.zeros(ISA.MEMORY_WORDS + 1, dtype=np.int64)
+    forward = ends >= starts
+    np.add.at(diff, starts[forward], 1)
+    np.add.at(diff, ends[forward], -1)
+    return np.cumsum(diff[:-1]), starts, np.maximum(ends, starts)
+
+
+def profile_program(assembler, name: str, in_values: Sequence[int] = (),
+                    max_instructions: int = 10_000_000, interrupts: Sequence[int] = (),
+                    predictor: PredictorConfig = STATIC_NOT_TAKEN) -> Profile:
+    """Run an assembled program and attribute counts, cycles and mispredictions per address"""
+    sim = Simulator(assembler.memory_image.tolist(), in_values)
+    sim.branch_trace = []
+    for at in interrupts:
+        sim.schedule_interrupt(at)
+    start_pc = sim.pc
+    executed = sim.run(max_instructions)
+    columns = list(zip(*sim.branch_trace)) or [(), (), (), ()]
+    trace = BranchTrace(name, *columns, executed)
+
+    counts, starts, ends = execution_counts(trace, start_pc, sim.pc + 1 if sim.halted else sim.pc)
+    missed_bytes = bytearray(len(trace))
+    replay(trace, predictor, missed_bytes)
+    missed = np.frombuffer(bytes(missed_bytes), dtype=np.uint8).astype(bool)
+    misses = np.bincount(trace.pc[missed], minlength=ISA.MEMORY_WORDS)
+
+    # Cycles per execution when nothing is mispredicted and no return target
+    # is known. Words outside the assembled code (data, empty memory run as
+    # NOPs) cost one cycle each; immediate words are part of their instruction.
+    base = np.ones(ISA.MEMORY_WORDS, dtype=np.int64)
+    for instr in assembler.instructions:
+        if instr.mnemonic != '.DW':
+            size = ISA.INSTRUCTION_SIZES.get(instr.mnemonic, 1)
+            base[instr.address] = 1 + sum(STALL_COSTS.get(instr.mnemonic, {}).values())
+            base[instr.address + 1:instr.address + size] = 0
+    conditional = np.isin(trace.opcode, CONDITIONAL_OPCODES)
+    returns = np.isin(trace.opcode, RETURN_OPCODES)
+    adjust = np.zeros(len(trace), dtype=np.int64)
+    adjust[conditional & missed] = CONDITIONAL_MISS_EXTRA
+    adjust[returns & ~missed] = -RETURN_COST
+    cycles = counts * base + np.bincount(trace.pc, weights=adjust,
+                                         minlength=ISA.MEMORY_WORDS).astype(np.int64)
+
+    profile = Profile(name, assembler, trace, missed, counts, cycles, misses, {}, sim.halted)
+    profile.stacks = call_stacks(profile, starts, ends, base, adjust, start_pc)
+    return profile
+
+
+def call_stacks(profile: Profile, starts: np.ndarray, ends: np.ndarray, base: np.ndarray,
+                adjust: np.ndarray, start_pc: int) -> Dict[Tuple[str, ...], int]:
+    """
+    Cycles per call path. CALL, INT and hardware interrupts push a frame
+    named after the target's label; a RET/RTI pops back to the frame whose
+    return address it jumps to, so PUSH/RET used as an indirect jump does not.
+    """
+    trace = profile.trace
+    prefix = np.concatenate(([0], np.cumsum(base)))
+    segment = prefix[ends] - prefix[starts]
+    segment[:-1] += adjust
+
+    stacks: Dict[Tuple[str, ...], int] = {}
+    frames: List[Tuple[str, int]] = [(profile.function_of(start_pc), -1)]
+    path: Tuple[str, ...] = (frames[0][0],)
+    pcs, ops, targets = trace.pc.tolist(), trace.opcode.tolist(), trace.target.tolist()
+    cost = segment.tolist()
+    for i, (pc, op, target) in enumerate(zip(pcs, ops, targets)):
+        stacks[path] = stacks.get(path, 0) + cost[i]
+        if op in _CALL_OPCODES:
+            returns_to = pc if op == TRACE_HW_INTERRUPT else pc + 2
+            frame = profile.function_of(target)
+            frames.append((frame if op == _OP['CALL'] else f"[int] {frame}", returns_to))
+            path = path + (frames[-1][0],)
+        elif op in RETURN_OPCODES:
+            for depth in range(len(frames) - 1, 0, -1):
+                if frames[depth][1] == target:
+                    del frames[depth:]
+                    path = path[:depth]
+                    break
+    stacks[path] = stacks.get(path, 0) + cost[-1]
+    return {path: cycles for path, cycles in stacks.items() if cycles}
+
+
+def hot_loops(profile: Profile) -> List[Dict]:
+    """Loops closed by a taken backward branch, by estimated cycles (body only, calls excluded)"""
+    trace = profile.trace
+    backward = (np.isin(trace.opcode, _BACKWARD_OPCODES) & trace.taken.astype(bool)
+                & (trace.target <= trace.pc))
+    edges, iterations = np.unique(np.stack((trace.target[backward], trace.pc[backward]), axis=1),
+                                  axis=0, return_counts=True)
+    addresses = np.array(sorted(profile.by_address), dtype=np.int64)
+    cycles = np.concatenate(([0], np.cumsum(profile.cycles[addresses])))
+    counts = np.concatenate(([0], np.cumsum(profile.counts[addresses])))
+    total = profile.total_cycles or 1
+
+    loops = []
+    for (head, branch), taken in zip(edges.tolist(), iterations.tolist()):
+        lo = int(np.searchsorted(addresses, head))
+        hi = int(np.searchsorted(addresses, branch, side='right'))
+        first = profile.by_address.get(head)
+        last = profile.by_address.get(branch)
+        loops.append({
+            'head': head,
+            'branch': branch,
+            'label': profile.label_of(head),
+            'lines': (first.line_num if first else None, last.line_num if last else None),
+            'iterations': taken,
+            'instructions': int(counts[hi] - counts[lo]),
+            'cycles': int(cycles[hi] - cycles[lo]),
+            'share': (cycles[hi] - cycles[lo]) / total,
+        })
+    loops.sort(key=lambda loop: -loop['cycles'])
+    return loops
+
+
+def format_report(profile: Profile, top: int = 10) -> str:
+    instructions = profile.instructions
+    cycles = profile.total_cycles
+    lines = ["", f"=== Profile: {profile.name} ===",
+             f"{instructions} instructions ({'halted' if profile.halted else 'instruction limit reached'}), "
+             f"~{cycles} cycles, CPI {cycles / instructions if instructions else 0:.2f}, "
+             f"{profile.stall_cycles} stall cycles, {int(profile.misses.sum())} mispredictions"]
+    if profile.outside:
+        lines.append(f"{profile.outside} instructions executed outside the assembled code "
+                     "(data or empty memory)")
+
+    loops = hot_loops(profile)[:top]
+    lines += ["", "Hot loops (body only):",
+              f"{'Head':>5s} {'Branch':>6s}  {'Label':20s} {'Lines':>11s} {'Iter':>9s} "
+              f"{'Instr':>10s} {'Cycles':>10s} {'Share':>6s}"]
+    for loop in loops:
+        first, last = loop['lines']
+        span = f"{first}-{last}" if first and last else "?"
+        lines.append(f"{loop['head']:05X} {loop['branch']:05X}   {loop['label'][:20]:20s} {span:>11s} "
+                     f"{loop['iterations']:9d} {loop['instructions']:10d} {loop['cycles']:10d} "
+                     f"{loop['share'] * 100:5.1f}%")
+    if not loops:
+        lines.append("  (none)")
+
+    hot = sorted(profile.records, key=lambda r: -int(profile.cycles[r.address]))[:top]
+    lines += ["", "Hot instructions:",
+              f"{'Addr':>5s}  {'Label':20s} {'Line':>5s}  {'Instruction':24s} {'Count':>10s} "
+              f"{'Cycles':>10s} {'Stalls':>9s} {'Miss':>8s}"]
+    for instr in hot:
+        addr = instr.address
+        count = int(profile.counts[addr])
+        if not count:
+            break
+        text = f"{instr.mnemonic} {', '.join(instr.operands)}".rstrip()
+        lines.append(f"{addr:05X}  {profile.label_of(addr)[:20]:20s} {instr.line_num:5d}  {text[:24]:24s} "
+                     f"{count:10d} {int(profile.cycles[addr]):10d} {int(profile.cycles[addr]) - count:9d} "
+                     f"{int(profile.misses[addr]):8d}")
+    return "\n".join(lines)
+
+
+def annotated_listing(profile: Profile, source_lines: List[str]) -> str:
+    """The source with count, cycles, stalls and mispredictions in front of every instruction line"""
+    by_line: Dict[int, object] = {}
+    for instr in profile.records:
+        by_line.setdefault(instr.line_num, instr)
+    total = profile.total_cycles or 1
+    header = f"{'Count':>10s} {'Cycles':>10s} {'%':>5s} {'Stalls':>9s} {'Miss':>7s} {'Addr':>5s} | Source"
+    out = [f"; Profile of {profile.name}: {profile.instructions} instructions, "
+           f"~{profile.total_cycles} cycles", header, "-" * len(header)]
+    for line_num, text in enumerate(source_lines, 1):
+        text = text.rstrip('\n')
+        instr = by_line.get(line_num)
+        if instr is None:
+            out.append(f"{'':50s} | {text}")
+            continue
+        addr = instr.address
+        count = int(profile.counts[addr])
+        cycles = int(profile.cycles[addr])
+        if not count:
+            out.append(f"{'.':>10s} {'':39s} {addr:05X} | {text}")
+            continue
+        out.append(f"{count:10d} {cycles:10d} {cycles * 100 / total:5.1f} {cycles - count:9d} "
+                   f"{int(profile.misses[addr]):7d} {addr:05X} | {text}")
+    return "\n".join(out) + "\n"
+
+
+def collapsed_stacks(profile: Profile) -> str:
+    """`frame;frame;frame cycles` lines (Brendan Gregg's collapsed format)"""
+    return "".join(f"{';'.join(path)} {cycles}\n" for path, cycles in sorted(profile.stacks.items()))
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="profiler",
+        description="Per-address execution profile with hot loops, annotated listing and call stacks"
+    )
+    parser.add_argument('input_file', type=str, help='Assembly program to profile')
+    parser.add_argument('--hex', action='store_true',
+                        help='Treat all numbers as Hex (default: detect from the header comment)')
+    parser.add_argument('--in', dest='in_values', type=str, default='',
+                        help='Comma separated values for successive IN instructions')
+    parser.add_argument('--interrupt', type=int, action='append', default=[],
+                        help='Raise the hardware interrupt before instruction N (repeatable)')
+    parser.add_argument('-n', '--max-instructions', type=int, default=10_000_000,
+                        help='Stop after this many instructions (default: 10M)')
+    parser.add_argument('-p', '--predictor', type=str, default=None, metavar='SPEC',
+                        help='Branch predictor for mispredictions, as in branch_predictor.py -c '
+                             '(default: static not taken, like the hardware)')
+    parser.add_argument('--top', type=int, default=10, help='Rows in the hot loop and instruction tables')
+    parser.add_argument('-l', '--listing', type=str, nargs='?', const='',
+                        help='Write the annotated listing (default: <input>.prof.lst)')
+    parser.add_argument('--collapsed', type=str, nargs='?', const='',
+                        help='Write collapsed stacks for flamegraph.pl/speedscope (default: <input>.folded)')
+
+    args = parser.parse_args()
+    try:
+        predictor = parse_config(args.predictor) if args.predictor else STATIC_NOT_TAKEN
+    except (ValueError, TypeError) as exc:
+        parser.error(str(exc))
+
+    path = args.input_file
+    try:
+        hex_mode = True if args.hex else guess_hex_mode(path)
+        assembler = assemble_file(path, hex_mode)
+        with open(path, 'r') as f:
+            source_lines = f.readlines()
+    except (OSError, ValueError) as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    name = os.path.splitext(os.path.basename(path))[0]
+    profile = profile_program(assembler, name, parse_value_list(args.in_values, hex_mode),
+                              args.max_instructions, args.interrupt, predictor)
+    elapsed = time.perf_counter() - start
+    print(format_report(profile, args.top))
+
+    stem = os.path.splitext(path)[0]
+    if args.listing is not None:
+        listing = args.listing or stem + '.prof.lst'
+        with open(listing, 'w') as f:
+            f.write(annotated_listing(profile, source_lines))
+        print(f"\nListing: {listing}")
+    if args.collapsed is not None:
+        collapsed = args.collapsed or stem + '.folded'
+        with open(collapsed, 'w') as f:
+            f.write(collapsed_stacks(profile))
+        print(f"Collapsed stacks: {collapsed}")
+    print(f"\nProfiled in {elapsed:.2f} s (predictor: {predictor.label})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Pipeline-Aware Instruction Scheduler
+Optional pass between the assembler's first and second pass. Reorders
+independent instructions inside each basic block so that no instruction
+reads the register written by the POP right before it (the pipeline has no
+load-use interlock), while keeping register, CCR-flag, memory/stack and
+control-flow dependences. Blocks keep their start address, so labels do not
+move; addresses inside a block are laid out again. A block that a numeric
+address points into (JMP 0x14, .DW 0x10, ...) is not reordered.
+"""
+
+from typing import Dict, List
+from isa_constants import ISA
+from analyzer import analyze_program, block_runs, instruction_effects, numeric_addresses, pinned_runs
+
+
+def dependence_graph(effects: List) -> List[List[int]]:
+    """
+    predecessors[j]: earlier instructions of the block that j must stay
+    after (register RAW/WAR/WAW, flags, memory or stack, I/O, barriers).
+    Flag writers are only ordered with each other where it is observable:
+    the writer a flag reader sees and the block's last writer (whose flags
+    are left at the end of the block) stay after every earlier writer.
+    """
+    pinned = set()
+    last_writer = None
+    for j, fx in enumerate(effects):
+        if fx.flags_read and last_writer is not None:
+            pinned.add(last_writer)
+        if fx.flags_written:
+            last_writer = j
+    pinned.add(last_writer)
+    predecessors: List[List[int]] = []
+    for j, later in enumerate(effects):
+        preds = []
+        for i in range(j):
+            earlier = effects[i]
+            if (earlier.barrier or later.barrier
+                    or earlier.writes & (later.reads | later.writes)
+                    or earlier.reads & later.writes
+                    or (earlier.flags_written and (later.flags_read or (later.flags_written and j in pinned)))
+                    or (earlier.flags_read and later.flags_written)
+                    or (earlier.stack and later.stack)
+                    or (earlier.io and later.io)
+                    or ((earlier.mem_write or later.mem_write)
+                        and (earlier.mem_read or earlier.mem_write)
+                        and (later.mem_read or later.mem_write))):
+                preds.append(i)
+        predecessors.append(preds)
+    return predecessors
+
+
+def schedule_block(assembler, block: List) -> List:
+    """
+    List-schedule one block: at each step take the earliest ready
+    instruction (original order) that does not read the register the POP
+    just placed writes; if every ready instruction does, take the earliest.
+    """
+    if len(block) < 3 or not any(instr.mnemonic == 'POP' for instr in block):
+        return block
+    effects = [instruction_effects(assembler, instr) for instr in block]
+    predecessors = dependence_graph(effects)
+    remaining = [len(preds) for preds in predecessors]
+    successors: List[List[int]] = [[] for _ in block]
+    for j, preds in enumerate(predecessors):
+        for i in preds:
+            successors[i].append(j)
+
+    ready = [j for j, count in enumerate(remaining) if count == 0]
+    order: List[int] = []
+    while ready:
+        ready.sort()
+        pick = ready[0]
+        if order and block[order[-1]].mnemonic == 'POP':
+            stale = effects[order[-1]].writes
+            for candidate in ready:
+                if not effects[candidate].reads & stale:
+                    pick = candidate
+                    break
+        ready.remove(pick)
+        order.append(pick)
+        for j in successors[pick]:
+            remaining[j] -= 1
+            if remaining[j] == 0:
+                ready.append(j)
+    return [block[j] for j in order]
+
+
+def schedule(assembler) -> Dict[str, int]:
+    """Optimizer pass: schedule every basic block, then lay out again"""
+    before = analyze_program(assembler)
+    groups = []
+    reordered = 0
+    runs = block_runs(assembler)
+    pinned = pinned_runs(runs, numeric_addresses(assembler))
+    for index, run in enumerate(runs):
+        start = run[0].address
+        last = run[-1]
+        size = last.address + (1 if last.mnemonic == '.DW' else ISA.INSTRUCTION_SIZES.get(last.mnemonic, 1)) - start
+        if run[0].mnemonic == '.DW' or index in pinned:
+            new_run = run
+        else:
+            new_run = schedule_block(assembler, run)
+        if new_run is not run and any(a is not b for a, b in zip(new_run, run)):
+            reordered += 1
+        groups.append((start, size, new_run))
+    assembler.relayout(groups)
+    after = analyze_program(assembler)
+
+    stats = {
+        'blocks_reordered': reordered,
+        'load_use_before': len(before.load_use),
+        'load_use_after': len(after.load_use),
+        'cycles_before': before.cycles,
+        'cycles_after': after.cycles,
+        'cycles_saved': before.cycles - after.cycles,
+    }
+    code_pinned = sum(1 for index in pinned if runs[index][0].mnemonic != '.DW')
+    if code_pinned:
+        stats['blocks_pinned'] = code_pinned
+    return stats
@@ -0,0 +1,911 @@
+#!/usr/bin/env python3
+"""
+ISA-Level Functional Simulator for 5-Stage Pipelined RISC Processor
+Target: 32-bit Word Addressable Memory (18-bit Address Space)
+Executes assembler output (Instruction list or .mem image) instruction by
+instruction, without modelling the pipeline. Use it for fast regressions;
+use the VHDL simulation (or pipeline.py) when timing matters.
+"""
+
+import os
+import sys
+import time
+from array import array
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from isa_constants import ISA
+
+
+ADDRESS_MASK = ISA.MEMORY_WORDS - 1
+WORD_MASK = 0xFFFFFFFF
+
+# Vector table layout (see memory_stage.vhd MemAddress mux)
+RESET_VECTOR = 0          # PC <- M[0] on reset
+HARDWARE_INT_VECTOR = 1   # PC <- M[1] on external interrupt
+SOFTWARE_INT_BASE = 2     # INT index: PC <- M[index + 2]
+
+# Opcode recorded in branch traces for a hardware interrupt (real opcodes are 0-31);
+# its pc is the instruction that has not executed yet
+TRACE_HW_INTERRUPT = 32
+
+# Block translation
+MAX_BLOCK_INSTRUCTIONS = 64     # Instructions that generate code
+MAX_BLOCK_LENGTH = 4096         # Including NOP/JMP, which are folded away
+THRASH_LIMIT = 4                # Writes into a block before that part of it is only interpreted
+# Simulator._code per word: translated into a cached block, or interpreted only
+CODE_TRANSLATED, CODE_COLD = 1, 2
+_DROP_TRANSLATED = bytes.maketrans(bytes([CODE_TRANSLATED]), b'\x00')
+ALL_FLAGS = frozenset('znc')
+_OP = ISA.OPCODES
+_NAME_BY_OPCODE = {code: name for name, code in _OP.items()}
+_SIZE_BY_OPCODE = [ISA.get_size(_NAME_BY_OPCODE.get(op, 'NOP')) for op in range(32)]
+_FLAG_DEFS = {_OP['ADD']: ALL_FLAGS, _OP['SUB']: ALL_FLAGS, _OP['INC']: ALL_FLAGS,
+              _OP['IADD']: ALL_FLAGS, _OP['AND']: ALL_FLAGS, _OP['NOT']: ALL_FLAGS,
+              _OP['SETC']: frozenset('c')}
+_COND_FLAG = {_OP['JZ']: 'z', _OP['JN']: 'n', _OP['JC']: 'c'}
+_NOP_OPCODES = frozenset([_OP['NOP']] + [op for op in range(32) if op not in _NAME_BY_OPCODE])
+_BLOCK_ENDS = {_OP['RET'], _OP['RTI'], _OP['INT']}
+_STORE_OPS = {_OP['STD'], _OP['PUSH'], _OP['CALL'], _OP['INT']}
+# Neither redirect, store nor halt: a run of these can be interpreted in one go
+_STRAIGHT_OPCODES = frozenset(range(32)) - _STORE_OPS - _BLOCK_ENDS - {
+    _OP['HLT'], _OP['JZ'], _OP['JN'], _OP['JC'], _OP['JMP']}
+
+
+def load_mem_file(path: str) -> List[int]:
+    """Read a .mem image (one 32-bit hex word per line) into a word list"""
+    words = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                words.append(int(line, 16) & WORD_MASK)
+    return words
+
+
+def load_sparse_file(path: str) -> List[Tuple[int, List[int]]]:
+    """
+    Read a sparse .smem image into (start address, words) runs. Each run is
+    an '@AAAAA NNNNN' header (hex) followed by NNNNN hex words, one per line.
+    """
+    runs = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line.startswith('@'):
+                continue
+            address, count = (int(field, 16) for field in line[1:].split())
+            words = [int(next(f), 16) & WORD_MASK for _ in range(count)]
+            runs.append((address, words))
+    return runs
+
+
+def load_raw_file(path: str) -> List[int]:
+    """Read a raw image (little-endian 32-bit words) into a word list"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    words = array('I' if array('I').itemsize == 4 else 'L')
+    words.frombytes(data[:len(data) - len(data) % 4])
+    if sys.byteorder == 'big':
+        words.byteswap()
+    return words.tolist()
+
+
+def guess_hex_mode(path: str) -> bool:
+    """
+    The course test programs announce '# all numbers in hex format' in their
+    header comment and are assembled with --hex; detect that convention.
+    """
+    with open(path, 'r') as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped and stripped[0] not in ';#/':
+                break
+            if 'hex format' in stripped.lower():
+                return True
+    return False
+
+
+def assemble_file(path: str, hex_mode: Optional[bool] = None):
+    """Assemble an .asm file and return the Assembler (raises on errors)"""
+    from assembler import Assembler
+    if hex_mode is None:
+        hex_mode = guess_hex_mode(path)
+    assembler = Assembler(hex_mode=hex_mode)
+    if not assembler.assemble(path):
+        raise ValueError(f"Assembly of '{path}' failed:\n  " +
+                         "\n  ".join(assembler.errors))
+    return assembler
+
+
+def memory_from_instructions(instructions, start_address: int = 0) -> List[int]:
+    """Build a full-size memory image from Assembler.instructions"""
+    memory = [0] * ISA.MEMORY_WORDS
+    for instr in instructions:
+        addr = instr.address + start_address
+        for word in instr.machine_code:
+            memory[addr & ADDRESS_MASK] = word & WORD_MASK
+            addr += 1
+    return memory
+
+
+def load_program(path: str, hex_mode: Optional[bool] = None) -> List[int]:
+    """
+    Load a .asm (assembled on the fly), .smem (sparse), .raw (little-endian
+    binary) or .mem file as a memory image.
+    hex_mode=None auto-detects the test-suite hex convention.
+    """
+    lowered = path.lower()
+    if lowered.endswith('.asm'):
+        return assemble_file(path, hex_mode).memory_image.tolist()
+    memory = [0] * ISA.MEMORY_WORDS
+    if lowered.endswith('.smem'):
+        for address, words in load_sparse_file(path):
+            for word in words:
+                memory[address & ADDRESS_MASK] = word
+                address += 1
+        return memory
+    words = load_raw_file(path) if lowered.endswith('.raw') else load_mem_file(path)
+    words = words[:ISA.MEMORY_WORDS]
+    memory[:len(words)] = words
+    return memory
+
+
+class Simulator:
+    """
+    Architectural model of the ISA.
+    State: R0-R7, CCR (Z, N, C), PC, SP, memory, input/output ports.
+    Semantics follow the VHDL datapath (field usage, SP post-decrement on
+    PUSH / pre-increment on POP, INT pushes FLAGS then PC), except that
+    not-taken conditional jumps leave the CCR unchanged as the ISA specifies
+    (pipeline.py follows the same rule; the RTL writes the ALU flags).
+
+    By default run() executes translated basic blocks (see _translate) and
+    only interprets single instructions near HLT and instruction limits.
+    Code that changes memory directly must call invalidate_blocks().
+    Blocks that keep being overwritten are interpreted instead (THRASH_LIMIT).
+    """
+
+    def __init__(self, memory: Optional[List[int]] = None,
+                 in_port: Optional[Iterable[int]] = None, verbose: bool = False,
+                 translate: bool = True):
+        self.verbose = verbose
+        self.translate = translate
+        self.memory: List[int] = [0] * ISA.MEMORY_WORDS
+        self._blocks: Dict[int, Tuple[Optional[Callable], int]] = {}
+        self._code = bytearray(ISA.MEMORY_WORDS)  # CODE_* per word, 0 = neither
+        self._block_words: Dict[int, frozenset] = {}  # Block start -> words it covers
+        self._invalidations: Dict[int, int] = {}      # Block start -> writes into it so far
+        self._runs: Dict[int, Tuple[int, List[int]]] = {}  # Cold PC -> (run, words scanned)
+        if memory is not None:
+            self.load_words(memory)
+        self.set_input(in_port or [])
+        self.out_port: List[int] = []
+        self.pending_interrupts: List[int] = []  # Instruction counts, sorted
+        # When a list: (pc, opcode, taken, target) appended for every jump,
+        # call, return and interrupt; run() then uses the interpreter loop
+        self.branch_trace: Optional[List[Tuple[int, int, int, int]]] = None
+        self.reset()
+
+    def log(self, message: str):
+        if self.verbose:
+            print(f"[SIMULATOR] {message}")
+
+    # ================= LOADING =================
+
+    def load_words(self, words, start_address: int = 0):
+        """Copy a word list (or {address: word} dict) into memory"""
+        if isinstance(words, dict):
+            for addr, word in words.items():
+                self.memory[(addr + start_address) & ADDRESS_MASK] = word & WORD_MASK
+        else:
+            end = min(start_address + len(words), ISA.MEMORY_WORDS)
+            self.memory[start_address:end] = [w & WORD_MASK for w in words[:end - start_address]]
+        self.invalidate_blocks()
+        self.forget_thrashing()
+
+    def load_instructions(self, instructions, start_address: int = 0):
+        """Load Assembler.instructions (after second_pass) into memory"""
+        for instr in instructions:
+            addr = instr.address + start_address
+            for word in instr.machine_code:
+                self.memory[addr & ADDRESS_MASK] = word & WORD_MASK
+                addr += 1
+        self.invalidate_blocks()
+        self.forget_thrashing()
+
+    def load_mem_file(self, path: str):
+        self.load_words(load_mem_file(path))
+
+    def set_input(self, values: Iterable[int]):
+        """Values returned by successive IN instructions (0 once exhausted)"""
+        self._in_iter = iter(values)
+        self.invalidate_blocks()
+
+    def schedule_interrupt(self, at_instruction: int):
+        """Assert the hardware interrupt before instruction number N executes"""
+        self.pending_interrupts.append(at_instruction)
+        self.pending_interrupts.sort()
+
+    # ================= STATE =================
+
+    def reset(self):
+        self.regs: List[int] = [0] * 8
+        self.z = self.n = self.c = 0
+        self.sp = ISA.INITIAL_SP
+        self.pc = self.memory[RESET_VECTOR] & ADDRESS_MASK
+        self.halted = False
+        self.instructions_executed = 0
+        self.invalidate_blocks()
+        self.log(f"Reset: PC <- M[0] = {self.pc:05X}")
+
+    def invalidate_blocks(self, address: Optional[int] = None):
+        """
+        Drop every translated block (memory or ports changed underneath them).
+        `address` is a code word the program just overwrote: each block
+        covering it is charged, and once one has been charged THRASH_LIMIT
+        times the contiguous stretch of its words around `address` is
+        interpreted from then on (translations stop short of it). Code
+        sharing memory with data or the stack is then not translated again
+        after every write, while code that only jumps there stays translated.
+        """
+        code = self._code
+        if address is not None and code[address] == CODE_COLD:
+            return                  # Interpreted code, see _interpret_cold
+        if self._blocks:
+            if address is not None:
+                counts = self._invalidations
+                for start, words in self._block_words.items():
+                    if address in words:
+                        counts[start] = counts.get(start, 0) + 1
+                        if counts[start] >= THRASH_LIMIT:
+                            for step in (1, -1):
+                                addr = address
+                                while addr in words:
+                                    code[addr] = CODE_COLD
+                                    addr = (addr + step) & ADDRESS_MASK
+            self._blocks.clear()
+            self._block_words.clear()
+            code[:] = code.translate(_DROP_TRANSLATED)
+
+    def forget_thrashing(self):
+        """Translate every word again, e.g. after loading a new program"""
+        self._invalidations.clear()
+        self._runs.clear()
+        self._code[:] = bytes(ISA.MEMORY_WORDS)
+
+    @property
+    def ccr(self) -> int:
+        """Flags packed as in ccr.vhd: [2]=Z, [1]=N, [0]=C"""
+        return (self.z << 2) | (self.n << 1) | self.c
+
+    @ccr.setter
+    def ccr(self, value: int):
+        self.z = (value >> 2) & 1
+        self.n = (value >> 1) & 1
+        self.c = value & 1
+
+    def take_interrupt(self):
+        """Hardware interrupt: push FLAGS, push PC, PC <- M[1]"""
+        mem = self.memory
+        pushed = (self.sp, (self.sp - 1) & ADDRESS_MASK)
+        mem[pushed[0]] = self.ccr
+        mem[pushed[1]] = self.pc
+        self.sp = (self.sp - 2) & ADDRESS_MASK
+        if self.branch_trace is not None:
+            self.branch_trace.append((self.pc, TRACE_HW_INTERRUPT, 1, mem[HARDWARE_INT_VECTOR] & ADDRESS_MASK))
+        self.pc = mem[HARDWARE_INT_VECTOR] & ADDRESS_MASK
+        for addr in pushed:
+            if self._code[addr] == CODE_TRANSLATED:
+                self.invalidate_blocks(addr)
+                break
+        self.log(f"Hardware interrupt -> {self.pc:05X}")
+
+    # ================= EXECUTION =================
+
+    def step(self) -> bool:
+        """Execute a single instruction. Returns False once halted."""
+        self.run(1)
+        return not self.halted
+
+    def run(self, max_instructions: Optional[int] = None) -> int:
+        """
+        Run until HLT or until max_instructions have executed.
+        Returns the number of instructions executed by this call.
+        """
+        executed = 0
+        while not self.halted:
+            limit = None if max_instructions is None else max_instructions - executed
+            if limit is not None and limit <= 0:
+                break
+            # Stop the hot loop at the next scheduled interrupt
+            if self.pending_interrupts:
+                due = self.pending_interrupts[0] - self.instructions_executed
+                if due <= 0:
+                    self.pending_interrupts.pop(0)
+                    self.take_interrupt()
+                    continue
+                limit = due if limit is None else min(limit, due)
+            if self.translate and self.branch_trace is None:
+                executed += self._run_blocks(limit)
+            else:
+                executed += self._execute(limit)
+        return executed
+
+    def _execute(self, limit: Optional[int]) -> int:
+        """Fetch-decode-execute loop over raw words"""
+        mem = self.memory
+        regs = self.regs
+        out_port = self.out_port
+        in_iter = self._in_iter
+        trace = self.branch_trace
+        pc, sp = self.pc, self.sp
+        z, n, c = self.z, self.n, self.c
+        M = WORD_MASK
+        A = ADDRESS_MASK
+        TOP = ISA.INITIAL_SP
+        count = 0
+        budget = limit if limit is not None else -1
+
+        while count != budget:
+            w = mem[pc]
+            op = w >> 27
+            count += 1
+
+            if op <= 11:
+                if op == 9:      # ADD
+                    r = regs[(w >> 21) & 7] + regs[(w >> 18) & 7]
+                    c = r >> 32
+                    r &= M
+                    regs[(w >> 24) & 7] = r
+                    z = 1 if r == 0 else 0
+                    n = r >> 31
+                elif op == 10:   # SUB
+                    a = regs[(w >> 21) & 7]
+                    b = regs[(w >> 18) & 7]
+                    r = (a - b) & M
+                    c = 1 if a < b else 0
+                    regs[(w >> 24) & 7] = r
+                    z = 1 if r == 0 else 0
+                    n = r >> 31
+                elif op == 4:    # INC
+                    r = regs[(w >> 21) & 7] + 1
+                    c = r >> 32
+                    r &= M
+                    regs[(w >> 24) & 7] = r
+                    z = 1 if r == 0 else 0
+                    n = r >> 31
+                elif op == 7:    # MOV
+                    regs[(w >> 24) & 7] = regs[(w >> 21) & 7]
+                elif op == 5:    # OUT
+                    out_port.append(regs[(w >> 21) & 7])
+                elif op == 0:    # NOP
+                    pass
+                elif op == 11:   # AND
+                    r = regs[(w >> 21) & 7] & regs[(w >> 18) & 7]
+                    regs[(w >> 24) & 7] = r
+                    z = 1 if r == 0 else 0
+                    n = r >> 31
+                    c = 0
+                elif op == 3:    # NOT
+                    r = ~regs[(w >> 21) & 7] & M
+                    regs[(w >> 24) & 7] = r
+                    z = 1 if r == 0 else 0
+                    n = r >> 31
+                    c = 0
+                elif op == 6:    # IN
+                    regs[(w >> 24) & 7] = next(in_iter, 0) & M
+                elif op == 8:    # SWAP (R1 <- R3, R3 <- R2)
+                    r3 = (w >> 18) & 7
+                    t = regs[(w >> 21) & 7]
+                    regs[(w >> 24) & 7] = regs[r3]
+                    regs[r3] = t
+                elif op == 2:    # SETC
+                    c = 1
+                else:            # HLT
+                    self.halted = True
+                    break
+                pc = (pc + 1) & A
+                continue
+
+            if op <= 17:
+                if op == 13:     # PUSH
+                    mem[sp] = regs[(w >> 18) & 7]
+                    sp = (sp - 1) & A
+                    pc = (pc + 1) & A
+                    continue
+                if op == 14:     # POP
+                    if sp < TOP:
+                        sp += 1
+                    regs[(w >> 24) & 7] = mem[sp]
+                    pc = (pc + 1) & A
+                    continue
+                imm = mem[(pc + 1) & A]
+                if op == 12:     # IADD
+                    r = regs[(w >> 21) & 7] + imm
+                    c = r >> 32
+                    r &= M
+                    regs[(w >> 24) & 7] = r
+                    z = 1 if r == 0 else 0
+                    n = r >> 31
+                elif op == 15:   # LDM
+                    regs[(w >> 24) & 7] = imm
+                elif op == 16:   # LDD
+                    regs[(w >> 24) & 7] = mem[(regs[(w >> 21) & 7] + imm) & A]
+                else:            # STD
+                    mem[(regs[(w >> 21) & 7] + imm) & A] = regs[(w >> 18) & 7]
+                pc = (pc + 2) & A
+                continue
+
+            if op == 18:         # JZ
+                if trace is not None:
+                    trace.append((pc, op, z, mem[(pc + 1) & A] & A))
+                if z:
+                    z = 0
+                    pc = mem[(pc + 1) & A] & A
+                else:
+                    pc = (pc + 2) & A
+            elif op == 19:       # JN
+                if trace is not None:
+                    trace.append((pc, op, n, mem[(pc + 1) & A] & A))
+                if n:
+                    n = 0
+                    pc = mem[(pc + 1) & A] & A
+                else:
+                    pc = (pc + 2) & A
+            elif op == 20:       # JC
+                if trace is not None:
+                    trace.append((pc, op, c, mem[(pc + 1) & A] & A))
+                if c:
+                    c = 0
+                    pc = mem[(pc + 1) & A] & A
+                else:
+                    pc = (pc + 2) & A
+            elif op == 21:       # JMP
+                if trace is not None:
+                    trace.append((pc, op, 1, mem[(pc + 1) & A] & A))
+                pc = mem[(pc + 1) & A] & A
+            elif op == 22:       # CALL
+                if trace is not None:
+                    trace.append((pc, op, 1, mem[(pc + 1) & A] & A))
+                mem[sp] = (pc + 2) & A
+                sp = (sp - 1) & A
+                pc = mem[(pc + 1) & A] & A
+            elif op == 23:       # RET
+                if sp < TOP:
+                    sp += 1
+                if trace is not None:
+                    trace.append((pc, op, 1, mem[sp] & A))
+                pc = mem[sp] & A
+            elif op == 24:       # INT index
+                mem[sp] = (z << 2) | (n << 1) | c
+                sp = (sp - 1) & A
+                mem[sp] = (pc + 2) & A
+                sp = (sp - 1) & A
+                if trace is not None:
+                    trace.append((pc, op, 1, mem[(mem[(pc + 1) & A] + SOFTWARE_INT_BASE) & A] & A))
+                pc = mem[(mem[(pc + 1) & A] + SOFTWARE_INT_BASE) & A] & A
+            elif op == 25:       # RTI
+                if sp < TOP:
+                    sp += 1
+                if trace is not None:
+                    trace.append((pc, op, 1, mem[sp] & A))
+                pc = mem[sp] & A
+                if sp < TOP:
+                    sp += 1
+                flags = mem[sp]
+                z, n, c = (flags >> 2) & 1, (flags >> 1) & 1, flags & 1
+            else:                # Unused opcodes decode as NOP
+                pc = (pc + 1) & A
+
+        self.pc, self.sp = pc, sp
+        self.z, self.n, self.c = z, n, c
+        self.instructions_executed += count
+        return count
+
+    # ================= BLOCK TRANSLATION =================
+
+    def _run_blocks(self, limit: Optional[int]) -> int:
+        """
+        Execute cached translated blocks. A block only runs when its longest
+        pass fits in the remaining budget; otherwise (and at HLT) a single
+        instruction is interpreted so limits stay exact. New code is only
+        translated while at least MAX_BLOCK_LENGTH instructions remain.
+        """
+        blocks = self._blocks
+        code = self._code
+        budget = limit if limit is not None else sys.maxsize
+        pc, sp = self.pc, self.sp
+        z, n, c = self.z, self.n, self.c
+        count = 0
+        interpreted = 0
+
+        while count < budget:
+            entry = blocks.get(pc)
+            if entry is None:
+                # Close to the limit new code is cheaper to interpret, and
+                # code that keeps being overwritten always is
+                if budget - count >= MAX_BLOCK_LENGTH and code[pc] != CODE_COLD:
+                    entry = blocks[pc] = self._translate(pc)
+                else:
+                    entry = (None, 0)
+            fn, length = entry
+            if fn is None or length > budget - count:
+                self.pc, self.sp = pc, sp
+                self.z, self.n, self.c = z, n, c
+                if code[pc] == CODE_COLD:
+                    done = self._interpret_cold(budget - count)
+                else:
+                    done = self._interpret_one()
+                count += done
+                interpreted += done
+                if self.halted:
+                    break
+                pc, sp = self.pc, self.sp
+                z, n, c = self.z, self.n, self.c
+                continue
+            pc, sp, z, n, c, done = fn(sp, z, n, c, budget - count)
+            count += done
+
+        self.pc, self.sp = pc, sp
+        self.z, self.n, self.c = z, n, c
+        self.instructions_executed += count - interpreted
+        return count
+
+    def _interpret_one(self) -> int:
+        """Interpret the instruction at PC, invalidating blocks it overwrites"""
+        mem, pc, sp = self.memory, self.pc, self.sp
+        w = mem[pc]
+        op = w >> 27
+        written = ()
+        if op == _OP['STD']:
+            written = ((self.regs[(w >> 21) & 7] + mem[(pc + 1) & ADDRESS_MASK]) & ADDRESS_MASK,)
+        elif op in _STORE_OPS:
+            written = (sp, (sp - 1) & ADDRESS_MASK)
+        done = self._execute(1)
+        for addr in written:
+            if self._code[addr] == CODE_TRANSLATED:
+                self.invalidate_blocks(addr)
+                break
+        return done
+
+    def _interpret_cold(self, limit: int) -> int:
+        """
+        Interpret from a PC in code that is no longer translated: the straight
+        run of such words up to the next jump, store or HLT in one _execute
+        call, or else that one instruction through _interpret_one
+        """
+        mem, start = self.memory, self.pc
+        cached = self._runs.get(start)
+        # Code written here is usually written again unchanged, so the run is
+        # kept while the words it was scanned from still match
+        if cached is not None and mem[start:start + len(cached[1])] == cached[1]:
+            run = cached[0]
+        else:
+            code = self._code
+            pc, run = start, 0
+            while (pc < ISA.MEMORY_WORDS and code[pc] == CODE_COLD
+                   and (mem[pc] >> 27) in _STRAIGHT_OPCODES and run < MAX_BLOCK_LENGTH):
+                pc += _SIZE_BY_OPCODE[mem[pc] >> 27]
+                run += 1
+            self._runs[start] = (run, mem[start:pc])
+        return self._execute(min(run, limit)) if run else self._interpret_one()
+
+    def _translate(self, start: int) -> Tuple[Optional[Callable], int]:
+        """
+        Translate the block starting at `start` into a Python function.
+
+        The trace follows fall-through and direct JMP/CALL targets, turns
+        conditional jumps into side exits and ends at RET/RTI/INT, HLT or a
+        revisited address. A trace that returns to `start` becomes a loop.
+        Registers live in locals, fields and immediates are folded into the
+        source, and flags are only computed where a later read can see them.
+        Returns (function, instructions per pass), or (None, 0) at HLT.
+        """
+        mem = self.memory
+        A = ADDRESS_MASK
+        trace = []               # (pc, op, word, immediate, instructions so far)
+        covered = []             # Every word the translation depends on
+        visited = set()
+        closes = False           # Trace falls back into `start`
+        exit_pc = None           # Static exit after the last instruction
+        length = 0
+        pc = start
+        HLT, JMP = _OP['HLT'], _OP['JMP']
+        code = self._code
+        while True:
+            if pc == start and length:
+                closes = True
+                break
+            w = mem[pc]
+            op = w >> 27
+            if (op == HLT or pc in visited or len(trace) >= MAX_BLOCK_INSTRUCTIONS
+                    or length >= MAX_BLOCK_LENGTH or (code[pc] == CODE_COLD and length)):
+                exit_pc = pc
+                break
+            visited.add(pc)
+            covered.append(pc)
+            length += 1
+            if op in _NOP_OPCODES:
+                pc = (pc + 1) & A
+                continue
+            size = _SIZE_BY_OPCODE[op]
+            imm = 0
+            if size == 2:
+                imm = mem[(pc + 1) & A]
+                covered.append((pc + 1) & A)
+            if op == JMP:
+                pc = imm & A
+                continue
+            trace.append((pc, op, w, imm, length))
+            if op in _BLOCK_ENDS:
+                break
+            pc = imm & A if op == _OP['CALL'] else (pc + size) & A
+
+        if not length:
+            return None, 0
+        loops = closes or any(op in _COND_FLAG and (imm & A) == start
+                              for _, op, _, imm, _ in trace)
+
+        # ----- Flag liveness (backwards; loop-backs see live-in of start) -----
+        def liveness(live_at_start):
+            live = live_at_start if closes else ALL_FLAGS
+            live_after = [None] * len(trace)
+            for i in range(len(trace) - 1, -1, -1):
+                _, op, _, imm, _ = trace[i]
+                if op in _BLOCK_ENDS or op in _STORE_OPS:
+                    # Dynamic exits and code-write exits expose every flag
+                    live = ALL_FLAGS
+                live_after[i] = live
+                if op in _COND_FLAG:
+                    taken = live_at_start if (imm & A) == start else ALL_FLAGS
+                    live = live | taken | {_COND_FLAG[op]}
+                elif op in _FLAG_DEFS:
+                    live = live - _FLAG_DEFS[op]
+            return frozenset(live), live_after
+
+        live_in = frozenset()
+        while True:
+            new_live_in, live_after = liveness(live_in)
+            if new_live_in == live_in:
+                break
+            live_in = new_live_in
+
+        # ----- Register usage -----
+        used, written = set(), set()
+        for _, op, w, _, _ in trace:
+            r1, r2, r3 = (w >> 24) & 7, (w >> 21) & 7, (w >> 18) & 7
+            if op in (_OP['ADD'], _OP['SUB'], _OP['AND'], _OP['SWAP']):
+                used.update((r2, r3))
+            elif op in (_OP['NOT'], _OP['INC'], _OP['MOV'], _OP['OUT'], _OP['IADD'], _OP['LDD']):
+                used.add(r2)
+            elif op == _OP['STD']:
+                used.update((r2, r3))
+            elif op == _OP['PUSH']:
+                used.add(r3)
+            if op in (_OP['ADD'], _OP['SUB'], _OP['AND'], _OP['NOT'], _OP['INC'], _OP['MOV'],
+                      _OP['IN'], _OP['POP'], _OP['IADD'], _OP['LDM'], _OP['LDD'], _OP['SWAP']):
+                written.add(r1)
+            if op == _OP['SWAP']:
+                written.add(r3)
+        loaded = sorted(used | written)
+
+        # ----- Code generation -----
+        lines = ["def block(sp, z, n, c, budget, regs=regs, mem=mem, code=code, "
+                 "out=out, inp=inp, invalidate=invalidate, next=next):"]
+        if loaded:
+            lines.append("    " + ", ".join(f"r{r}" for r in loaded) + " = "
+                         + ", ".join(f"regs[{r}]" for r in loaded))
+        lines.append("    k = 0")
+        base = 2 if loops else 1
+
+        def emit(text, depth=0):
+            lines.append("    " * (base + depth) + text)
+
+        def emit_exit(target, executed, depth=0):
+            for r in sorted(written):
+                emit(f"regs[{r}] = r{r}", depth)
+            emit(f"return {target}, sp, z, n, c, k + {executed}", depth)
+
+        def emit_loop_back(executed, depth=0):
+            emit(f"k += {executed}", depth)
+            emit(f"if k + {length} > budget:", depth)
+            emit_exit(start, 0, depth + 1)
+            emit("continue", depth)
+
+        def emit_flags(rd, live):
+            if 'z' in live:
+                emit(f"z = 0 if r{rd} else 1")
+            if 'n' in live:
+                emit(f"n = r{rd} >> 31")
+
+        if loops:
+            lines.append("    while True:")
+        M = f"0x{WORD_MASK:X}"
+        for i, (pc, op, w, imm, done) in enumerate(trace):
+            live = live_after[i]
+            r1, r2, r3 = (w >> 24) & 7, (w >> 21) & 7, (w >> 18) & 7
+            next_pc = (pc + _SIZE_BY_OPCODE[op]) & A
+            if op in (_OP['ADD'], _OP['INC'], _OP['IADD']):
+                b = f"r{r3}" if op == _OP['ADD'] else ("1" if op == _OP['INC'] else f"0x{imm:X}")
+                if 'c' in live:
+                    emit(f"t = r{r2} + {b}")
+                    emit("c = t >> 32")
+                    emit(f"r{r1} = t & {M}")
+                else:
+                    emit(f"r{r1} = (r{r2} + {b}) & {M}")
+                emit_flags(r1, live)
+            elif op == _OP['SUB']:
+                if 'c' in live:
+                    emit(f"c = 1 if r{r2} < r{r3} else 0")
+                emit(f"r{r1} = (r{r2} - r{r3}) & {M}")
+                emit_flags(r1, live)
+            elif op in (_OP['AND'], _OP['NOT']):
+                expr = f"r{r2} & r{r3}" if op == _OP['AND'] else f"r{r2} ^ {M}"
+                emit(f"r{r1} = {expr}")
+                if 'c' in live:
+                    emit("c = 0")
+                emit_flags(r1, live)
+            elif op == _OP['SETC']:
+                if 'c' in live:
+                    emit("c = 1")
+            elif op == _OP['MOV']:
+                emit(f"r{r1} = r{r2}")
+            elif op == _OP['SWAP']:
+                emit(f"r{r1}, r{r3} = r{r3}, r{r2}")
+            elif op == _OP['OUT']:
+                emit(f"out(r{r2})")
+            elif op == _OP['IN']:
+                emit(f"r{r1} = next(inp, 0) & {M}")
+            elif op == _OP['LDM']:
+                emit(f"r{r1} = 0x{imm:X}")
+            elif op == _OP['LDD']:
+                emit(f"r{r1} = mem[(r{r2} + 0x{imm:X}) & 0x{A:X}]")
+            elif op == _OP['POP']:
+                emit(f"if sp < 0x{ISA.INITIAL_SP:X}:")
+                emit("sp += 1", 1)
+                emit(f"r{r1} = mem[sp]")
+            elif op in (_OP['STD'], _OP['PUSH'], _OP['CALL']):
+                if op == _OP['STD']:
+                    emit(f"a = (r{r2} + 0x{imm:X}) & 0x{A:X}")
+                    emit(f"mem[a] = r{r3}")
+                else:
+                    emit("a = sp")
+                    emit(f"mem[a] = r{r3}" if op == _OP['PUSH'] else f"mem[a] = 0x{next_pc:X}")
+                    emit(f"sp = (sp - 1) & 0x{A:X}")
+                # Writing into translated code ends the block right here
+                emit(f"if code[a] == {CODE_TRANSLATED}:")
+                emit("invalidate(a)", 1)
+                emit_exit(imm & A if op == _OP['CALL'] else next_pc, done, 1)
+            elif op in _COND_FLAG:
+                flag = _COND_FLAG[op]
+                emit(f"if {flag}:")
+                emit(f"{flag} = 0", 1)
+                if (imm & A) == start:
+                    emit_loop_back(done, 1)
+                else:
+                    emit_exit(imm & A, done, 1)
+            elif op == _OP['RET']:
+                emit(f"if sp < 0x{ISA.INITIAL_SP:X}:")
+                emit("sp += 1", 1)
+                emit_exit(f"mem[sp] & 0x{A:X}", done)
+            elif op == _OP['RTI']:
+                emit(f"if sp < 0x{ISA.INITIAL_SP:X}:")
+                emit("sp += 1", 1)
+                emit(f"a = mem[sp] & 0x{A:X}")
+                emit(f"if sp < 0x{ISA.INITIAL_SP:X}:")
+                emit("sp += 1", 1)
+                emit("t = mem[sp]")
+                emit("z, n, c = (t >> 2) & 1, (t >> 1) & 1, t & 1")
+                emit_exit("a", done)
+            elif op == _OP['INT']:
+                emit("a = sp")
+                emit(f"b = (sp - 1) & 0x{A:X}")
+                emit("mem[a] = (z << 2) | (n << 1) | c")
+                emit(f"mem[b] = 0x{next_pc:X}")
+                emit(f"sp = (sp - 2) & 0x{A:X}")
+                emit(f"if code[a] == {CODE_TRANSLATED} or code[b] == {CODE_TRANSLATED}:")
+                emit(f"invalidate(a if code[a] == {CODE_TRANSLATED} else b)", 1)
+                emit_exit(f"mem[0x{(imm + SOFTWARE_INT_BASE) & A:X}] & 0x{A:X}", done)
+
+        if closes:
+            emit_loop_back(length)
+        elif exit_pc is not None:
+            emit_exit(exit_pc, length)
+
+        source = "\n".join(lines)
+        namespace = {'regs': self.regs, 'mem': mem, 'code': self._code,
+                     'out': self.out_port.append, 'inp': self._in_iter,
+                     'invalidate': self.invalidate_blocks, 'next': next}
+        exec(compile(source, f"<block {start:05X}>", 'exec'), namespace)
+        for addr in covered:
+            code[addr] = CODE_TRANSLATED
+        self._block_words[start] = frozenset(covered)
+        self.log(f"Translated block {start:05X}: {length} instruction(s)"
+                 f"{' (loop)' if loops else ''}")
+        return namespace['block'], length
+
+    # ================= REPORTING =================
+
+    def print_state(self):
+        print("\n=== Registers ===")
+        for i, value in enumerate(self.regs):
+            print(f"R{i} = {value:08X}")
+        print(f"PC = {self.pc:05X}  SP = {self.sp:05X}  "
+              f"Z={self.z} N={self.n} C={self.c}")
+
+    def print_outputs(self):
+        if self.out_port:
+            print("\n=== Output Port ===")
+            for value in self.out_port:
+                print(f"{value:08X}")
+
+
+def parse_value_list(text: str, hex_mode: bool = False) -> List[int]:
+    """Parse a comma separated list of port values"""
+    base = 16 if hex_mode else 0
+    return [int(v, base) for v in text.split(',') if v.strip()]
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="simulator",
+        description="Functional ISA simulator for the 5-stage pipelined RISC processor"
+    )
+    parser.add_argument('input_file', type=str,
+                        help='Program to run (.asm is assembled first; .smem, .raw or .mem images are loaded)')
+    parser.add_argument('--hex', action='store_true',
+                        help='Treat all numbers as Hex by default (auto-detected for .asm files '
+                             'that say "all numbers in hex format")')
+    parser.add_argument('--in', dest='in_values', type=str, default='',
+                        help='Comma separated values for successive IN instructions')
+    parser.add_argument('--interrupt', type=int, action='append', default=[],
+                        help='Raise the hardware interrupt before instruction N (repeatable)')
+    parser.add_argument('-n', '--max-instructions', type=int, default=10_000_000,
+                        help='Stop after this many instructions (default: 10M)')
+    parser.add_argument('--interpret', action='store_true',
+                        help='Disable block translation (plain fetch-decode-execute loop)')
+    parser.add_argument('--index', type=str, default=None,
+                        help='Address index (assembler.py --index) to show where PC stopped '
+                             '(default: the .idx next to an image input, if any)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Verbose output')
+
+    args = parser.parse_args()
+    try:
+        memory = load_program(args.input_file, True if args.hex else None)
+    except (OSError, ValueError) as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+
+    hex_values = args.hex or (args.input_file.lower().endswith('.asm') and guess_hex_mode(args.input_file))
+    sim = Simulator(memory, parse_value_list(args.in_values, hex_values), verbose=args.verbose,
+                    translate=not args.interpret)
+    for at in args.interrupt:
+        sim.schedule_interrupt(at)
+
+    start = time.perf_counter()
+    executed = sim.run(args.max_instructions)
+    elapsed = time.perf_counter() - start
+
+    sim.print_outputs()
+    sim.print_state()
+    index_file = args.index
+    if index_file is None and not args.input_file.lower().endswith('.asm'):
+        from address_index import index_path
+        index_file = index_path(args.input_file)
+        if not os.path.exists(index_file):
+            index_file = None
+    if index_file:
+        from address_index import AddressIndex
+        try:
+            location = AddressIndex.load(index_file).lookup(sim.pc)
+        except (OSError, ValueError) as exc:
+            location = f"({exc})"
+        print(f"PC {sim.pc:05X} at {location if location is not None else '(not in program)'}")
+    status = "halted" if sim.halted else "instruction limit reached"
+    rate = executed / elapsed if elapsed > 0 else float('inf')
+    print(f"\n[{status.upper()}] {executed} instructions in {elapsed * 1000:.2f} ms "
+          f"({rate / 1e6:.2f} M instr/s)")
+
+
+if __name__ == "__main__":
+    main()
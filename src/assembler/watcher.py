@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Resident Assembler (watch / daemon mode)
+Keeps one process alive with the ISA tables imported and the incremental
+state of every source file in memory, so an edited .asm file is re-emitted
+within milliseconds instead of paying interpreter start-up on every run.
+Files are polled for changes, or requests arrive as JSON lines on an
+owner-only Unix-domain socket; a command (e.g. the simulation script) can
+run after each successful build.
+"""
+
+import os
+import sys
+import json
+import time
+import shlex
+import stat
+import socket
+import threading
+import subprocess
+import socketserver
+from typing import Dict, List, Optional
+from assembler import Assembler
+from simulator import guess_hex_mode
+from io_paths import OUTPUT_EXTENSIONS, collision_errors, expand_patterns, output_path
+
+
+DEFAULT_SOCKET = 'watcher.sock'
+DEFAULT_INTERVAL = 0.05     # Seconds between polls of the watched files
+
+
+class WarmAssembler:
+    """Incremental state per source file, kept between builds"""
+
+    def __init__(self, hex_mode: Optional[bool] = None, verbose: bool = False):
+        self.hex_mode = hex_mode        # None: detect per file
+        self.verbose = verbose
+        self.states: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+
+    def forget(self, path: str):
+        with self.lock:
+            self.states.pop(os.path.abspath(path), None)
+
+    def assemble(self, path: str, output: str, fmt: str = 'mem', start_address: int = 0) -> Dict:
+        """
+        Assemble `path` against its previous state and write `output`.
+        Returns ok, errors, instructions, ms and the incremental stats.
+        """
+        key = os.path.abspath(path)
+        start = time.perf_counter()
+        try:
+            with open(path, 'r') as f:
+                lines = f.readlines()
+            hex_mode = self.hex_mode if self.hex_mode is not None else guess_hex_mode(path)
+        except OSError as exc:
+            return {'ok': False, 'input': path, 'errors': [f"Cannot read '{path}': {exc}"]}
+
+        with self.lock:
+            assembler = Assembler(verbose=self.verbose, hex_mode=hex_mode)
+            try:
+                ok = assembler.assemble_lines_incremental(lines, self.states.get(key, {}))
+                self.states[key] = assembler.incremental_state(lines)
+                if ok:
+                    try:
+                        assembler.generate_output(output, fmt, start_address)
+                    except (OSError, ValueError) as exc:
+                        ok = False
+                        assembler.errors.append(f"Cannot write '{output}': {exc}")
+            except Exception as exc:
+                # Anything else, including an assembler bug on one source, is
+                # that file's error and must not stop the daemon; its state is
+                # dropped so the next save starts clean
+                self.states.pop(key, None)
+                ok = False
+                assembler.errors.append(f"{type(exc).__name__}: {exc}")
+
+        return {
+            'ok': ok,
+            'input': path,
+            'output': output if ok else None,
+            'errors': list(assembler.errors),
+            'instructions': len(assembler.instructions),
+            'ms': round((time.perf_counter() - start) * 1000, 2),
+            'stats': dict(assembler.incremental_stats),
+        }
+
+
+def run_hook(command: str, result: Dict):
+    """Run the --on-success command with {input}/{output} filled in"""
+    cmd = command.format(input=shlex.quote(result['input']), output=shlex.quote(result['output']))
+    completed = subprocess.run(cmd, shell=True)
+    if completed.returncode != 0:
+        print(f"[HOOK] '{cmd}' exited with {completed.returncode}")
+
+
+def report(result: Dict):
+    if result['ok']:
+        stats = result.get('stats', {})
+        layout = "full relayout" if stats.get('relayout') else f"{stats.get('lines_changed', 0)} line(s) changed"
+        print(f"[OK]    {result['input']} -> {result['output']}: {result['instructions']} instructions, "
+              f"{layout}, {result['ms']:.1f} ms")
+    else:
+        print(f"[ERROR] {result['input']}:")
+        for err in result['errors']:
+            print(f"  {err}")
+    sys.stdout.flush()
+
+
+# ===== Watch loop =====
+
+def watch(warm: WarmAssembler, patterns: List[str], fmt: str, start_address: int = 0,
+          output: Optional[str] = None, out_dir: Optional[str] = None,
+          on_success: Optional[str] = None, interval: float = DEFAULT_INTERVAL,
+          once: bool = False):
+    """
+    Poll the files matching `patterns` (re-expanded every round, so new files
+    are picked up) and rebuild each one whose mtime or size changed. Files
+    whose output another watched file also writes are reported, not built.
+    """
+    seen: Dict[str, tuple] = {}
+    while True:
+        files = expand_patterns(patterns)
+        outputs = {path: output_path(path, fmt, output, out_dir) for path in files}
+        refused = collision_errors(list(outputs.items()))
+        for path in files:
+            try:
+                st = os.stat(path)
+            except OSError:
+                if seen.pop(path, None) is not None:
+                    warm.forget(path)
+                continue
+            # Refusal is part of the signature so the file builds once the clash goes
+            signature = (st.st_mtime_ns, st.st_size, path in refused)
+            if seen.get(path) == signature:
+                continue
+            seen[path] = signature
+            if path in refused:
+                report({'ok': False, 'input': path, 'errors': [refused[path]]})
+                continue
+            result = warm.assemble(path, outputs[path], fmt, start_address)
+            report(result)
+            if result['ok'] and on_success:
+                run_hook(on_success, result)
+        for path in [p for p in seen if p not in files]:
+            del seen[path]
+            warm.forget(path)
+        if once:
+            return
+        time.sleep(interval)
+
+
+# ===== Socket server =====
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """
+    One JSON object per line:
+      {"input": "prog.asm", "output": "prog.mem", "format": "mem", "start_address": 0}
+    answered with one JSON result line. {"forget": "prog.asm"} drops that
+    file's state.
+    """
+
+    def handle(self):
+        server = self.server
+        for raw in self.rfile:
+            if not raw.strip():
+                continue
+            try:
+                request = json.loads(raw)
+                if 'forget' in request:
+                    server.warm.forget(request['forget'])
+                    result = {'ok': True}
+                else:
+                    fmt = request.get('format', server.fmt)
+                    if fmt not in OUTPUT_EXTENSIONS:
+                        raise ValueError(f"unknown format '{fmt}'")
+                    path = request['input']
+                    output = output_path(path, fmt, request.get('output'), server.out_dir)
+                    if not server.output_allowed(path, output, fmt):
+                        raise ValueError(f"output '{output}' is outside --out-dir and not "
+                                         f"the output of a watched input")
+                    result = server.warm.assemble(
+                        path, output, fmt, int(request.get('start_address', server.start_address)))
+                    if result['ok'] and server.on_success:
+                        run_hook(server.on_success, result)
+            except (ValueError, KeyError, TypeError) as exc:
+                result = {'ok': False, 'errors': [f"Bad request: {exc}"]}
+            self.wfile.write((json.dumps(result) + "\n").encode())
+            self.wfile.flush()
+
+
+class _BuildServer:
+    """Build settings and the output policy shared by both server flavours"""
+    daemon_threads = True
+
+    def configure(self, warm: WarmAssembler, fmt: str = 'mem', start_address: int = 0,
+                  out_dir: Optional[str] = None, on_success: Optional[str] = None,
+                  patterns: Optional[List[str]] = None, output: Optional[str] = None):
+        self.warm = warm
+        self.fmt = fmt
+        self.start_address = start_address
+        self.out_dir = out_dir
+        self.on_success = on_success
+        self.patterns = patterns or []
+        self.output = output
+
+    def output_allowed(self, path: str, output: str, fmt: str) -> bool:
+        """
+        Requests may only write under --out-dir, or to the file the watcher
+        itself would write for one of the watched inputs.
+        """
+        target = os.path.realpath(output)
+        if self.out_dir:
+            root = os.path.realpath(self.out_dir)
+            if os.path.commonpath([root, target]) == root:
+                return True
+        source = os.path.realpath(path)
+        return any(os.path.realpath(watched) == source and
+                   os.path.realpath(output_path(watched, fmt, self.output, self.out_dir)) == target
+                   for watched in expand_patterns(self.patterns))
+
+
+# Windows builds lack AF_UNIX; main() refuses --serve without --port there
+_UnixStreamServer = getattr(socketserver, 'ThreadingUnixStreamServer', socketserver.ThreadingTCPServer)
+
+
+class AssemblerServer(_BuildServer, _UnixStreamServer):
+    """Listens on a Unix-domain socket that only the owner can connect to"""
+
+    def __init__(self, warm: WarmAssembler, socket_path: str = DEFAULT_SOCKET, **settings):
+        self.configure(warm, **settings)
+        try:
+            if stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+                os.unlink(socket_path)      # Left behind by a previous run
+        except FileNotFoundError:
+            pass
+        # Create the socket file 0600 rather than chmod-ing it after the fact
+        umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, _RequestHandler)
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+class TCPAssemblerServer(_BuildServer, socketserver.ThreadingTCPServer):
+    """127.0.0.1 fallback for platforms without Unix-domain sockets"""
+    allow_reuse_address = True
+
+    def __init__(self, warm: WarmAssembler, port: int, **settings):
+        self.configure(warm, **settings)
+        super().__init__(('127.0.0.1', port), _RequestHandler)
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="watcher",
+        description="Resident assembler: rebuild .asm files on change or on socket requests"
+    )
+    parser.add_argument('inputs', nargs='*',
+                        help='Assembly files or glob patterns to watch (quote globs)')
+    parser.add_argument('-o', '--output', type=str,
+                        help='Output file (single input only)')
+    parser.add_argument('--out-dir', type=str,
+                        help='Directory for outputs (default: next to each source)')
+    parser.add_argument('-f', '--format', type=str,
+                        choices=list(OUTPUT_EXTENSIONS), default='mem', help='Output format')
+    parser.add_argument('--start-address', type=lambda x: int(x, 0), default=0,
+                        help='Starting address')
+    parser.add_argument('--hex', action='store_true',
+                        help='Treat all numbers as Hex (default: detect from the header comment)')
+    parser.add_argument('--on-success', type=str, metavar='CMD',
+                        help='Shell command run after each successful build; '
+                             '{input} and {output} are replaced')
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL,
+                        help=f'Polling interval in seconds (default: {DEFAULT_INTERVAL})')
+    parser.add_argument('--once', action='store_true',
+                        help='Build every input once and exit')
+    parser.add_argument('--serve', action='store_true',
+                        help='Also accept JSON-line requests on an owner-only Unix socket')
+    parser.add_argument('--socket', type=str, default=DEFAULT_SOCKET,
+                        help=f'Socket path for --serve (default: {DEFAULT_SOCKET})')
+    parser.add_argument('--port', type=int,
+                        help='Serve on this 127.0.0.1 TCP port instead of the Unix socket '
+                             '(reachable by every local user)')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Verbose output')
+
+    args = parser.parse_args()
+    if not args.inputs and not args.serve:
+        parser.error("give files to watch and/or --serve")
+    if args.output and len(expand_patterns(args.inputs)) > 1:
+        parser.error("-o needs a single input; use --out-dir")
+    if args.serve and not args.inputs and not args.out_dir:
+        parser.error("--serve without inputs needs --out-dir for the outputs it may write")
+    if args.serve and args.port is None and not hasattr(socket, 'AF_UNIX'):
+        parser.error("Unix sockets are not available here; use --port")
+    if args.out_dir:
+        os.makedirs(args.out_dir, exist_ok=True)
+
+    warm = WarmAssembler(hex_mode=True if args.hex else None, verbose=args.verbose)
+
+    if args.serve:
+        settings = dict(fmt=args.format, start_address=args.start_address, out_dir=args.out_dir,
+                        on_success=args.on_success, patterns=args.inputs, output=args.output)
+        if args.port is not None:
+            server = TCPAssemblerServer(warm, args.port, **settings)
+            print(f"[SERVE] listening on 127.0.0.1:{args.port}")
+        else:
+            server = AssemblerServer(warm, args.socket, **settings)
+            print(f"[SERVE] listening on {args.socket}")
+        if not args.inputs:
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+            server.server_close()
+            return
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        server = None
+
+    if not args.once:
+        print(f"[WATCH] {', '.join(args.inputs)} (Ctrl+C to stop)")
+    try:
+        watch(warm, args.inputs, args.format, args.start_address, args.output,
+              args.out_dir, args.on_success, args.interval, args.once)
+    except KeyboardInterrupt:
+        pass
+    if server is not None:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
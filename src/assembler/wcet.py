@@ -0,0 +1,621 @@
+#!/usr/bin/env python3
+"""
+Interrupt Latency and WCET Analyzer
+Bounds, for an assembled program, how long each interrupt source waits
+before its handler starts and how long every subroutine and handler can run.
+
+Latency is measured on pipeline.PipelineModel rather than estimated: from
+every code record the model is started with an empty pipeline (once with
+all flags clear and once with all set, so each conditional branch is seen
+both ways), and at each of the following cycles a copy of it has the
+hardware interrupt line raised. The cycles until the handler's first
+instruction sits in IF/ID are charged to the instruction in decode when the
+line was sampled, so the maximum over all starts covers every instruction
+boundary together with whatever can be in flight behind it. Copies in
+which the request disappears without the interrupt being taken are
+reported as lost interrupts. Software INT latency is measured the same way
+at each INT site.
+
+WCET is static: the control-flow graph of Assembler.instructions costed
+with analyzer.STALL_COSTS (conditional branches as taken), CALL and INT
+charged with their callee's bound, and loops collapsed innermost first with
+the bound written in the source:
+
+    LOOP:               ; @bound 16
+        ...
+        JZ LOOP
+
+`@bound N` (on the loop header's line, the lines just above it or the
+back-edge branch) means the header runs at most N times per entry into the
+loop. A loop without a bound, recursion or an irreducible loop makes the
+bound unknown and the report says why.
+"""
+
+import copy
+import re
+import sys
+from typing import Dict, List, Optional, Set, Tuple
+
+from isa_constants import ISA
+from analyzer import STALL_COSTS, TAKEN_BRANCH_COSTS, CONDITIONAL_BRANCHES, describe
+from pipeline import PipelineModel, PipelineStats, CTRL_HW_INTERRUPT, DECODE_TABLE
+from simulator import (HARDWARE_INT_VECTOR, RESET_VECTOR, SOFTWARE_INT_BASE,
+                       assemble_file, guess_hex_mode)
+
+
+ADDRESS_MASK = ISA.MEMORY_WORDS - 1
+
+# Cycles after an empty-pipeline start during which the line is raised
+LATENCY_WINDOW = 16
+# A request still not serviced after this many cycles counts as lost
+LATENCY_LIMIT = 64
+# CCR values each start is run with: no conditional branch taken / all taken
+BRANCH_FLAGS = (0b000, 0b111)
+
+BOUND_ANNOTATION = re.compile(r';.*@bound\s+(\d+)', re.IGNORECASE)
+
+_EXITS = frozenset({'RET', 'RTI', 'HLT'})
+
+
+# ================= INTERRUPT LATENCY =================
+
+class LatencyReport:
+    """Worst-case hardware interrupt latency per instruction boundary"""
+
+    def __init__(self, handler: int):
+        self.handler = handler
+        # Instruction address -> worst latency in cycles
+        self.worst: Dict[int, int] = {}
+        # Instruction addresses at which a raised line can be dropped
+        self.lost: Set[int] = set()
+        # Instruction address -> cycles from INT in decode to its handler in IF/ID
+        self.software: Dict[int, int] = {}
+
+    @property
+    def best(self) -> Optional[int]:
+        return min(self.worst.values()) if self.worst else None
+
+    @property
+    def maximum(self) -> Optional[int]:
+        return max(self.worst.values()) if self.worst else None
+
+
+def _fork(model: PipelineModel) -> PipelineModel:
+    """Independent copy of the pipeline registers (memory is shared)"""
+    fork = copy.copy(model)
+    fork.regs = list(model.regs)
+    fork.out_port = []
+    fork.stats = PipelineStats()
+    fork.interrupt_cycles = frozenset()
+    return fork
+
+
+def _service_latency(model: PipelineModel) -> Optional[int]:
+    """
+    Raise the line on a copy of `model` (as if sampled at the last edge) and
+    count cycles until the handler's first instruction is in IF/ID; None
+    when the request is dropped or not serviced within LATENCY_LIMIT.
+    """
+    fork = _fork(model)
+    fork.pending_hw_interrupt = 1
+    entered = False
+    for cycles in range(1, LATENCY_LIMIT):
+        fork.cycle()
+        if fork.idex_ctrl is CTRL_HW_INTERRUPT:
+            entered = True
+        elif entered:
+            if fork.ifid_valid and fork.ifid_pc == fork.memory[HARDWARE_INT_VECTOR] & ADDRESS_MASK:
+                return cycles + 1
+        elif not (fork.pending_hw_interrupt or fork.ifid_take_int):
+            return None
+    return None
+
+
+def _decode_boundary(model: PipelineModel) -> Optional[int]:
+    """Address of the instruction occupying decode (its second cycle included)"""
+    idex = model.idex_ctrl
+    if idex.is_swap or idex.require_imm:
+        return model.idex_pc
+    if model.ifid_valid:
+        return model.ifid_pc
+    return None
+
+
+def _software_latency(model: PipelineModel, site: int) -> Optional[int]:
+    """Cycles from the INT at `site` entering decode to its handler in IF/ID"""
+    decoded = None
+    for cycles in range(LATENCY_WINDOW + LATENCY_LIMIT):
+        if model.ifid_valid and decoded is None and model.ifid_pc == site:
+            decoded = cycles
+        elif decoded is not None and model.ifid_valid:
+            index = model.memory[(site + 1) & ADDRESS_MASK]
+            if model.ifid_pc == model.memory[(index + SOFTWARE_INT_BASE) & ADDRESS_MASK] & ADDRESS_MASK:
+                return cycles - decoded
+        if model.halted:
+            break
+        model.cycle()
+    return None
+
+
+def interrupt_latency(assembler) -> LatencyReport:
+    """Measure every code record as a start point (see module docstring)"""
+    model = PipelineModel(assembler.memory_image.tolist())
+    pristine = list(model.memory)
+    report = LatencyReport(model.memory[HARDWARE_INT_VECTOR] & ADDRESS_MASK)
+    worst = report.worst
+    starts = [instr.address for instr in assembler.instructions if instr.mnemonic != '.DW']
+
+    for address in starts:
+        for ccr in BRANCH_FLAGS:
+            model.memory[:] = pristine
+            model.reset()
+            model.reset_pending = 0
+            model.pc = address
+            model.ccr = ccr
+            boundary = None
+            for _ in range(LATENCY_WINDOW):
+                current = _decode_boundary(model)
+                if current is not None:
+                    boundary = current
+                if model.ifid_valid and DECODE_TABLE[model.ifid_instr >> 27].is_hlt:
+                    break
+                if boundary is not None:
+                    latency = _service_latency(model)
+                    if latency is None:
+                        report.lost.add(boundary)
+                    elif latency > worst.get(boundary, 0):
+                        worst[boundary] = latency
+                model.cycle()
+
+    for instr in assembler.instructions:
+        if instr.mnemonic == 'INT':
+            model.memory[:] = pristine
+            model.reset()
+            model.reset_pending = 0
+            model.pc = instr.address
+            report.software[instr.address] = _software_latency(model, instr.address)
+    model.memory[:] = pristine
+    return report
+
+
+# ================= WCET =================
+
+class Wcet:
+    """Execution time bound of one subroutine or handler"""
+
+    def __init__(self, name: str, entry: int):
+        self.name = name
+        self.entry = entry
+        self.cycles: Optional[int] = None
+        self.reason = ''
+        # (header record, bound) of every loop in the routine itself
+        self.loops: List[Tuple[object, int]] = []
+        self.callees: Set[int] = set()
+
+    @property
+    def bounded(self) -> bool:
+        return self.cycles is not None
+
+
+def instruction_cycles(mnemonic: str) -> int:
+    """Worst-case cycles of one instruction, callee excluded"""
+    stall = STALL_COSTS.get(mnemonic, {})
+    if mnemonic in CONDITIONAL_BRANCHES:
+        return 1 + max(sum(stall.values()), sum(TAKEN_BRANCH_COSTS.values()))
+    return 1 + sum(stall.values())
+
+
+def loop_bounds(assembler, source_lines: List[str]) -> Dict[int, int]:
+    """
+    `@bound N` annotations by the address of the record they apply to: the
+    record on that line or, for a comment or label line, the next record.
+    """
+    by_line = {}
+    for instr in assembler.instructions:
+        by_line.setdefault(instr.line_num, instr.address)
+    bounds: Dict[int, int] = {}
+    pending = None
+    for line_num, text in enumerate(source_lines, 1):
+        match = BOUND_ANNOTATION.search(text)
+        if match:
+            pending = int(match.group(1))
+        if pending is not None and line_num in by_line:
+            bounds[by_line[line_num]] = pending
+            pending = None
+    return bounds
+
+
+class WcetAnalyzer:
+    """Per-entry WCET over the program's control-flow graph"""
+
+    def __init__(self, assembler, source_lines: List[str]):
+        self.assembler = assembler
+        self.records = {instr.address: instr for instr in assembler.instructions
+                        if instr.mnemonic != '.DW'}
+        self.bounds = loop_bounds(assembler, source_lines)
+        self.names: Dict[int, str] = {}
+        for name, addr in sorted(assembler.symbol_table.items()):
+            self.names.setdefault(addr, name)
+        self.results: Dict[int, Wcet] = {}
+        self._active: List[int] = []
+
+    def name(self, address: int) -> str:
+        return self.names.get(address, f"{address:05X}")
+
+    def target(self, instr) -> Optional[int]:
+        operand = instr.operands[0] if instr.operands else None
+        if operand is None:
+            return None
+        if operand in self.assembler.symbol_table:
+            return self.assembler.symbol_table[operand]
+        try:
+            return self.assembler.parse_number(operand)
+        except ValueError:
+            return None
+
+    def callee(self, instr) -> Optional[int]:
+        """Routine entered by CALL or INT"""
+        if instr.mnemonic == 'CALL':
+            return self.target(instr)
+        index = self.target(instr)
+        if index is None:
+            return None
+        return vector(self.assembler, (index + SOFTWARE_INT_BASE) & ADDRESS_MASK)
+
+    def successors(self, instr) -> List[int]:
+        mnemonic = instr.mnemonic
+        if mnemonic in _EXITS:
+            return []
+        if mnemonic == 'JMP':
+            return [self.target(instr)]
+        following = instr.address + ISA.INSTRUCTION_SIZES.get(mnemonic, 1)
+        if mnemonic in CONDITIONAL_BRANCHES:
+            return [following, self.target(instr)]
+        return [following]
+
+    # ---------- Graph ----------
+
+    def analyze(self, entry: int, name: Optional[str] = None) -> Wcet:
+        """Bound of the routine starting at `entry` (memoized)"""
+        if entry in self.results:
+            return self.results[entry]
+        result = Wcet(name or self.name(entry), entry)
+        if entry in self._active:
+            result.reason = f"recursive call to {result.name}"
+            return result
+        self._active.append(entry)
+        try:
+            self._analyze(result)
+        finally:
+            self._active.pop()
+        self.results[entry] = result
+        return result
+
+    def _analyze(self, result: Wcet):
+        records = self.records
+        if result.entry not in records:
+            result.reason = f"{result.entry:05X} is not code"
+            return
+
+        # Reachable records, their cost and successors
+        cost: Dict[int, int] = {}
+        succ: Dict[int, List[int]] = {}
+        terminal: Set[int] = set()
+        stack = [result.entry]
+        while stack:
+            address = stack.pop()
+            if address in cost:
+                continue
+            instr = records[address]
+            cycles = instruction_cycles(instr.mnemonic)
+            if instr.mnemonic in ('CALL', 'INT'):
+                callee = self.callee(instr)
+                if callee is None:
+                    result.reason = f"line {instr.line_num}: {instr.mnemonic} target unknown"
+                    return
+                result.callees.add(callee)
+                inner = self.analyze(callee)
+                if not inner.bounded:
+                    result.reason = f"line {instr.line_num}: calls {inner.name} ({inner.reason})"
+                    return
+                cycles += inner.cycles
+            cost[address] = cycles
+            succ[address] = []
+            for target in self.successors(instr):
+                if target is None:
+                    result.reason = f"line {instr.line_num}: unresolved {instr.mnemonic} target"
+                    return
+                if target not in records:
+                    result.reason = f"line {instr.line_num}: runs into non-code at {target:05X}"
+                    return
+                succ[address].append(target)
+                stack.append(target)
+            if not succ[address]:
+                terminal.add(address)
+
+        # Natural loops by header, innermost (smallest body) first
+        original = {node: list(targets) for node, targets in succ.items()}
+        bodies: Dict[int, Set[int]] = {}
+        for latch, header in self._back_edges(result.entry, succ):
+            body = bodies.setdefault(header, {header})
+            pending = [latch]
+            while pending:
+                node = pending.pop()
+                if node not in body:
+                    body.add(node)
+                    pending.extend(p for p, targets in original.items() if node in targets)
+        rep: Dict[int, int] = {}
+
+        def find(node: int) -> int:
+            while node in rep:
+                node = rep[node]
+            return node
+
+        for header, body in sorted(bodies.items(), key=lambda item: len(item[1])):
+            instr = records[header]
+            for node in body - {header}:
+                if any(node in targets and p not in body for p, targets in original.items()):
+                    result.reason = f"line {instr.line_num}: loop at {self.name(header)} has a second entry"
+                    return
+            bound = self.bounds.get(header)
+            if bound is None:
+                for node in body:
+                    if header in original[node]:
+                        bound = self.bounds.get(node, bound)
+            if bound is None or bound < 1:
+                result.reason = f"line {instr.line_num}: loop at {self.name(header)} has no @bound"
+                return
+
+            members = {find(node) for node in body}
+            inner_succ = {node: [t for t in succ[node] if t in members and t != header] for node in members}
+            dist = self._longest(header, inner_succ, cost)
+            if dist is None:
+                result.reason = f"line {instr.line_num}: loop at {self.name(header)} is not reducible"
+                return
+            iteration = max((dist[node] for node in members
+                             if node in dist and header in succ[node]), default=0)
+            leaving = [dist[node] for node in members if node in dist and (node in terminal or any(t not in members for t in succ[node]))]
+            if not leaving:
+                result.reason = f"line {instr.line_num}: loop at {self.name(header)} never exits"
+                return
+            result.loops.append((instr, bound))
+
+            cost[header] = (bound - 1) * iteration + max(leaving)
+            succ[header] = sorted({t for node in members for t in succ[node] if t not in members})
+            if any(node in terminal for node in members):
+                terminal.add(header)
+            for node in members - {header}:
+                rep[node] = header
+                del cost[node], succ[node]
+                terminal.discard(node)
+            for node in succ:
+                succ[node] = sorted({find(t) for t in succ[node]})
+
+        dist = self._longest(result.entry, succ, cost)
+        if dist is None:
+            result.reason = "control flow is not reducible"
+            return
+        ends = [dist[node] for node in terminal if node in dist]
+        if not ends:
+            result.reason = "never returns"
+            return
+        result.cycles = max(ends)
+        result.loops.sort(key=lambda loop: loop[0].address)
+
+    @staticmethod
+    def _back_edges(entry: int, succ: Dict[int, List[int]]) -> List[Tuple[int, int]]:
+        """Edges to a node still on the DFS path (iterative DFS)"""
+        edges = []
+        on_path: Set[int] = {entry}
+        seen: Set[int] = {entry}
+        stack = [(entry, iter(succ[entry]))]
+        while stack:
+            node, targets = stack[-1]
+            for target in targets:
+                if target in on_path:
+                    edges.append((node, target))
+                elif target not in seen:
+                    seen.add(target)
+                    on_path.add(target)
+                    stack.append((target, iter(succ[target])))
+                    break
+            else:
+                stack.pop()
+                on_path.discard(node)
+        return edges
+
+    @staticmethod
+    def _longest(start: int, succ: Dict[int, List[int]], cost: Dict[int, int]) -> Optional[Dict[int, int]]:
+        """Costliest path from `start` to every reachable node, both ends included; None on a cycle"""
+        reach = {start}
+        stack = [start]
+        while stack:
+            for target in succ[stack.pop()]:
+                if target not in reach:
+                    reach.add(target)
+                    stack.append(target)
+        indegree = {node: 0 for node in reach}
+        for node in reach:
+            for target in succ[node]:
+                indegree[target] += 1
+        dist = {start: cost[start]}
+        ready = [node for node, count in indegree.items() if count == 0]
+        ordered = 0
+        while ready:
+            node = ready.pop()
+            ordered += 1
+            for target in succ[node]:
+                if node in dist:
+                    dist[target] = max(dist.get(target, 0), dist[node] + cost[target])
+                indegree[target] -= 1
+                if not indegree[target]:
+                    ready.append(target)
+        return dist if ordered == len(reach) else None
+
+
+def vector(assembler, address: int) -> Optional[int]:
+    """Handler a vector table word points to, None if the program leaves it unset"""
+    if not any(instr.address == address and instr.mnemonic == '.DW' for instr in assembler.instructions):
+        return None
+    return int(assembler.memory_image[address]) & ADDRESS_MASK
+
+
+def interrupt_sources(assembler) -> List[Tuple[str, Optional[int]]]:
+    """(source, handler address or None): the hardware line and every INT index used"""
+    sources = [('hardware', vector(assembler, HARDWARE_INT_VECTOR))]
+    used = set()
+    for instr in assembler.instructions:
+        if instr.mnemonic == 'INT' and instr.operands:
+            try:
+                used.add(assembler.parse_number(instr.operands[0]))
+            except ValueError:
+                continue
+    for index in sorted(used):
+        sources.append((f"INT {index}", vector(assembler, (index + SOFTWARE_INT_BASE) & ADDRESS_MASK)))
+    return sources
+
+
+def analyze_timing(assembler, source_lines: List[str]) -> Tuple[LatencyReport, WcetAnalyzer]:
+    """Latency report plus WCET of every CALL target, handler and the reset entry"""
+    latency = interrupt_latency(assembler)
+    wcet = WcetAnalyzer(assembler, source_lines)
+    for _, handler in interrupt_sources(assembler):
+        if handler is not None:
+            wcet.analyze(handler)
+    for instr in assembler.instructions:
+        if instr.mnemonic == 'CALL':
+            target = wcet.target(instr)
+            if target is not None:
+                wcet.analyze(target)
+    reset = vector(assembler, RESET_VECTOR)
+    if reset is not None:
+        wcet.analyze(reset, 'RESET')
+    return latency, wcet
+
+
+# ================= REPORT =================
+
+def _where(records: Dict[int, object], address: int) -> str:
+    instr = records.get(address)
+    return describe(instr) if instr is not None else f"{address:05X}"
+
+
+def format_report(assembler, latency: LatencyReport, wcet: WcetAnalyzer, top: int = 10) -> str:
+    records = wcet.records
+    lines = ["", "=== Interrupt Latency and WCET ==="]
+
+    lines.append("\nInterrupt sources (latency: line sampled / INT decoded -> handler in IF/ID):")
+    for source, handler in interrupt_sources(assembler):
+        if handler is None:
+            run = "vector not set"
+        else:
+            bound = wcet.analyze(handler)
+            run = f"WCET {bound.cycles} cycles" if bound.bounded else f"WCET unbounded: {bound.reason}"
+        if source == 'hardware':
+            if latency.maximum is None:
+                response = "no boundary measured"
+            else:
+                response = f"worst {latency.maximum} cycles (best {latency.best})"
+                if latency.lost:
+                    response += f", LOST at {len(latency.lost)} boundaries"
+        else:
+            index = int(source.split()[1])
+            sites = [cycles for address, cycles in latency.software.items()
+                     if assembler.parse_number(records[address].operands[0]) == index]
+            measured = [c for c in sites if c is not None]
+            response = f"{max(measured)} cycles" if measured else "not measured"
+        handler_name = wcet.name(handler) if handler is not None else '-'
+        lines.append(f"  {source:10s} -> {handler_name:16s} response {response}; handler {run}")
+
+    if latency.lost:
+        lines.append(f"\nBoundaries where a raised line is dropped ({len(latency.lost)}):")
+        for address in sorted(latency.lost):
+            lines.append(f"  {_where(records, address)}")
+
+    base = latency.best
+    slow = sorted((a for a, c in latency.worst.items() if c > base),
+                  key=lambda a: (-latency.worst[a], a)) if base is not None else []
+    lines.append(f"\nSlowest boundaries (base latency {base} cycles; {len(slow)} above it):")
+    for address in slow[:top]:
+        lines.append(f"  {latency.worst[address]:4d} +{latency.worst[address] - base:<3d}"
+                     f" {_where(records, address)}")
+
+    lines.append("\nWCET per routine (cycles, conditional branches taken, callees included):")
+    for entry, result in sorted(wcet.results.items()):
+        cycles = f"{result.cycles:8d}" if result.bounded else f"{'-':>8s}"
+        lines.append(f"  {entry:05X}  {result.name:16s} {cycles}  {result.reason}".rstrip())
+        for instr, bound in result.loops:
+            lines.append(f"         loop at line {instr.line_num} ({wcet.name(instr.address)}): @bound {bound}")
+    return "\n".join(lines)
+
+
+def check_deadlines(latency: LatencyReport, wcet: WcetAnalyzer, deadlines: Dict[str, int],
+                    max_latency: Optional[int]) -> List[str]:
+    """Violations of --deadline / --max-latency (an unknown bound is a violation)"""
+    violations = []
+    if max_latency is not None:
+        if latency.lost:
+            violations.append(f"hardware interrupt can be lost at {len(latency.lost)} boundaries")
+        if latency.maximum is not None and latency.maximum > max_latency:
+            violations.append(f"hardware interrupt latency {latency.maximum} > {max_latency} cycles")
+    symbols = wcet.assembler.symbol_table
+    for name, limit in deadlines.items():
+        if name not in symbols:
+            violations.append(f"{name}: no such label")
+            continue
+        result = wcet.analyze(symbols[name], name)
+        if not result.bounded:
+            violations.append(f"{name}: unbounded ({result.reason})")
+        elif result.cycles > limit:
+            violations.append(f"{name}: WCET {result.cycles} > {limit} cycles")
+    return violations
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog="wcet",
+        description="Worst-case interrupt latency per source and WCET per CALL target / handler"
+    )
+    parser.add_argument('input_file', type=str, help='Assembly program to analyze')
+    parser.add_argument('--hex', action='store_true',
+                        help='Treat all numbers as Hex (default: detect from the header comment)')
+    parser.add_argument('--top', type=int, default=10, help='Rows in the slowest boundary table')
+    parser.add_argument('--deadline', type=str, action='append', default=[], metavar='LABEL=CYCLES',
+                        help='Fail unless the routine at LABEL is bounded by CYCLES (repeatable)')
+    parser.add_argument('--max-latency', type=int, default=None, metavar='CYCLES',
+                        help='Fail if the hardware interrupt can wait longer or be lost')
+
+    args = parser.parse_args()
+    deadlines = {}
+    for spec in args.deadline:
+        name, _, limit = spec.partition('=')
+        if not limit.isdigit():
+            parser.error(f"--deadline expects LABEL=CYCLES, got '{spec}'")
+        deadlines[name] = int(limit)
+
+    path = args.input_file
+    try:
+        hex_mode = True if args.hex else guess_hex_mode(path)
+        assembler = assemble_file(path, hex_mode)
+        with open(path, 'r') as f:
+            source_lines = f.readlines()
+    except (OSError, ValueError) as exc:
+        print(f"ERROR: {exc}")
+        sys.exit(1)
+
+    latency, wcet = analyze_timing(assembler, source_lines)
+    print(format_report(assembler, latency, wcet, args.top))
+
+    violations = check_deadlines(latency, wcet, deadlines, args.max_latency)
+    if deadlines or args.max_latency is not None:
+        print()
+        for violation in violations:
+            print(f"DEADLINE MISSED: {violation}")
+        if not violations:
+            print("All deadlines met")
+    sys.exit(1 if violations else 0)
+
+
+if __name__ == "__main__":
+    main()